@@ -0,0 +1,145 @@
+# src/core/analysis_runner.py
+
+import contextlib
+import io
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import pandas as pd
+from config import PLOT_CONFIG
+from plot_reduce import reduce_chart_call, reduce_figure, reducing
+
+@dataclass
+class AnalysisResult:
+    """Outcome of one execution of generated analysis code"""
+    code: str
+    value: Any = None
+    outputs: List[dict] = field(default_factory=list)  # recorded `st.*` calls, replayed by the UI
+    figures: List[bytes] = field(default_factory=list)  # PNG renderings of the figures the code created
+    timings: Dict[str, float] = field(default_factory=dict)
+    transfer: Dict[str, Any] = field(default_factory=dict)  # rows and bytes fetched for the analysis, set by AnalysisService
+    reductions: List[str] = field(default_factory=list)  # plots reduced to the point budget before rendering
+
+
+class StreamlitRecorder:
+    def __init__(self):
+        """
+        Stand-in for the `st` module inside generated code. Display calls
+        are recorded instead of rendered, so the code runs once and the UI
+        replays the calls afterwards.
+        """
+        self.outputs: List[dict] = []
+
+    def pyplot(self, fig=None, *args, **kwargs):
+        if fig is None:
+            import matplotlib.pyplot as plt
+            fig = plt.gcf()
+        self.outputs.append({"call": "pyplot", "args": (fig,) + args, "kwargs": kwargs})
+
+    def columns(self, spec, *args, **kwargs):
+        count = spec if isinstance(spec, int) else len(spec)
+        return [self] * count
+
+    def tabs(self, labels, *args, **kwargs):
+        return [self] * len(labels)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def record(*args, **kwargs):
+            self.outputs.append({"call": name, "args": args, "kwargs": kwargs})
+            return self  # supports `with st.expander(...)` and chained containers
+
+        return record
+
+
+def figure_to_png(fig) -> bytes:
+    """Render a matplotlib figure to PNG bytes"""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    return buffer.getvalue()
+
+
+def run_analysis_code(code: str, df: pd.DataFrame, variables: Optional[Dict[str, Any]] = None) -> AnalysisResult:
+    """
+    Execute generated analysis code once, capturing its result and display calls
+
+    Args:
+        code (str): Python code that reads `df` and assigns `result`
+        df (pd.DataFrame): Data to analyze
+        variables (Optional[Dict[str, Any]]): More names defined for the code
+
+    Returns:
+        AnalysisResult: `result` value, recorded `st` calls, figures and timings.
+            Figures are rendered to PNG (`st.pyplot` calls become `st.image`)
+            and closed, so the result is self-contained and picklable. Plots
+            over PLOT_CONFIG["max_points"] are reduced first (see plot_reduce)
+            and followed by an `st.caption` saying so.
+
+    Raises:
+        Exception: Whatever the generated code raises
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    recorder = StreamlitRecorder()
+    namespace = {"__builtins__": __builtins__, "pd": pd, "df": df, "st": recorder}
+    namespace.update(variables or {})
+    figures_before = set(plt.get_fignums())
+
+    rendered = {}
+    reductions = []
+
+    def render(fig) -> bytes:
+        # Reduce before drawing: rendering is where millions of points cost seconds
+        if id(fig) not in rendered:
+            notes = call_notes.get(id(fig), []) + (reduce_figure(fig) if PLOT_CONFIG["enabled"] else [])
+            reductions.extend(notes)
+            rendered[id(fig)] = (figure_to_png(fig), notes)
+        return rendered[id(fig)][0]
+
+    try:
+        started = time.perf_counter()
+        with (reducing() if PLOT_CONFIG["enabled"] else contextlib.nullcontext({})) as call_notes:
+            exec(code, namespace)
+        exec_seconds = time.perf_counter() - started
+
+        outputs = []
+        for output in recorder.outputs:
+            notes = []
+            if output["call"] == "pyplot":
+                fig = output["args"][0]
+                output = {"call": "image", "args": (render(fig),), "kwargs": {}}
+                notes = rendered[id(fig)][1]
+            elif PLOT_CONFIG["enabled"]:
+                note = reduce_chart_call(output)
+                if note:
+                    reductions.append(note)
+                    notes = [note]
+            outputs.append(output)
+            if notes:
+                outputs.append({"call": "caption", "args": (f"Reduced for display: {'; '.join(notes)}.",), "kwargs": {}})
+
+        new_figures = [plt.figure(number) for number in plt.get_fignums() if number not in figures_before]
+        figures = [render(fig) for fig in new_figures]
+    finally:
+        for number in plt.get_fignums():
+            if number not in figures_before:
+                plt.close(number)
+
+    return AnalysisResult(
+        code=code,
+        value=namespace.get("result"),
+        outputs=outputs,
+        figures=figures,
+        timings={"exec_seconds": exec_seconds},
+        reductions=reductions,
+    )
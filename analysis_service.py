@@ -1,16 +1,139 @@
 # src/services/analysis_service.py
 
+import asyncio
+import time
 import pandas as pd
 from typing import Optional, Tuple
 from model import get_model_instance
 from prompts import get_analysis_prompt
 from helpers import extract_python_code
-import os
+from analysis_runner import AnalysisResult, run_analysis_code
+from config import SANDBOX_CONFIG
+from pushdown import column_kinds, plan_pushdown
+from sandbox import SharedFrame, get_sandbox_pool
+from tracing import span
+
+class _AnalysisInputs:
+    def __init__(self, data: pd.DataFrame, db_manager, sandboxed: bool):
+        """
+        The data generated code runs on. A preview (`data.attrs["preview"]`,
+        see SQLService) stands in for a larger result: aggregations in the code
+        run as second-stage queries over it, any other code fetches the full
+        result once.
+
+        Args:
+            data (pd.DataFrame): Query result or preview
+            db_manager (Optional[DatabaseManager]): Runs second stages and full fetches
+            sandboxed (bool): Run code in the sandbox pool
+        """
+        self.data = data
+        self.db_manager = db_manager
+        self.sandboxed = sandboxed
+        self.preview = data.attrs.get("preview") if db_manager is not None else None
+        self._full = None if self.preview else data
+        self._full_frame = None
+
+    def run(self, code: str) -> AnalysisResult:
+        """
+        Run analysis code, pushed down if it compiles to SQL
+
+        Returns:
+            AnalysisResult: With `transfer` describing the mode ("pushdown" or
+                "pandas"), the rows and bytes fetched for the analysis including
+                the preview, the second-stage queries, or why there were none
+        """
+        fetched = self.data.attrs.get("bytes_fetched", 0) if self.preview else 0
+        reason = None
+        if self.preview:
+            plan, reason = plan_pushdown(code, self.preview["query"], column_kinds(self.data))
+            if plan is not None:
+                result, frames, reason = self._run_pushdown(plan)
+                if result is not None:
+                    result.code = code
+                    result.transfer = {
+                        "mode": "pushdown",
+                        "operations": plan.operations,
+                        "queries": plan.queries,
+                        "rows_fetched": sum(len(frame) for frame in frames),
+                        "bytes_fetched": fetched + sum(frame.attrs.get("bytes_fetched", 0) for frame in frames),
+                    }
+                    return result
+
+        full = self.full()
+        result = self._exec(code, full, shared=True)
+        result.transfer = {
+            "mode": "pandas",
+            "rows_fetched": len(full),
+            "bytes_fetched": fetched + full.attrs.get("bytes_fetched", 0),
+        }
+        if reason:
+            result.transfer["reason"] = reason
+        return result
+
+    def _run_pushdown(self, plan) -> Tuple[Optional[AnalysisResult], list, Optional[str]]:
+        """Run the second stages and the rewritten code: (result, aggregates, None), or (None, [], reason) to fall back"""
+        with span("analysis.pushdown", queries=len(plan.queries)) as stage:
+            frames = []
+            for query in plan.queries:
+                frame, error = self.db_manager.execute_query(query)
+                if frame is None:
+                    stage.fail(error)
+                    return None, [], f"second stage failed: {error}"
+                frames.append(frame)
+            try:
+                result = self._exec(plan.code, self.data.iloc[:0], variables={"_pushdown_frames": frames})
+            except Exception as e:
+                # Errors of the code itself surface from the pandas run over the full result
+                stage.fail(str(e))
+                return None, [], f"rewritten code failed: {str(e)}"
+            return result, frames, None
+
+    def full(self) -> pd.DataFrame:
+        """The full result, fetched on first use when the data is a preview"""
+        if self._full is None:
+            df, error = self.db_manager.execute_query(self.preview["query"])
+            if df is None:
+                raise RuntimeError(error)
+            self._full = df
+        return self._full
+
+    def _exec(self, code: str, data: pd.DataFrame, shared: bool = False, variables: Optional[dict] = None) -> AnalysisResult:
+        """Run code over `data`; `shared` keeps the full result's segment for later attempts"""
+        if not self.sandboxed:
+            return run_analysis_code(code, data, variables)
+        if shared:
+            if self._full_frame is None:
+                self._full_frame = SharedFrame(data)
+            return get_sandbox_pool().run(code, self._full_frame, variables)
+        with SharedFrame(data) as frame:
+            return get_sandbox_pool().run(code, frame, variables)
+
+    def close(self):
+        """Release the shared memory of the full result"""
+        if self._full_frame is not None:
+            self._full_frame.close()
+            self._full_frame = None
+
 
 class AnalysisService:
-    def __init__(self):
-        """Initialize AnalysisService"""
-        self.model = get_model_instance()
+    def __init__(self, model=None, db_manager=None):
+        """
+        Initialize AnalysisService
+
+        Args:
+            model (Optional[LLMModel]): Model to use, the shared instance if None
+            db_manager (Optional[DatabaseManager]): Pushes aggregations over previews
+                down to PostgreSQL; without it, data is analyzed as given
+        """
+        self._model = model
+        self.db_manager = db_manager
+
+    @property
+    def model(self):
+        """LLM, resolved on first use so creating the service does not wait for model warm-up"""
+        if self._model is None:
+            self._model = get_model_instance()
+        return self._model
 
     def generate_analysis(
         self,
@@ -18,7 +141,7 @@ class AnalysisService:
         data: pd.DataFrame,
         previous_code: Optional[str] = None,
         error_message: Optional[str] = None
-    ) -> Tuple[Optional[str], Optional[str]]:
+    ) -> Tuple[Optional[AnalysisResult], Optional[str]]:
         """
         Generate and execute data analysis code
         
@@ -29,48 +152,119 @@ class AnalysisService:
             error_message (Optional[str]): Previous error message
             
         Returns:
-            Tuple[Optional[str], Optional[str]]:
-                - Generated Python code if successful, None if failed
+            Tuple[Optional[AnalysisResult], Optional[str]]:
+                - Result of the single successful execution (code, value, recorded
+                  display calls, figures, timings, transfer) if successful, None if failed
                 - Error message if failed, None if successful
         """
         max_attempts = 3
-        attempts = 0
-        
-        # Save data temporarily for analysis
-        temp_csv_path = "temp_analysis_data.csv"
-        data.to_csv(temp_csv_path, index=False)
-        
-        try:
-            while attempts < max_attempts:
-                # Generate prompt
-                prompt = get_analysis_prompt(
-                    user_query,
-                    data.head().to_string(),
-                    previous_code,
-                    error_message
+        with span("analysis.generate", rows=len(data), sandboxed=SANDBOX_CONFIG["enabled"]) as current:
+            # Publish the data once; every attempt reads the same shared segment
+            inputs = _AnalysisInputs(data, self.db_manager, SANDBOX_CONFIG["enabled"])
+            try:
+                result, error = self._generate_with_retries(
+                    user_query, data, inputs, previous_code, error_message, max_attempts
                 )
-                
-                # Get response from model
-                python_response = self.model.generate_response(prompt)
-                code = extract_python_code(python_response)
-                
-                try:
-                    # Create a local namespace for execution
-                    local_namespace = {'pd': pd}
-                    
-                    # Execute the code
-                    exec(code, {}, local_namespace)
-                    
-                    return code, None
-                    
-                except Exception as e:
-                    error_message = f"Error executing code: {str(e)}"
-                    previous_code = code
-                    attempts += 1
+            finally:
+                inputs.close()
+            if error:
+                current.fail(error)
+                current.set(retries=max_attempts - 1)
+            else:
+                current.set(
+                    retries=result.timings["attempts"] - 1,
+                    transfer_mode=result.transfer.get("mode"),
+                    plot_reductions=len(result.reductions),
+                )
+            return result, error
+
+    def _generate_with_retries(
+        self,
+        user_query: str,
+        data: pd.DataFrame,
+        inputs: _AnalysisInputs,
+        previous_code: Optional[str],
+        error_message: Optional[str],
+        max_attempts: int
+    ) -> Tuple[Optional[AnalysisResult], Optional[str]]:
+        """Generation loop of generate_analysis"""
+        attempts = 0
+        generation_seconds = 0.0
+
+        while attempts < max_attempts:
+            # Generate prompt
+            prompt = get_analysis_prompt(
+                user_query,
+                data.head().to_string(),
+                previous_code,
+                error_message
+            )
             
-            return None, f"Failed after {max_attempts} attempts. Last error: {error_message}"
+            # Get response from model
+            started = time.perf_counter()
+            python_response = self.model.generate_response(prompt)
+            generation_seconds += time.perf_counter() - started
+            code = extract_python_code(python_response)
             
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_csv_path):
-                os.remove(temp_csv_path)
+            try:
+                # Execute the code once; the UI replays the captured result
+                with span("analysis.exec", attempt=attempts + 1, sandboxed=inputs.sandboxed):
+                    result = inputs.run(code)
+                result.timings["generation_seconds"] = generation_seconds
+                result.timings["attempts"] = attempts + 1
+                return result, None
+                
+            except Exception as e:
+                error_message = f"Error executing code: {str(e)}"
+                previous_code = code
+                attempts += 1
+        
+        return None, f"Failed after {max_attempts} attempts. Last error: {error_message}"
+
+    async def agenerate_analysis(
+        self,
+        user_query: str,
+        data: pd.DataFrame,
+        max_attempts: int = 3
+    ) -> Tuple[Optional[AnalysisResult], Optional[str]]:
+        """
+        Async variant of generate_analysis for the async API. The LLM call is
+        awaited; the code runs in a worker thread (the sandbox enforces its
+        own wall timeout, a cancelled request only stops waiting for it).
+
+        Args:
+            user_query (str): User's natural language query
+            data (pd.DataFrame): Data to analyze
+            max_attempts (int): Generations before giving up
+
+        Returns:
+            Tuple[Optional[AnalysisResult], Optional[str]]: As generate_analysis
+        """
+        with span("analysis.generate", rows=len(data), sandboxed=SANDBOX_CONFIG["enabled"], asynchronous=True) as current:
+            inputs = _AnalysisInputs(data, self.db_manager, SANDBOX_CONFIG["enabled"])
+            previous_code = error_message = None
+            generation_seconds = 0.0
+            try:
+                for attempt in range(max_attempts):
+                    prompt = get_analysis_prompt(user_query, data.head().to_string(), previous_code, error_message)
+                    started = time.perf_counter()
+                    python_response = await self.model.agenerate_response(prompt)
+                    generation_seconds += time.perf_counter() - started
+                    code = extract_python_code(python_response)
+                    try:
+                        with span("analysis.exec", attempt=attempt + 1, sandboxed=inputs.sandboxed):
+                            result = await asyncio.to_thread(inputs.run, code)
+                    except Exception as e:
+                        error_message = f"Error executing code: {str(e)}"
+                        previous_code = code
+                        continue
+                    result.timings["generation_seconds"] = generation_seconds
+                    result.timings["attempts"] = attempt + 1
+                    current.set(retries=attempt, transfer_mode=result.transfer.get("mode"), plot_reductions=len(result.reductions))
+                    return result, None
+            finally:
+                inputs.close()
+            error = f"Failed after {max_attempts} attempts. Last error: {error_message}"
+            current.fail(error)
+            current.set(retries=max_attempts - 1)
+            return None, error
@@ -1,15 +1,21 @@
 # src/app.py
 
 import streamlit as st
-import pandas as pd
 from dotenv import load_dotenv
-from database import DatabaseManager
-from sql_service import SQLService
-from analysis_service import AnalysisService
+from config import PUSHDOWN_CONFIG, STARTUP_CONFIG, STREAM_CONFIG
+from model import model_ready, warm_up_model
+from tracing import span, start_metrics_server
 
 # Load environment variables
 load_dotenv()
 
+# Table picker entry that lets the schema index choose tables per question
+ALL_TABLES = "All tables (auto-select)"
+
+# Heavy modules (pandas, pyarrow, psycopg2, LLM SDKs) are imported by the
+# services; they load in the warm-up thread while the first page renders
+SERVICE_MODULES = ("database", "sql_service", "analysis_service")
+
 def init_session_state():
     """Initialize session state variables"""
     if 'db_manager' not in st.session_state:
@@ -20,17 +26,31 @@ def init_session_state():
         st.session_state.analysis_service = None
     if 'selected_table' not in st.session_state:
         st.session_state.selected_table = None
+    if 'sampled_result' not in st.session_state:
+        st.session_state.sampled_result = None
+    if 'session_id' not in st.session_state:
+        import uuid
+        st.session_state.session_id = uuid.uuid4().hex  # owns this session's frames in the FrameStore
 
 def setup_services(connection_string):
     """Set up database and analysis services for PostgreSQL"""
     try:
-        from model import get_model_instance
-        get_model_instance()
+        from database import DatabaseManager
+        from sql_service import SQLService
+        from analysis_service import AnalysisService
 
+        # The model keeps loading in the background while the database connects;
+        # without warm-up it is built on the first question instead
+        warm_up = warm_up_model(SERVICE_MODULES) if STARTUP_CONFIG["warm_up"] else None
         db_manager = DatabaseManager(connection_string)
+        if warm_up is not None and not warm_up.is_alive() and not model_ready():
+            from model import get_model_instance
+            get_model_instance()  # warm-up failed: retry here so the error is shown
+
         st.session_state.db_manager = db_manager
-        st.session_state.sql_service = SQLService(db_manager)
-        st.session_state.analysis_service = AnalysisService()
+        preview_rows = PUSHDOWN_CONFIG["preview_rows"] if PUSHDOWN_CONFIG["enabled"] else None
+        st.session_state.sql_service = SQLService(db_manager, preview_rows=preview_rows)
+        st.session_state.analysis_service = AnalysisService(db_manager=db_manager)
         return True
     except Exception as e:
         st.error(f"Error setting up services: {type(e).__name__}: {str(e)}")
@@ -40,7 +60,10 @@ def setup_services(connection_string):
 
 def main():
     st.title("PostgreSQL Data Analysis Copilot 🤖")
-    
+    if STARTUP_CONFIG["warm_up"]:
+        warm_up_model(SERVICE_MODULES)  # starts once per process
+    start_metrics_server()  # Prometheus /metrics, once per process
+
     init_session_state()
     
     st.sidebar.header("PostgreSQL Database Connection")
@@ -58,13 +81,38 @@ def main():
                 st.stop()
 
         if st.session_state.db_manager:
+            with st.sidebar.expander("Connection Pool"):
+                st.json(st.session_state.db_manager.pool_stats())
+            with st.sidebar.expander("Result Cache"):
+                st.json(st.session_state.db_manager.result_cache_stats())
+            if st.session_state.db_manager.query_advisor is not None:
+                with st.sidebar.expander("Query Advisor"):
+                    st.json(st.session_state.db_manager.advisor_stats())
+            with st.sidebar.expander("Session Frames"):
+                from frames import get_frame_store
+                st.json(get_frame_store().stats(st.session_state.session_id))
+            if st.session_state.sql_service:
+                with st.sidebar.expander("SQL Cache"):
+                    st.json(st.session_state.sql_service.cache_stats())
+                with st.sidebar.expander("Local SQL Repair"):
+                    st.json(st.session_state.sql_service.repair_stats())
+                with st.sidebar.expander("Prompt Size"):
+                    st.json(st.session_state.sql_service.prompt_stats())
+                model_stats = st.session_state.sql_service.model.stats() if model_ready() else None
+                if model_stats:
+                    with st.sidebar.expander("Local Model"):
+                        st.json(model_stats)
+
             tables = st.session_state.db_manager.list_tables()
             if tables:
                 st.session_state.selected_table = st.sidebar.selectbox(
-                    "Select Table", tables, key=f"table_select_{conn_string}"
+                    "Select Table", [ALL_TABLES] + tables, key=f"table_select_{conn_string}"
                 )
                 
-                if st.session_state.selected_table:
+                if st.session_state.selected_table == ALL_TABLES:
+                    st.sidebar.caption(f"{len(tables)} tables; the relevant ones are picked for each question.")
+                    display_analysis_interface(None)
+                elif st.session_state.selected_table:
                     table_schema = st.session_state.db_manager.get_table_schema(st.session_state.selected_table)
                     if table_schema:
                         st.sidebar.text("Table Schema:")
@@ -80,65 +128,210 @@ def main():
         st.sidebar.info("Please enter your PostgreSQL connection string.")
 
 def display_analysis_interface(table_schema):
-    """Display the analysis interface"""
+    """Display the analysis interface; a None schema selects tables per question"""
     st.header("Ask Your Question")
     user_query = st.text_area("What would you like to analyze?", 
                             placeholder="e.g., Show me the average income by city")
     st.caption("Note: The AI tries its best, but generated SQL and analysis may require verification.")
+    follow_up = st.checkbox(
+        "Follow-up mode: answer from the previous result when possible",
+        help="Filters, sorts, top-N, column selections and grouped aggregates run on the last result "
+             "without a new query; anything else goes to PostgreSQL with the conversation as context.",
+    )
 
     if st.button("Analyze"):
         if user_query:
-            if not st.session_state.sql_service or not st.session_state.analysis_service:
-                st.error("Services not initialized. Please check connection and setup.")
+            run_analysis(user_query, table_schema, follow_up)
+        else:
+            st.warning("Please enter a question to analyze.")
+
+    # Offer the exact (unsampled) run of the last sampled query
+    sampled_result = st.session_state.get("sampled_result")
+    if sampled_result and st.button("Re-run exactly, without sampling"):
+        with st.spinner("Running the exact query..."):
+            df, error = st.session_state.db_manager.execute_query(sampled_result["sql_query"])
+        if error:
+            st.error(error)
+        else:
+            from followup import start_lineage
+            st.session_state.sampled_result = None
+            start_lineage(df, sampled_result["user_query"], sampled_result["sql_query"])
+            display_results(sampled_result["user_query"], df, sampled_result["sql_query"])
+
+def run_analysis(user_query, table_schema, follow_up=False):
+    """
+    Answer one question: generate and run SQL, then analyze the result. Traced as one "request".
+    In follow-up mode the question is first tried against the previous result.
+    """
+    with span("request", mode="auto" if table_schema is None else "table") as request:
+        if not st.session_state.sql_service or not st.session_state.analysis_service:
+            st.error("Services not initialized. Please check connection and setup.")
+            st.stop()
+
+        from followup import answer_follow_up, contextual_question, conversation_question, lineage_of, start_lineage
+        st.session_state.sampled_result = None
+        sql_question = question = user_query
+        previous = None
+        if follow_up:
+            from frames import get_frame_store
+            previous = get_frame_store().get(st.session_state.session_id, "result")
+        if previous is not None and lineage_of(previous) is not None:
+            lineage = lineage_of(previous)
+            question = conversation_question(user_query, lineage)
+            with span("followup.plan") as stage:
+                answer, reason = answer_follow_up(user_query, previous)
+                stage.set(path="local" if answer else "sql", reason=reason)
+            request.set(follow_up="local" if answer else "sql")
+            if answer is not None:
+                st.info(f"Answered from the previous result, no SQL was run: {'; '.join(answer.operations)}.")
+                with st.expander("Follow-up operations (pandas)"):
+                    st.code(answer.code, language="python")
+                display_results(question, answer.frame, lineage["sql"])
+                return
+            st.info(f"Running a new query: {reason}.")
+            sql_question = contextual_question(user_query, lineage)
+
+        if table_schema is None:
+            selection = st.session_state.db_manager.select_schema(sql_question)
+            if not selection or not selection["tables"]:
+                st.error("Could not find tables relevant to the question.")
                 st.stop()
+            table_schema = selection["schema"]
+            with st.expander(f"Tables used: {', '.join(selection['tables'])}"):
+                st.code(table_schema, language="sql")
 
-            with st.spinner("Generating SQL query..."):
-                df, sql_query, error = st.session_state.sql_service.generate_sql_query(
-                    user_query, table_schema
-                )
-                
-                if error:
-                    st.error(error)
-                else:
-                    st.subheader("SQL Query")
-                    st.code(sql_query, language="sql")
-                    
-                    st.subheader("Retrieved Data Sample")
-                    st.dataframe(df.head())
-                    
-                    if df is None or df.empty:
-                        st.warning("No data retrieved from SQL query. Cannot perform analysis.")
-                        st.stop()
-
-                    with st.spinner("Generating analysis..."):
-                        if st.session_state.analysis_service:
-                            analysis_code, analysis_error = st.session_state.analysis_service.generate_analysis(
-                                user_query, df
-                            )
-                        else:
-                            analysis_code, analysis_error = None, "Analysis service not available."
-
-                        if analysis_error:
-                            st.error(analysis_error)
-                        else:
-                            st.subheader("Analysis Code")
-                            st.code(analysis_code, language="python")
-                            
-                            try:
-                                local_namespace = {'pd': pd, 'df': df, 'st': st}
-                                exec(analysis_code, {}, local_namespace)
-                                result = local_namespace.get('result')
-                                
-                                st.subheader("Analysis Result")
-                                if isinstance(result, pd.DataFrame):
-                                    st.dataframe(result)
-                                else:
-                                    st.write(result)
-                                    
-                            except Exception as e:
-                                st.error(f"Error executing or displaying analysis results: {str(e)}")
+        with st.spinner("Generating SQL query..."):
+            sql_preview = st.empty()
+            preview = st.empty()
+            progress = st.empty()
+
+            def show_sql(text):
+                # Show the query as the model writes it
+                sql_preview.code(text, language="sql")
+
+            def show_batch(batch, stream):
+                # Render the first batch right away while the rest keeps loading
+                if stream.batches == 1:
+                    preview.dataframe(batch.head(STREAM_CONFIG["preview_rows"]))
+                progress.caption(f"Loaded {stream.rows_fetched:,} rows...")
+
+            df, sql_query, error = st.session_state.sql_service.generate_sql_query(
+                sql_question, table_schema, on_batch=show_batch, on_sql_text=show_sql
+            )
+            sql_preview.empty()
+            preview.empty()
+            progress.empty()
+
+            if error:
+                st.error(error)
+            else:
+                if df.attrs.get("sampled"):
+                    st.session_state.sampled_result = {"user_query": question, "sql_query": sql_query}
+                start_lineage(df, question, sql_query)
+                display_results(question, df, sql_query)
+
+def display_results(user_query, df, sql_query):
+    """Display the SQL query, the retrieved data and the generated analysis"""
+    st.subheader("SQL Query")
+    st.code(sql_query, language="sql")
+    lineage = df.attrs.get("lineage")
+    if lineage and lineage["steps"]:
+        operations = [operation for step in lineage["steps"] for operation in step["operations"]]
+        st.caption(f"Then applied to the cached result: {' → '.join(operations)}.")
+    if df.attrs.get("sql_cache_hit"):
+        st.caption("Served from the SQL cache, no LLM call was needed.")
+    elif df.attrs.get("llm_seconds") is not None:
+        st.caption(
+            f"LLM: first token after {df.attrs['llm_ttfb_seconds']:.2f}s, "
+            f"{df.attrs['llm_seconds']:.2f}s of generation in total, "
+            f"{df.attrs.get('prompt_tokens', 0):,} prompt tokens."
+        )
+    if df.attrs.get("local_repairs"):
+        st.caption(f"Repaired without the LLM: {'; '.join(df.attrs['local_repairs'])}.")
+    for warning in df.attrs.get("plan_warnings", []):
+        st.warning(f"Planner estimate: {warning}")
+    sample = df.attrs.get("sampled")
+    if sample:
+        if sample["percent"] is not None:
+            how = f"with {sample['method']} (~{sample['percent']:.4g}% of rows)"
         else:
-            st.warning("Please enter a question to analyze.")
+            how = f"limited to its first {sample['rows']:,} rows"
+        st.info(
+            f"Sampled result: the planner estimated {sample['estimated_rows']:,.0f} rows, so the query ran "
+            f"{how}. Analyses are based on the sample."
+        )
+        with st.expander("Executed (sampled) query"):
+            st.code(sample["query"], language="sql")
+    view = df.attrs.get("materialized_view")
+    if view:
+        before = f" instead of {view['baseline_seconds']:.2f}s" if view.get("baseline_seconds") else ""
+        st.caption(f"Read from materialized view {view['view']} in {view['seconds']:.2f}s{before}.")
+    
+    # The session keeps its latest result; the store spills it to disk when over budget
+    from frames import get_frame_store
+    get_frame_store().put(st.session_state.session_id, "result", df)
+
+    st.subheader("Retrieved Data Sample")
+    st.dataframe(df.head())
+    if df.attrs.get("preview"):
+        st.caption(
+            f"Loaded the first {df.attrs['preview']['rows']:,} rows. Aggregations run in PostgreSQL; "
+            f"other analyses load the full result."
+        )
+    if df.attrs.get("truncated"):
+        st.warning(
+            f"Result was cut off after {df.attrs['rows_fetched']:,} rows "
+            f"to stay within the configured row/memory budget."
+        )
+    
+    if df is None or df.empty:
+        st.warning("No data retrieved from SQL query. Cannot perform analysis.")
+        st.stop()
+
+    with st.spinner("Generating analysis..."):
+        if st.session_state.analysis_service:
+            analysis, analysis_error = st.session_state.analysis_service.generate_analysis(
+                user_query, df
+            )
+        else:
+            analysis, analysis_error = None, "Analysis service not available."
+
+        if analysis_error:
+            st.error(analysis_error)
+        else:
+            st.subheader("Analysis Code")
+            st.code(analysis.code, language="python")
+            display_analysis_result(analysis)
+
+def display_analysis_result(analysis):
+    """Render an AnalysisResult: replay its recorded display calls, then show its value"""
+    try:
+        for output in analysis.outputs:
+            getattr(st, output["call"])(*output["args"], **output["kwargs"])
+
+        st.subheader("Analysis Result")
+        import pandas as pd
+        if isinstance(analysis.value, pd.DataFrame):
+            st.dataframe(analysis.value)
+        else:
+            st.write(analysis.value)
+        st.caption(f"Analysis executed in {analysis.timings['exec_seconds']:.2f}s.")
+        transfer = analysis.transfer
+        if transfer.get("mode") == "pushdown":
+            st.caption(
+                f"Pushed down to PostgreSQL: fetched {transfer['rows_fetched']:,} aggregated rows, "
+                f"{transfer['bytes_fetched'] / 1024:,.1f} KiB including the preview."
+            )
+            with st.expander("Second-stage SQL"):
+                for query in transfer["queries"]:
+                    st.code(query, language="sql")
+        elif transfer.get("reason"):
+            st.caption(
+                f"Analyzed in pandas ({transfer['reason']}): fetched {transfer['rows_fetched']:,} rows, "
+                f"{transfer['bytes_fetched'] / 1024:,.1f} KiB."
+            )
+    except Exception as e:
+        st.error(f"Error displaying analysis results: {str(e)}")
     
 if __name__ == "__main__":
     main()
@@ -0,0 +1,146 @@
+# src/core/async_database.py
+
+import asyncio
+from typing import Optional, Tuple
+import pandas as pd
+from config import POOL_CONFIG, STREAM_CONFIG
+from tracing import span
+
+class AsyncDatabaseManager:
+    def __init__(
+        self,
+        connection_string: str,
+        min_size: int = POOL_CONFIG["min_size"],
+        max_size: int = POOL_CONFIG["max_size"],
+        statement_timeout_ms: int = POOL_CONFIG["statement_timeout_ms"],
+    ):
+        """
+        Query execution over asyncpg, for the async API. Cancelling the task
+        awaiting a query cancels the statement on the server.
+
+        Args:
+            connection_string (str): PostgreSQL connection string
+            min_size (int): Connections opened by start()
+            max_size (int): Upper bound on concurrent statements
+            statement_timeout_ms (int): statement_timeout of every connection
+        """
+        self.connection_string = connection_string
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_timeout_ms = statement_timeout_ms
+        self.pool = None
+        self._counters = {"queries": 0, "errors": 0, "cancelled": 0, "truncated": 0}
+
+    async def start(self):
+        """
+        Open the connection pool
+
+        Raises:
+            ConnectionError: If the database cannot be reached
+        """
+        import asyncpg  # only the async API needs it
+        try:
+            self.pool = await asyncpg.create_pool(
+                self.connection_string,
+                min_size=self.min_size,
+                max_size=self.max_size,
+                server_settings={"statement_timeout": str(self.statement_timeout_ms)},
+            )
+        except Exception as e:
+            raise ConnectionError(f"Failed to connect to PostgreSQL database: {str(e)}")
+
+    async def close(self):
+        """Close the connection pool"""
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def _fetch(self, query: str, batch_rows: int, max_rows: Optional[int], max_bytes: Optional[int]) -> pd.DataFrame:
+        """Fetch a result in batches through a read-only cursor, within the row and byte budget"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction(readonly=True):
+                statement = await conn.prepare(query)
+                columns = [attribute.name for attribute in statement.get_attributes()]
+                cursor = await statement.cursor()
+                batches = []
+                rows_fetched = bytes_fetched = 0
+                truncated = False
+                while True:
+                    fetch_size = batch_rows if max_rows is None else min(batch_rows, max_rows - rows_fetched)
+                    records = await cursor.fetch(fetch_size) if fetch_size > 0 else []
+                    if not records:
+                        break
+                    batch = pd.DataFrame.from_records([tuple(record) for record in records], columns=columns, coerce_float=True)
+                    batches.append(batch)
+                    rows_fetched += len(batch)
+                    bytes_fetched += int(batch.memory_usage(deep=True).sum())
+                    over_rows = max_rows is not None and rows_fetched >= max_rows
+                    over_bytes = max_bytes is not None and bytes_fetched >= max_bytes
+                    if over_rows or over_bytes:
+                        # Only report truncation if the result really had more rows
+                        truncated = await cursor.fetchrow() is not None
+                        break
+
+        if not batches:
+            df = pd.DataFrame(columns=columns)
+        else:
+            df = batches[0] if len(batches) == 1 else pd.concat(batches, ignore_index=True)
+        df.attrs["truncated"] = truncated
+        df.attrs["rows_fetched"] = rows_fetched
+        df.attrs["bytes_fetched"] = bytes_fetched
+        df.attrs["transport"] = "asyncpg"
+        return df
+
+    async def execute_query(
+        self,
+        query: str,
+        batch_rows: int = STREAM_CONFIG["batch_rows"],
+        max_rows: Optional[int] = STREAM_CONFIG["max_rows"],
+        max_bytes: Optional[int] = STREAM_CONFIG["max_bytes"],
+    ) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+        """
+        Execute an SQL query and return results as a DataFrame
+
+        Args:
+            query (str): SQL query to execute
+            batch_rows (int): Rows fetched per round trip
+            max_rows (Optional[int]): Stop after this many rows, None for no limit
+            max_bytes (Optional[int]): Stop once batches use this much memory, None for no limit
+
+        Returns:
+            Tuple[Optional[pd.DataFrame], Optional[str]]:
+                - DataFrame with results if successful, None if failed, with the
+                  same attrs as DatabaseManager.execute_query
+                - Error message if failed, None if successful
+
+        Raises:
+            asyncio.CancelledError: If the awaiting task was cancelled; the
+                statement has been cancelled on the server
+        """
+        self._counters["queries"] += 1
+        with span("db.execute_query", transport="asyncpg") as current:
+            try:
+                df = await self._fetch(query.strip().rstrip(";"), batch_rows, max_rows, max_bytes)
+            except asyncio.CancelledError:
+                self._counters["cancelled"] += 1
+                raise
+            except Exception as e:
+                self._counters["errors"] += 1
+                current.fail(str(e))
+                return None, f"Error executing query: {str(e)}"
+            if df.attrs["truncated"]:
+                self._counters["truncated"] += 1
+            current.set(
+                rows=len(df),
+                bytes_fetched=df.attrs["bytes_fetched"],
+                truncated=df.attrs["truncated"],
+            )
+            return df, None
+
+    def stats(self) -> dict:
+        """Return query counters and pool usage"""
+        snapshot = dict(self._counters)
+        if self.pool is not None:
+            snapshot["pool_size"] = self.pool.get_size()
+            snapshot["pool_idle"] = self.pool.get_idle_size()
+        return snapshot
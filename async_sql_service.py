@@ -0,0 +1,154 @@
+# src/services/async_sql_service.py
+
+import asyncio
+import time
+from typing import Optional, Tuple
+import pandas as pd
+from async_database import AsyncDatabaseManager
+from database import DatabaseManager
+from prompts import get_sql_prompt
+from sampling import plan_sample
+from sql_service import SQLService
+from config import SAMPLING_CONFIG
+from helpers import clean_sql_response, complete_sql_statement, validate_sql_syntax
+from tracing import current_span, span
+
+class AsyncSQLService(SQLService):
+    def __init__(self, db_manager: DatabaseManager, async_db: AsyncDatabaseManager, model=None):
+        """
+        SQLService for the async API: the LLM is awaited and queries run on
+        asyncpg, so a cancelled request stops both. Schema lookups, the SQL
+        cache, plan validation and local repair stay on `db_manager`; they
+        are cached and bounded by short timeouts, and run in worker threads.
+
+        Args:
+            db_manager (DatabaseManager): Catalog, plan validator and repairer
+            async_db (AsyncDatabaseManager): Executes the generated queries
+            model (Optional[LLMModel]): Model to use, the shared instance if None
+        """
+        super().__init__(db_manager, model=model)
+        self.async_db = async_db
+
+    async def agenerate_sql_query(
+        self,
+        user_query: str,
+        table_statement: str,
+        max_attempts: int = 3
+    ) -> Tuple[Optional[pd.DataFrame], Optional[str], Optional[str]]:
+        """
+        Async variant of SQLService.generate_sql_query (serial retry loop)
+
+        Args:
+            user_query (str): User's natural language query
+            table_statement (str): Database table schema
+            max_attempts (int): LLM generations before giving up
+
+        Returns:
+            Tuple[Optional[pd.DataFrame], Optional[str], Optional[str]]:
+                - DataFrame with results if successful, None if failed
+                - Generated SQL query
+                - Error message if failed, None if successful
+        """
+        with span("sql.generate", asynchronous=True) as current:
+            df, sql_query, error = await self._agenerate_sql_query(user_query, table_statement, max_attempts)
+            if error:
+                current.fail(error)
+            elif df is not None:
+                current.set(sql_cache_hit=bool(df.attrs.get("sql_cache_hit")))
+            return df, sql_query, error
+
+    async def _agenerate_sql_query(self, user_query: str, table_statement: str, max_attempts: int):
+        """Body of agenerate_sql_query, run inside its span"""
+        if self.cache is not None:
+            cached_query = self.cache.get(user_query, table_statement)
+            if cached_query is not None:
+                plan_check, plan_error = await asyncio.to_thread(self._validate_plan, cached_query)
+                # A cached query that no longer plans or is over the cost gate is regenerated
+                if plan_error is None:
+                    df, _ = await self._aexecute(cached_query, plan_check)
+                    if df is not None:
+                        df.attrs["sql_cache_hit"] = True
+                        return df, cached_query, None
+                self.cache.invalidate(user_query, table_statement)
+
+        current_sql_query = None
+        error_message = None
+        llm_seconds = 0.0
+        loop = asyncio.get_running_loop()
+        for attempt in range(max_attempts):
+            current_span().set(retries=attempt)
+            with span("sql.prompt", attempt=attempt + 1) as stage:
+                prompt = get_sql_prompt(user_query, table_statement, current_sql_query, error_message, db_type="PostgreSQL")
+                prompt_tokens = self._count_prompt(prompt)
+                stage.set(prompt_tokens=prompt_tokens)
+
+            started = loop.time()
+            sql_response = await self.model.agenerate_response(prompt)
+            llm_seconds += loop.time() - started
+            # Keep only the first complete statement, as the streaming path does
+            sql_query = clean_sql_response(complete_sql_statement(sql_response) or sql_response)
+            current_sql_query = sql_query
+
+            with span("sql.validate_syntax") as stage:
+                is_valid, validation_error = validate_sql_syntax(sql_query)
+                if not is_valid:
+                    stage.fail(validation_error)
+            if not is_valid:
+                error_message = f"Generated query failed syntax validation: {validation_error}. Query: {sql_query}"
+                continue
+
+            sql_query, plan_check, plan_error, repairs = await asyncio.to_thread(self._validate_and_repair, sql_query)
+            current_sql_query = sql_query
+            if plan_error:
+                error_message = plan_error
+                continue
+
+            df, db_error = await self._aexecute(sql_query, plan_check)
+            if df is None:
+                # Errors the planner did not catch (plan validation disabled) get the same local repair
+                repaired = await asyncio.to_thread(self._repair_execution, sql_query)
+                if repaired is not None:
+                    sql_query, plan_check, fixes = repaired
+                    current_sql_query = sql_query
+                    repairs = repairs + fixes
+                    df, db_error = await self._aexecute(sql_query, plan_check)
+            if df is not None:
+                if self.cache is not None:
+                    self.cache.put(user_query, table_statement, sql_query)
+                df.attrs["llm_seconds"] = llm_seconds
+                df.attrs["prompt_tokens"] = prompt_tokens
+                if repairs:
+                    df.attrs["local_repairs"] = repairs
+                return df, sql_query, None
+            error_message = f"Database execution error: {db_error}"
+
+        current_span().set(retries=max_attempts - 1)
+        final_error = f"Failed to generate and execute a valid SQL query after {max_attempts} attempts. Last generated query: '{current_sql_query}'. Last error: {error_message}"
+        return None, current_sql_query, final_error
+
+    async def _aexecute(self, sql_query: str, plan_check: Optional[dict]) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+        """Async variant of SQLService._execute: reads fresh materialized views, samples over-budget queries, executes on asyncpg"""
+        view = await asyncio.to_thread(self._view_rewrite, sql_query)
+        sample = None
+        if view is None and SAMPLING_CONFIG["enabled"] and plan_check and plan_check.get("plan_rows") is not None:
+            sample = plan_sample(sql_query, plan_check["plan_rows"])
+
+        started = time.perf_counter()
+        df, db_error = await self.async_db.execute_query(view["query"] if view else sample["query"] if sample else sql_query)
+        if df is None and (sample is not None or view is not None):
+            # The rewrite itself failed: fall back to the query as generated
+            if view is not None:
+                await asyncio.to_thread(self.db_manager.query_advisor.drop_missing_views)
+            started = time.perf_counter()
+            df, db_error = await self.async_db.execute_query(sql_query)
+            sample = view = None
+        if df is None:
+            return None, db_error
+        seconds = time.perf_counter() - started
+
+        if plan_check and plan_check.get("warnings"):
+            df.attrs["plan_warnings"] = plan_check["warnings"]
+        if sample is not None:
+            df.attrs["sampled"] = sample
+        await asyncio.to_thread(self._record_execution, sql_query, seconds, df, plan_check, view)
+        return df, None
@@ -0,0 +1,546 @@
+# benchmarks/bench_e2e.py
+#
+# Offline end-to-end benchmark of SQLService, AnalysisService and the database
+# layer. A ReplayModel replays the recorded completions in
+# benchmarks/e2e_corpus.json instead of calling an LLM. The bench_* tables are
+# synthetic and sized with --rows.
+#
+# Backends:
+#   - PostgreSQL, when BENCH_DATABASE_URL is set: the bench_* tables are created
+#     in the public schema (reloaded when their size differs) and queried
+#     through DatabaseManager
+#   - fixture otherwise: the same tables in a SQLite file behind FixtureDatabase,
+#     so the harness also runs where no database server is available
+#
+# Reports p50/p95 latency per question and per traced stage, throughput,
+# retries, local repairs and peak memory. Compares them with the baseline in
+# benchmarks/baselines/ and exits 1 on a regression.
+#
+# Usage:
+#   python benchmarks/bench_e2e.py [--rows 100000] [--repeat 3] [--concurrency 1]
+#       [--llm-ttfb-ms 0] [--llm-tokens-per-second 0] [--save-baseline] [--tolerance 0.25]
+#       [--min-delta-ms 50]
+
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+from config import CACHE_CONFIG, SANDBOX_CONFIG
+from llm_backends import LLMBackend
+from model import LLMModel
+from schema_catalog import SchemaCatalog
+from schema_index import SchemaIndex
+from sql_repair import SQLRepairer
+from tracing import get_tracer, span
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "e2e_corpus.json")
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+# Synthetic tables: (name, data type, not null) columns, primary key and foreign keys,
+# in the shape of SchemaCatalog entries. The DDL is valid for PostgreSQL and SQLite.
+TABLES = {
+    "bench_customers": {
+        "columns": [("customer_id", "integer", True), ("name", "text", True), ("city", "text", True),
+                    ("segment", "text", True), ("signup_date", "date", True)],
+        "primary_key": ["customer_id"],
+        "foreign_keys": [],
+    },
+    "bench_products": {
+        "columns": [("product_id", "integer", True), ("name", "text", True), ("category", "text", True),
+                    ("price", "double precision", True)],
+        "primary_key": ["product_id"],
+        "foreign_keys": [],
+    },
+    "bench_orders": {
+        "columns": [("order_id", "integer", True), ("customer_id", "integer", True), ("product_id", "integer", True),
+                    ("quantity", "integer", True), ("amount", "double precision", True), ("status", "text", True),
+                    ("ordered_at", "date", True)],
+        "primary_key": ["order_id"],
+        "foreign_keys": [
+            {"name": "bench_orders_customer_id_fkey", "columns": ["customer_id"],
+             "ref_table": "bench_customers", "ref_columns": ["customer_id"]},
+            {"name": "bench_orders_product_id_fkey", "columns": ["product_id"],
+             "ref_table": "bench_products", "ref_columns": ["product_id"]},
+        ],
+    },
+}
+
+CITIES = ["Berlin", "Lisbon", "Madrid", "Oslo", "Paris", "Prague", "Rome", "Vienna", "Warsaw", "Zurich"]
+SEGMENTS = ["consumer", "corporate", "small business"]
+CATEGORIES = ["books", "electronics", "garden", "grocery", "sports", "toys"]
+STATUSES = ["delivered", "shipped", "processing", "returned", "cancelled"]
+
+def generate_tables(rows: int, seed: int = 42) -> Dict[str, pd.DataFrame]:
+    """
+    Build the synthetic tables
+
+    Args:
+        rows (int): Rows of bench_orders; customers are a tenth of that, products 200
+        seed (int): Random seed, the same seed gives the same data
+
+    Returns:
+        Dict[str, pd.DataFrame]: Table name -> data, parents before children
+    """
+    rng = np.random.default_rng(seed)
+    customers = max(rows // 10, 1)
+    products = 200
+    days = pd.date_range("2023-01-01", "2024-12-31", freq="D").strftime("%Y-%m-%d").to_numpy()
+
+    price = np.round(rng.lognormal(3, 0.8, products), 2)
+    product_id = rng.integers(1, products + 1, rows)
+    quantity = rng.integers(1, 10, rows)
+    return {
+        "bench_customers": pd.DataFrame({
+            "customer_id": np.arange(1, customers + 1),
+            "name": [f"Customer {i}" for i in range(1, customers + 1)],
+            "city": rng.choice(CITIES, customers),
+            "segment": rng.choice(SEGMENTS, customers, p=[0.6, 0.3, 0.1]),
+            "signup_date": rng.choice(days, customers),
+        }),
+        "bench_products": pd.DataFrame({
+            "product_id": np.arange(1, products + 1),
+            "name": [f"Product {i}" for i in range(1, products + 1)],
+            "category": rng.choice(CATEGORIES, products),
+            "price": price,
+        }),
+        "bench_orders": pd.DataFrame({
+            "order_id": np.arange(1, rows + 1),
+            "customer_id": rng.integers(1, customers + 1, rows),
+            "product_id": product_id,
+            "quantity": quantity,
+            "amount": np.round(price[product_id - 1] * quantity, 2),
+            "status": rng.choice(STATUSES, rows, p=[0.7, 0.1, 0.1, 0.07, 0.03]),
+            "ordered_at": rng.choice(days, rows),
+        }),
+    }
+
+def create_table_statement(name: str) -> str:
+    """CREATE TABLE statement of a synthetic table"""
+    table = TABLES[name]
+    lines = [f"{column} {data_type}{' NOT NULL' if not_null else ''}" for column, data_type, not_null in table["columns"]]
+    lines.append(f"PRIMARY KEY ({', '.join(table['primary_key'])})")
+    for fk in table["foreign_keys"]:
+        lines.append(
+            f"FOREIGN KEY ({', '.join(fk['columns'])}) REFERENCES {fk['ref_table']} ({', '.join(fk['ref_columns'])})"
+        )
+    return f"CREATE TABLE {name} ({', '.join(lines)})"
+
+
+class ReplayBackend(LLMBackend):
+    name = "replay"
+
+    def __init__(self, corpus: List[dict], ttfb_ms: float = 0.0, tokens_per_second: float = 0.0):
+        """
+        Deterministic LLM stand-in. The n-th SQL (or analysis) prompt for a
+        question gets the n-th recorded SQL (or analysis) completion of that
+        question; the last one repeats once they run out.
+
+        Args:
+            corpus (List[dict]): Corpus entries with "question", "sql" and "analysis"
+            ttfb_ms (float): Simulated time to the first chunk
+            tokens_per_second (float): Simulated decode speed, 0 streams instantly
+        """
+        self.recordings = {entry["question"]: entry for entry in corpus}
+        self.ttfb_ms = ttfb_ms
+        self.tokens_per_second = tokens_per_second
+        self.calls: Dict[str, int] = {}
+
+    def reset(self):
+        """Start a new question: replay from the first recording again"""
+        self.calls = {}
+
+    def _completion(self, prompt: str) -> str:
+        if "<python_code>" in prompt:
+            kind, match = "analysis", re.search(r"USER INPUT: (.*)", prompt)
+        else:
+            kind, match = "sql", re.search(r'User Question: "(.*)"', prompt)
+        entry = self.recordings.get(match.group(1).strip()) if match else None
+        if entry is None:
+            return "Error: no recorded completion for this prompt."
+        attempt = self.calls.get(kind, 0)
+        self.calls[kind] = attempt + 1
+        return entry[kind][min(attempt, len(entry[kind]) - 1)]
+
+    def generate(self, prompt: str, max_new_tokens: int, temperature: Optional[float] = None) -> str:
+        return "".join(self.stream(prompt, max_new_tokens, temperature))
+
+    def stream(self, prompt: str, max_new_tokens: int, temperature: Optional[float] = None) -> Iterator[str]:
+        completion = self._completion(prompt)
+        if self.ttfb_ms:
+            time.sleep(self.ttfb_ms / 1000)
+        # Chunks of about one token, like a streaming API
+        for chunk in re.findall(r"\s*\S{1,4}|\s+$", completion):
+            yield chunk
+            if self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+
+
+class ReplayModel(LLMModel):
+    def __init__(self, backend: ReplayBackend):
+        """LLMModel over a ReplayBackend, so prompts, streaming and spans run as in the app"""
+        self.model_type = "replay"
+        self.backend = backend
+
+
+class FixtureCatalog(SchemaCatalog):
+    def __init__(self, tables: Dict[str, dict]):
+        """SchemaCatalog over fixed table entries instead of pg_catalog"""
+        super().__init__(pool=None)
+        self._tables = {
+            name: dict(table, kind="r", comment=None, column_comments={}) for name, table in tables.items()
+        }
+        self._table_names = list(self._tables)
+        self._table_fingerprints = {name: name for name in self._tables}
+        self.fingerprint = "fixture"
+        self.version = ()
+
+    def refresh(self, force: bool = False):
+        """Fixture tables never change"""
+
+
+class FixtureDatabase:
+    def __init__(self, path: str):
+        """
+        Stand-in for DatabaseManager over a SQLite file holding the synthetic
+        tables. Planning errors are reported in PlanValidator's structured
+        form so local repair and the LLM retry loop behave as on PostgreSQL.
+
+        Args:
+            path (str): SQLite database file
+        """
+        self.path = path
+        self.connection_string = f"sqlite:///{path}"
+        self.catalog = FixtureCatalog(TABLES)
+        self.result_cache = None
+        self.schema_index = SchemaIndex(self.catalog)
+        self.sql_repairer = SQLRepairer(self.catalog)
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path)
+        return conn
+
+    @staticmethod
+    def _error(exc: Exception) -> dict:
+        """Map a SQLite error to PlanValidator's structured error"""
+        message = str(exc)
+        for pattern, kind, sqlstate, text in (
+            (r"no such column: (\S+)", "undefined_column", "42703", 'column "{}" does not exist'),
+            (r"no such table: (\S+)", "undefined_table", "42P01", 'relation "{}" does not exist'),
+            (r"no such function: (\S+)", "undefined_function", "42883", "function {}() does not exist"),
+        ):
+            match = re.match(pattern, message)
+            if match:
+                return {"sqlstate": sqlstate, "kind": kind, "message": text.format(match.group(1)),
+                        "detail": None, "hint": None, "position": None}
+        kind, sqlstate = ("syntax_error", "42601") if "syntax error" in message else ("error", "XX000")
+        return {"sqlstate": sqlstate, "kind": kind, "message": message,
+                "detail": None, "hint": None, "position": None}
+
+    def execute_query(self, query: str, on_batch=None, transport=None, use_cache=True, cancel_token=None):
+        with span("db.execute_query", transport="fixture") as current:
+            try:
+                df = pd.read_sql_query(query, self._connection())
+            except Exception as e:
+                current.fail(str(e))
+                return None, f"Error executing query: {str(e)}"
+            df.attrs["truncated"] = False
+            df.attrs["rows_fetched"] = len(df)
+            df.attrs["bytes_fetched"] = int(df.memory_usage(deep=True).sum())
+            df.attrs["transport"] = "fixture"
+            current.set(rows=len(df), bytes_fetched=df.attrs["bytes_fetched"])
+            return df, None
+
+    def validate_query(self, query: str) -> dict:
+        try:
+            plan = self._connection().execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+        except sqlite3.Error as e:
+            return {"ok": False, "error": self._error(e), "plan": None, "warnings": [], "rejected": False}
+        return {"ok": True, "error": None, "plan": plan, "total_cost": 0.0, "plan_rows": None,
+                "plan_width": None, "warnings": [], "rejected": False}
+
+    def estimate_cost(self, query: str):
+        check = self.validate_query(query)
+        return (0.0, None) if check["ok"] else (None, check["error"]["message"])
+
+    def get_table_schema(self, table_name: str) -> Optional[str]:
+        return self.catalog.get_table_schema(table_name)
+
+    def select_schema(self, question: str, pinned: Optional[list] = None) -> Optional[dict]:
+        return self.schema_index.select(question, pinned=pinned)
+
+    def list_tables(self) -> list:
+        return self.catalog.list_tables()
+
+
+def load_fixture(tables: Dict[str, pd.DataFrame], directory: str) -> FixtureDatabase:
+    """Write the synthetic tables to a SQLite file"""
+    path = os.path.join(directory, "bench_e2e.sqlite3")
+    with sqlite3.connect(path) as conn:
+        for name, df in tables.items():
+            conn.execute(create_table_statement(name))
+            conn.executemany(
+                f"INSERT INTO {name} VALUES ({', '.join('?' * len(df.columns))})",
+                df.astype(object).itertuples(index=False, name=None),
+            )
+    return FixtureDatabase(path)
+
+def load_postgres(tables: Dict[str, pd.DataFrame], connection_string: str, reload: bool):
+    """Create the synthetic tables in PostgreSQL unless they are already loaded with the same size"""
+    import io
+    import psycopg2
+    from database import DatabaseManager
+
+    conn = psycopg2.connect(connection_string)
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('bench_orders') IS NOT NULL")
+            loaded = cursor.fetchone()[0]
+            if loaded and not reload:
+                cursor.execute("SELECT count(*) FROM bench_orders")
+                loaded = cursor.fetchone()[0] == len(tables["bench_orders"])
+            if not loaded or reload:
+                print("Loading synthetic tables into PostgreSQL...")
+                for name in reversed(list(tables)):
+                    cursor.execute(f"DROP TABLE IF EXISTS {name} CASCADE")
+                for name, df in tables.items():
+                    cursor.execute(create_table_statement(name))
+                    buffer = io.StringIO(df.to_csv(index=False, header=False))
+                    cursor.copy_expert(f"COPY {name} FROM STDIN WITH (FORMAT csv)", buffer)
+                cursor.execute("ANALYZE")
+    finally:
+        conn.close()
+    return DatabaseManager(connection_string)
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """q-th percentile, None for no values"""
+    return float(np.percentile(values, q)) if values else None
+
+def peak_rss_bytes(pid: str = "self") -> Optional[int]:
+    """Peak resident set size of a process (Linux /proc), None if unavailable"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def run_question(services: dict, entry: dict) -> dict:
+    """Answer one corpus question as the app does and measure it"""
+    db, sql_service, analysis_service, backend = (
+        services["db"], services["sql_service"], services["analysis_service"], services["backend"]
+    )
+    backend.reset()
+    table_schema = "\n\n".join(db.get_table_schema(table) for table in entry["tables"])
+    outcome = {"question": entry["question"], "error": None, "rows": 0, "local_repairs": 0}
+    started = time.perf_counter()
+    with span("request", mode="bench"):
+        df, _, error = sql_service.generate_sql_query(entry["question"], table_schema)
+        outcome["sql_seconds"] = time.perf_counter() - started
+        if error:
+            outcome["error"] = error
+        else:
+            outcome["rows"] = len(df)
+            outcome["local_repairs"] = len(df.attrs.get("local_repairs", []))
+            _, analysis_error = analysis_service.generate_analysis(entry["question"], df)
+            outcome["error"] = analysis_error
+    outcome["seconds"] = time.perf_counter() - started
+    outcome["retries"] = sum(max(calls - 1, 0) for calls in backend.calls.values())
+    return outcome
+
+def stage_summary(logs_dir: str) -> Dict[str, dict]:
+    """p50/p95 duration of every traced stage from the span files in `logs_dir`"""
+    durations: Dict[str, List[float]] = {}
+    for path in glob.glob(os.path.join(logs_dir, "spans-*.jsonl")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                durations.setdefault(record["name"], []).append(record["duration_ms"] / 1000)
+    return {
+        name: {"count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95)}
+        for name, values in sorted(durations.items())
+    }
+
+def compare(report: dict, baseline: dict, tolerance: float, min_delta_seconds: float) -> List[str]:
+    """
+    Regressions of `report` against `baseline`, as messages. Latencies must
+    also grow by at least `min_delta_seconds`, so sub-millisecond stages do
+    not flag on noise.
+    """
+    regressions = []
+
+    def check(label, current, previous, higher_is_worse=True, floor=0.0):
+        if current is None or not previous:
+            return
+        change = (current - previous) / previous
+        if higher_is_worse and current - previous < floor:
+            return
+        if (change > tolerance) if higher_is_worse else (change < -tolerance):
+            regressions.append(f"{label}: {previous:.4g} -> {current:.4g} ({change:+.0%})")
+
+    check("latency p50 (s)", report["latency"]["p50"], baseline["latency"]["p50"], floor=min_delta_seconds)
+    check("latency p95 (s)", report["latency"]["p95"], baseline["latency"]["p95"], floor=min_delta_seconds)
+    check("throughput (questions/s)", report["throughput"], baseline["throughput"], higher_is_worse=False)
+    check("peak RSS (bytes)", report["peak_rss_bytes"], baseline.get("peak_rss_bytes"))
+    for name, stage in report["stages"].items():
+        if name in baseline.get("stages", {}):
+            check(f"stage {name} p95 (s)", stage["p95"], baseline["stages"][name]["p95"], floor=min_delta_seconds)
+    if report["retries"] > baseline["retries"]:
+        regressions.append(f"retries: {baseline['retries']} -> {report['retries']}")
+    if report["errors"] > baseline["errors"]:
+        regressions.append(f"errors: {baseline['errors']} -> {report['errors']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark with a replayed LLM")
+    parser.add_argument("--rows", type=int, default=100_000, help="Rows of the synthetic orders table")
+    parser.add_argument("--repeat", type=int, default=3, help="Measured passes over the corpus")
+    parser.add_argument("--concurrency", type=int, default=1, help="Questions answered at the same time")
+    parser.add_argument("--llm-ttfb-ms", type=float, default=0.0, help="Simulated LLM time to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=0.0, help="Simulated decode speed, 0 for instant")
+    parser.add_argument("--with-caches", action="store_true", help="Keep the SQL and result caches enabled")
+    parser.add_argument("--reload", action="store_true", help="Recreate the PostgreSQL tables")
+    parser.add_argument("--baseline", help="Baseline file, defaults to benchmarks/baselines/e2e-<backend>.json")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Relative change reported as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=50.0, help="Smallest latency increase reported as a regression")
+    args = parser.parse_args()
+
+    with open(CORPUS_FILE, encoding="utf-8") as f:
+        corpus = json.load(f)
+    tables = generate_tables(args.rows)
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    connection_string = os.getenv("BENCH_DATABASE_URL")
+    if connection_string:
+        backend_name = "postgres"
+        db = load_postgres(tables, connection_string, args.reload)
+        if not args.with_caches:
+            db.result_cache = None
+    else:
+        backend_name = "fixture"
+        db = load_fixture(tables, workdir)
+    del tables
+
+    from sql_service import SQLService
+    from analysis_service import AnalysisService
+
+    local = threading.local()
+
+    def services() -> dict:
+        # Services and replay state per worker thread, the database layer is shared
+        if not hasattr(local, "services"):
+            backend = ReplayBackend(corpus, args.llm_ttfb_ms, args.llm_tokens_per_second)
+            model = ReplayModel(backend)
+            sql_service = SQLService(db)
+            sql_service._model = model
+            if not (args.with_caches and CACHE_CONFIG["sql_cache_enabled"]):
+                sql_service.cache = None
+            analysis_service = AnalysisService()
+            analysis_service._model = model
+            local.services = {"db": db, "sql_service": sql_service,
+                              "analysis_service": analysis_service, "backend": backend}
+        return local.services
+
+    tracer = get_tracer()
+    tracer.enabled = True
+    tracer.logs_dir = os.path.join(workdir, "warm-up")
+    os.makedirs(tracer.logs_dir)
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        # Warm-up pass: sandbox workers, imports and connections; not measured
+        list(executor.map(lambda entry: run_question(services(), entry), corpus))
+
+        tracer.logs_dir = os.path.join(workdir, "measured")
+        os.makedirs(tracer.logs_dir)
+        started = time.perf_counter()
+        outcomes = list(executor.map(lambda entry: run_question(services(), entry), corpus * args.repeat))
+        elapsed = time.perf_counter() - started
+
+    worker_peaks = []
+    if SANDBOX_CONFIG["enabled"]:
+        from sandbox import get_sandbox_pool
+        worker_peaks = [peak_rss_bytes(str(pid)) for pid in get_sandbox_pool().worker_pids()]
+    latencies = [outcome["seconds"] for outcome in outcomes]
+    report = {
+        "backend": backend_name,
+        "params": {"rows": args.rows, "repeat": args.repeat, "concurrency": args.concurrency,
+                   "llm_ttfb_ms": args.llm_ttfb_ms, "llm_tokens_per_second": args.llm_tokens_per_second,
+                   "with_caches": args.with_caches, "questions": len(corpus)},
+        "latency": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+                    "mean": float(np.mean(latencies))},
+        "throughput": len(outcomes) / elapsed,
+        "retries": sum(outcome["retries"] for outcome in outcomes),
+        "local_repairs": sum(outcome["local_repairs"] for outcome in outcomes),
+        "errors": sum(1 for outcome in outcomes if outcome["error"]),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "sandbox_peak_rss_bytes": max((peak for peak in worker_peaks if peak), default=None),
+        "stages": stage_summary(tracer.logs_dir),
+    }
+
+    print(f"Backend: {backend_name}, {args.rows:,} orders, {len(corpus)} questions x {args.repeat}, "
+          f"concurrency {args.concurrency}")
+    print(f"\n{'question':<60} {'p50 (s)':>9} {'p95 (s)':>9} {'retries':>8} {'rows':>9}")
+    for entry in corpus:
+        runs = [outcome for outcome in outcomes if outcome["question"] == entry["question"]]
+        seconds = [run["seconds"] for run in runs]
+        errors = [run["error"] for run in runs if run["error"]]
+        print(f"{entry['question'][:60]:<60} {percentile(seconds, 50):>9.3f} {percentile(seconds, 95):>9.3f} "
+              f"{sum(run['retries'] for run in runs):>8} {runs[-1]['rows']:>9,}" + ("  ERROR" if errors else ""))
+        for error in sorted(set(errors)):
+            print(f"    {error[:200]}")
+    print(f"\n{'stage':<22} {'count':>7} {'p50 (s)':>9} {'p95 (s)':>9}")
+    for name, stage in report["stages"].items():
+        print(f"{name:<22} {stage['count']:>7} {stage['p50']:>9.4f} {stage['p95']:>9.4f}")
+    print(f"\nLatency p50 {report['latency']['p50']:.3f}s, p95 {report['latency']['p95']:.3f}s; "
+          f"throughput {report['throughput']:.2f} questions/s")
+    print(f"Retries {report['retries']}, local repairs {report['local_repairs']}, errors {report['errors']}")
+    if report["peak_rss_bytes"]:
+        print(f"Peak RSS {report['peak_rss_bytes'] / 2**20:.0f} MiB", end="")
+        if report["sandbox_peak_rss_bytes"]:
+            print(f", sandbox worker {report['sandbox_peak_rss_bytes'] / 2**20:.0f} MiB", end="")
+        print()
+
+    baseline_file = args.baseline or os.path.join(BASELINE_DIR, f"e2e-{backend_name}.json")
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_file), exist_ok=True)
+        with open(baseline_file, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {baseline_file}")
+        return
+    if not os.path.exists(baseline_file):
+        print(f"\nNo baseline at {baseline_file}; run with --save-baseline to create one.")
+        return
+    with open(baseline_file, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("params") != report["params"]:
+        print(f"\nBaseline was recorded with {baseline.get('params')}; not comparing.")
+        return
+    regressions = compare(report, baseline, args.tolerance, args.min_delta_ms / 1000)
+    if regressions:
+        print(f"\nFAIL: regressions beyond {args.tolerance:.0%} against {baseline_file}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"\nOK: no regressions beyond {args.tolerance:.0%} against {baseline_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/bench_startup.py
+#
+# Measure cold import time of the app and its service modules, each in a
+# fresh interpreter, and fail when `import app` exceeds the budget in
+# STARTUP_CONFIG["import_budget_seconds"] (env IMPORT_BUDGET_SECONDS).
+#
+# Usage:
+#   python benchmarks/bench_startup.py [--repeat 5] [--top 10] [--budget 0.5]
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from config import STARTUP_CONFIG
+
+MODULES = ["app", "model", "database", "sql_service", "analysis_service"]
+
+def import_profile(module: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Import a module in a fresh interpreter with -X importtime
+
+    Returns:
+        Tuple[float, List[Tuple[str, float]]]:
+            - Cumulative import time of the module in seconds
+            - (module, self seconds) of every module it pulled in
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        last_line = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "unknown error"
+        raise RuntimeError(f"import {module} failed: {last_line}")
+
+    cumulative = 0.0
+    modules: List[Tuple[str, float]] = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us) / 1e6))
+        if name.strip() == module:
+            cumulative = int(cumulative_us) / 1e6
+    return cumulative, modules
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold import time against the startup budget")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per module; the best run is reported")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports listed for `app`")
+    parser.add_argument("--budget", type=float, default=STARTUP_CONFIG["import_budget_seconds"])
+    args = parser.parse_args()
+
+    results: Dict[str, float] = {}
+    app_modules: List[Tuple[str, float]] = []
+    print(f"{'module':>18} {'best (s)':>10}")
+    for module in MODULES:
+        try:
+            runs = [import_profile(module) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{module:>18} {'n/a':>10}  {e}")
+            continue
+        best, modules = min(runs, key=lambda run: run[0])
+        results[module] = best
+        if module == "app":
+            app_modules = modules
+        print(f"{module:>18} {best:>10.3f}")
+
+    if app_modules:
+        print("\nSlowest imports under `import app` (self time):")
+        for name, seconds in sorted(app_modules, key=lambda item: item[1], reverse=True)[:args.top]:
+            print(f"  {seconds:>8.3f}s  {name}")
+
+    if "app" not in results:
+        print("\nFAIL: `import app` could not be measured")
+        sys.exit(1)
+    if results["app"] > args.budget:
+        print(f"\nFAIL: `import app` took {results['app']:.3f}s, budget is {args.budget:.3f}s")
+        sys.exit(1)
+    print(f"\nOK: `import app` took {results['app']:.3f}s, budget is {args.budget:.3f}s")
+
+if __name__ == "__main__":
+    main()
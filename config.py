@@ -8,14 +8,193 @@ load_dotenv()
 
 # Model configuration
 MODEL_CONFIG = {
-    "model_name": "Qwen/Qwen2.5-Coder-3B-Instruct",
+    "type": os.getenv("MODEL_TYPE", "gemini"),  # "gemini", "local" or "tiny"
+    "model_name": os.getenv("LOCAL_MODEL_NAME", "Qwen/Qwen2.5-Coder-3B-Instruct"),
+    "tiny_model_name": "hf-internal-testing/tiny-random-LlamaForCausalLM",
+    "gemini_model_name": "gemini-1.5-flash",
     "max_new_tokens": 2048,
+    "device": os.getenv("LOCAL_MODEL_DEVICE"),  # None picks cuda when available, else cpu
+    "max_batch_size": 4,  # concurrent prompts decoded in one forward pass
+    "batch_window_ms": 25,  # how long the batcher waits for more prompts
+    "prefix_cache_entries": 8,  # prompts whose key/value tensors are kept
+    "min_prefix_tokens": 64,  # shorter shared prefixes are recomputed
 }
 
 # Database configuration
 DB_CONFIG = {
     "temp_file_name": "temp_db.db",
-    "analysis_file_name": "temp_analysis_data.csv",
+    # "cursor" streams batches through a server-side cursor, "copy" bulk-loads
+    # results with COPY ... TO STDOUT into Arrow-backed columns
+    "transport": os.getenv("DB_TRANSPORT", "cursor"),
+}
+
+# Connection pool configuration (one pool per connection string, shared by all sessions)
+POOL_CONFIG = {
+    "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+    "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+    "checkout_timeout": 30.0,  # seconds to wait for a free connection
+    "max_idle": 300.0,  # seconds before surplus idle connections are closed
+    "health_check_interval": 30.0,  # idle seconds before a connection is pinged on checkout
+    "statement_timeout_ms": int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "60000")),
+}
+
+# Schema catalog configuration
+SCHEMA_CONFIG = {
+    "schema_name": "public",
+    "version_check_interval": 5.0,  # seconds between cheap DDL version checks
+    "top_k": 5,  # tables picked per question in "All tables" mode
+    "min_relative_score": 0.2,  # drop ranked tables scoring below this fraction of the best one
+    "max_join_hops": 2,  # longest foreign key path used to connect two picked tables
+    "table_name_weight": 3,  # table names count this many times in the BM25 index
+}
+
+# Result streaming configuration
+STREAM_CONFIG = {
+    "batch_rows": 10_000,  # rows per server-side cursor fetch
+    "max_rows": int(os.getenv("QUERY_MAX_ROWS", "1000000")),  # stop fetching after this many rows
+    "max_bytes": int(os.getenv("QUERY_MAX_BYTES", str(512 * 1024 * 1024))),  # stop once batches use this much memory
+    "preview_rows": 100,  # rows of the first batch rendered while the rest loads
+}
+
+# Cache configuration
+CACHE_CONFIG = {
+    "sql_cache_enabled": os.getenv("SQL_CACHE_ENABLED", "1") == "1",
+    "sql_memory_entries": 512,  # in-memory LRU tier of the NL-to-SQL cache
+    "sql_cache_file": "sql_cache.sqlite3",  # persistent tier, stored under PATHS["temp_dir"]
+}
+
+# Query result cache configuration
+RESULT_CACHE_CONFIG = {
+    "enabled": os.getenv("RESULT_CACHE_ENABLED", "1") == "1",
+    "memory_budget_bytes": 256 * 1024 * 1024,  # in-memory results, LRU evicted beyond this
+    "spill_bytes": 32 * 1024 * 1024,  # results this large are spilled to Parquet under PATHS["temp_dir"]
+    "disk_budget_bytes": 2 * 1024 * 1024 * 1024,
+}
+
+# Per-session frame store: held frames are dtype-compacted, read back as fetched
+FRAME_CONFIG = {
+    "compact": os.getenv("FRAME_COMPACT", "1") == "1",  # shrink the dtypes of held and spilled frames
+    "min_rows": 1000,  # smaller frames are held as fetched
+    "category_max_ratio": 0.5,  # text columns with at most this share of distinct values become categoricals
+    "session_budget_bytes": int(os.getenv("FRAME_SESSION_BUDGET_BYTES", str(256 * 1024 * 1024))),
+    "process_budget_bytes": int(os.getenv("FRAME_PROCESS_BUDGET_BYTES", str(1024 * 1024 * 1024))),
+    "disk_budget_bytes": 4 * 1024 * 1024 * 1024,  # frames over the memory budgets spill to PATHS["temp_dir"]/frames
+}
+
+# Speculative SQL generation: candidates requested concurrently per attempt
+SPECULATIVE_CONFIG = {
+    "candidates": int(os.getenv("SQL_CANDIDATES", "1")),  # 1 keeps the serial retry loop
+    # "first": return the first candidate that executes (lowest latency)
+    # "cheapest": plan all candidates and execute the lowest planner cost (cheapest query)
+    "strategy": os.getenv("SQL_CANDIDATE_STRATEGY", "first"),
+    "temperature": 0.7,  # sampling temperature of the extra candidates
+    "cost_wait_seconds": 2.0,  # "cheapest": how long to wait for more candidates after the first plans
+    "max_workers": 8,
+}
+
+# Plan-only validation (EXPLAIN without executing) of generated queries
+VALIDATION_CONFIG = {
+    "enabled": os.getenv("PLAN_VALIDATION_ENABLED", "1") == "1",
+    "max_total_cost": float(os.getenv("MAX_PLAN_COST", "1e8")),  # planner cost units
+    "max_plan_rows": float(os.getenv("MAX_PLAN_ROWS", "5e7")),  # estimated result rows
+    "over_limit_action": os.getenv("PLAN_OVER_LIMIT_ACTION", "reject"),  # "reject" or "flag"
+    "timeout_ms": 5000,  # statement_timeout while planning
+    "plan_cache_entries": 1024,
+}
+
+# Deterministic repair of planning and execution errors before asking the LLM
+REPAIR_CONFIG = {
+    "enabled": os.getenv("SQL_REPAIR_ENABLED", "1") == "1",
+    "max_local_repairs": 3,  # local fixes chained before falling back to the LLM
+    "fuzzy_cutoff": 0.7,  # minimum similarity of a misspelled column or table to its fix
+}
+
+# Adaptive sampling of queries the planner expects to return more rows than analyses need
+SAMPLING_CONFIG = {
+    "enabled": os.getenv("SAMPLING_ENABLED", "1") == "1",
+    "row_budget": int(os.getenv("SAMPLING_ROW_BUDGET", "1000000")),  # per-deployment row budget
+    "method": os.getenv("SAMPLING_METHOD", "SYSTEM"),  # "SYSTEM" or "BERNOULLI"
+    "seed": 42,  # REPEATABLE seed, keeps samples stable across reruns
+}
+
+# Aggregation pushdown: the SQL stage fetches a preview; analyses that aggregate
+# run as a second query in PostgreSQL, anything else fetches the full result
+PUSHDOWN_CONFIG = {
+    "enabled": os.getenv("PUSHDOWN_ENABLED", "0") == "1",
+    "preview_rows": int(os.getenv("PUSHDOWN_PREVIEW_ROWS", "1000")),  # rows fetched by the SQL stage
+}
+
+# History of executed generated queries and the materialized view / index advisor
+ADVISOR_CONFIG = {
+    "enabled": os.getenv("ADVISOR_ENABLED", "1") == "1",  # record history, serve queries from fresh views
+    # Create and refresh views and indexes without asking; otherwise they are only
+    # proposed (sidebar, `python query_advisor.py`) and applied with --apply
+    "auto_apply": os.getenv("ADVISOR_AUTO_APPLY", "0") == "1",
+    "history_file": "query_history.sqlite3",  # stored under PATHS["temp_dir"]
+    "history_rows": 100_000,  # oldest runs are pruned beyond this
+    "window_days": 7,  # runs the advisor looks at
+    "advise_every": 25,  # recorded runs between background advisor passes (auto_apply)
+    "view_min_runs": 3,  # a query must recur this often to get a materialized view
+    "view_min_seconds": 1.0,  # mean execution time of those runs
+    "view_max_rows": 100_000,  # larger results are not materialized
+    "max_views": 20,
+    "index_min_runs": 3,  # runs of a query shape before its plans are searched for index candidates
+    "index_min_seconds": 0.5,
+    "index_max_selectivity": 0.05,  # sequential scans keeping at most this share of a table's rows
+    "max_indexes": 10,
+    "view_prefix": "copilot_mv_",  # hidden from the schema catalog
+    "index_prefix": "copilot_idx_",
+    "ddl_timeout_ms": 30 * 60 * 1000,  # statement_timeout of CREATE and REFRESH
+}
+
+# Sandbox configuration for generated analysis code
+SANDBOX_CONFIG = {
+    "enabled": os.getenv("SANDBOX_ENABLED", "1") == "1",
+    "workers": int(os.getenv("SANDBOX_WORKERS", "2")),  # pre-warmed worker processes
+    "cpu_seconds": 60,  # CPU time per analysis
+    "memory_mb": int(os.getenv("SANDBOX_MEMORY_MB", "2048")),  # address-space limit per worker
+    "wall_timeout": 120,  # seconds before a stuck worker is killed and replaced
+    "checkout_timeout": 300,  # seconds an analysis waits for an idle worker
+    "start_method": "forkserver",  # falls back to "spawn" where unavailable
+}
+
+# Plots are reduced to this many points before rendering, see plot_reduce
+PLOT_CONFIG = {
+    "enabled": os.getenv("PLOT_REDUCE_ENABLED", "1") == "1",
+    "max_points": int(os.getenv("PLOT_MAX_POINTS", "5000")),  # per line, scatter or st chart series
+    "hexbin_gridsize": 100,  # hexagons across a scatter drawn as density
+}
+
+# Startup configuration
+STARTUP_CONFIG = {
+    "warm_up": os.getenv("MODEL_WARM_UP", "1") == "1",  # build the model in the background at first page load
+    "import_budget_seconds": float(os.getenv("IMPORT_BUDGET_SECONDS", "0.5")),  # cold `import app`, checked by benchmarks/bench_startup.py
+}
+
+# Headless batch runs (batch.py)
+BATCH_CONFIG = {
+    "concurrency": int(os.getenv("BATCH_CONCURRENCY", "8")),  # questions in flight
+    "llm_concurrency": int(os.getenv("BATCH_LLM_CONCURRENCY", str(MODEL_CONFIG["max_batch_size"]))),  # concurrent LLM calls
+    "db_concurrency": int(os.getenv("BATCH_DB_CONCURRENCY", str(POOL_CONFIG["max_size"]))),  # concurrent statements
+    "preview_rows": 50,  # rows of DataFrame results inlined in the JSONL output
+}
+
+# Async HTTP API (api.py)
+API_CONFIG = {
+    "host": os.getenv("API_HOST", "127.0.0.1"),
+    "port": int(os.getenv("API_PORT", "8080")),
+    "max_inflight": int(os.getenv("API_MAX_INFLIGHT", "8")),  # distinct questions computed at the same time
+    "max_queue": int(os.getenv("API_MAX_QUEUE", "32")),  # distinct questions waiting for a slot before 503s
+    "timeout_seconds": float(os.getenv("API_TIMEOUT_SECONDS", "120")),  # default and upper bound of a request's "timeout"
+    "preview_rows": 100,  # rows of query results and analysis values in responses
+}
+
+# Per-stage latency tracing and metrics export
+TRACING_CONFIG = {
+    "enabled": os.getenv("TRACING_ENABLED", "1") == "1",  # spans are appended to PATHS["logs_dir"]/spans-YYYYMMDD.jsonl
+    "metrics_host": os.getenv("METRICS_HOST", "127.0.0.1"),
+    "metrics_port": int(os.getenv("METRICS_PORT", "9464")),  # Prometheus /metrics endpoint, 0 disables it
+    "latency_buckets": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
 }
 
 # Application configuration
@@ -0,0 +1,258 @@
+# src/core/connection_pool.py
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+import psycopg2
+from config import POOL_CONFIG
+
+class PoolTimeoutError(ConnectionError):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        connection_string: str,
+        min_size: int = POOL_CONFIG["min_size"],
+        max_size: int = POOL_CONFIG["max_size"],
+        checkout_timeout: float = POOL_CONFIG["checkout_timeout"],
+        max_idle: float = POOL_CONFIG["max_idle"],
+        health_check_interval: float = POOL_CONFIG["health_check_interval"],
+        statement_timeout_ms: int = POOL_CONFIG["statement_timeout_ms"],
+    ):
+        """
+        Thread-safe pool of PostgreSQL connections for one connection string
+
+        Args:
+            connection_string (str): PostgreSQL connection string
+            min_size (int): Connections kept open even when idle
+            max_size (int): Upper bound on open connections
+            checkout_timeout (float): Seconds to wait for a free connection
+            max_idle (float): Seconds after which surplus idle connections are closed
+            health_check_interval (float): Idle seconds after which a connection is pinged before reuse
+            statement_timeout_ms (int): Default statement_timeout applied on checkout (0 disables it)
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+
+        self.connection_string = connection_string
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.statement_timeout_ms = statement_timeout_ms
+
+        self._lock = threading.Condition()
+        self._idle = []  # list of (connection, returned_at), most recently used last
+        self._in_use = 0
+        self._opening = 0
+        self._closed = False
+        self._metrics = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "health_check_failures": 0,
+            "reaped": 0,
+        }
+
+        # Fail fast on a bad connection string, and pre-open the minimum
+        for _ in range(max(min_size, 1)):
+            conn = self._open_connection()
+            self._idle.append((conn, time.monotonic()))
+
+    def _open_connection(self):
+        """Open a new physical connection"""
+        conn = psycopg2.connect(self.connection_string)
+        with self._lock:
+            self._metrics["connections_opened"] += 1
+        return conn
+
+    def _close_connection(self, conn):
+        """Close a physical connection, ignoring errors"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._metrics["connections_closed"] += 1
+
+    def _is_healthy(self, conn, idle_for: float) -> bool:
+        """Check that a connection can be reused"""
+        if conn.closed:
+            return False
+        if idle_for < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _reap_idle(self):
+        """Close surplus connections that have been idle too long. Caller holds the lock."""
+        now = time.monotonic()
+        reaped = []
+        # Oldest connections sit at the front of the idle list
+        while (
+            self._idle
+            and len(self._idle) + self._in_use > self.min_size
+            and now - self._idle[0][1] > self.max_idle
+        ):
+            reaped.append(self._idle.pop(0)[0])
+        self._metrics["reaped"] += len(reaped)
+        return reaped
+
+    def _checkout(self):
+        """Take a healthy connection from the pool, opening one if allowed"""
+        deadline = time.monotonic() + self.checkout_timeout
+        waited = False
+        wait_started = None
+
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise ConnectionError("Connection pool is closed")
+                reaped = self._reap_idle()
+                candidate = None
+                open_new = False
+                if self._idle:
+                    candidate, returned_at = self._idle.pop()
+                    self._in_use += 1
+                elif self._in_use + self._opening + len(self._idle) < self.max_size:
+                    self._opening += 1
+                    open_new = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._metrics["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {self.checkout_timeout}s waiting for a database connection "
+                            f"(max_size={self.max_size})"
+                        )
+                    if not waited:
+                        waited = True
+                        wait_started = time.monotonic()
+                        self._metrics["waits"] += 1
+                    self._lock.wait(remaining)
+                    continue
+
+            for conn in reaped:
+                self._close_connection(conn)
+
+            if open_new:
+                try:
+                    conn = self._open_connection()
+                except Exception:
+                    with self._lock:
+                        self._opening -= 1
+                        self._lock.notify()
+                    raise
+                with self._lock:
+                    self._opening -= 1
+                    self._in_use += 1
+                    break
+
+            if self._is_healthy(candidate, time.monotonic() - returned_at):
+                conn = candidate
+                break
+
+            # Broken connection: drop it and try again
+            with self._lock:
+                self._in_use -= 1
+                self._metrics["health_check_failures"] += 1
+                self._lock.notify()
+            self._close_connection(candidate)
+
+        with self._lock:
+            self._metrics["checkouts"] += 1
+            if waited:
+                self._metrics["wait_seconds"] += time.monotonic() - wait_started
+        return conn
+
+    def _checkin(self, conn):
+        """Return a connection to the pool, discarding it if it is unusable"""
+        discard = conn.closed != 0
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._lock:
+            self._in_use -= 1
+            if not discard and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+                conn = None
+            self._lock.notify()
+
+        if conn is not None:
+            self._close_connection(conn)
+
+    @contextmanager
+    def connection(self, statement_timeout_ms: Optional[int] = None):
+        """
+        Check out a connection for the duration of a `with` block
+
+        Args:
+            statement_timeout_ms (Optional[int]): statement_timeout for this checkout;
+                defaults to the pool setting, 0 disables it
+
+        Yields:
+            psycopg2 connection. Any open transaction is rolled back on return.
+        """
+        conn = self._checkout()
+        try:
+            timeout = self.statement_timeout_ms if statement_timeout_ms is None else statement_timeout_ms
+            with conn.cursor() as cursor:
+                cursor.execute("SET statement_timeout = %s", (int(timeout),))
+            conn.commit()
+            yield conn
+        finally:
+            self._checkin(conn)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Snapshot of pool metrics
+
+        Returns:
+            Dict[str, float]: Counters (checkouts, waits, timeouts, ...) and gauges (in_use, idle, size)
+        """
+        with self._lock:
+            snapshot = dict(self._metrics)
+            snapshot["in_use"] = self._in_use
+            snapshot["idle"] = len(self._idle)
+            snapshot["size"] = self._in_use + len(self._idle)
+            snapshot["max_size"] = self.max_size
+        return snapshot
+
+    def close(self):
+        """Close all idle connections and refuse further checkouts"""
+        with self._lock:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle = []
+            self._lock.notify_all()
+        for conn in idle:
+            self._close_connection(conn)
+
+
+# Pools are shared by every Streamlit session using the same connection string
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(connection_string: str) -> ConnectionPool:
+    """Get or create the shared ConnectionPool for a connection string"""
+    with _pools_lock:
+        pool = _pools.get(connection_string)
+        if pool is None or pool._closed:
+            pool = ConnectionPool(connection_string)
+            _pools[connection_string] = pool
+        return pool
@@ -1,8 +1,222 @@
 # src/core/database.py
 
+import io
+import re
+import threading
+import uuid
 import pandas as pd
-from typing import Tuple, Optional
-import psycopg2
+from typing import Callable, Iterator, Tuple, Optional
+from connection_pool import get_pool
+from schema_catalog import get_catalog
+from schema_index import get_schema_index
+from sql_repair import get_sql_repairer
+from result_cache import get_result_cache
+from plan_validator import get_plan_validator
+from query_advisor import get_query_advisor
+from tracing import span
+from config import ADVISOR_CONFIG, DB_CONFIG, RESULT_CACHE_CONFIG, STREAM_CONFIG
+
+# pyarrow is only needed by the COPY transport and is imported on first use
+pa = None
+pa_csv = None
+
+def _load_arrow() -> bool:
+    """Import pyarrow if not done yet; False if it is not installed"""
+    global pa, pa_csv
+    if pa is None:
+        try:
+            import pyarrow
+            import pyarrow.csv
+        except ImportError:  # COPY transport falls back to the cursor path
+            return False
+        pa, pa_csv = pyarrow, pyarrow.csv
+    return True
+
+# Statements that can be declared as a server-side cursor
+STREAMABLE_STATEMENT = re.compile(r"^\s*(\(\s*)*(select|with|values|table)\b", re.IGNORECASE)
+
+# PostgreSQL type OIDs mapped to the Arrow types COPY CSV output is parsed into
+PG_OID_TO_ARROW = {
+    16: "bool",
+    20: "int64",
+    21: "int16",
+    23: "int32",
+    26: "int64",  # oid
+    700: "float32",
+    701: "float64",
+    1700: "float64",  # numeric, same precision loss as coerce_float on the cursor path
+    1082: "date32",
+    1114: "timestamp",
+    1184: "timestamptz",
+}
+TIMESTAMPTZ_OID = 1184
+
+def _arrow_type(oid: int):
+    """Arrow type for a PostgreSQL type OID; anything unknown is parsed as text"""
+    name = PG_OID_TO_ARROW.get(oid)
+    if name is None:
+        return pa.string()
+    if name == "date32":
+        return pa.date32()
+    if name in ("timestamp", "timestamptz"):
+        # timestamptz is exported in UTC without offset and localized afterwards
+        return pa.timestamp("us")
+    return pa.type_for_alias(name)
+
+class _CopyBudgetExceeded(Exception):
+    """Raised from the COPY sink when the result grows past the byte budget"""
+
+class _BoundedBuffer(io.BytesIO):
+    def __init__(self, max_bytes: Optional[int]):
+        """BytesIO that aborts a COPY once more than max_bytes have been written"""
+        super().__init__()
+        self.max_bytes = max_bytes
+
+    def write(self, data) -> int:
+        if self.max_bytes is not None and self.tell() + len(data) > self.max_bytes:
+            raise _CopyBudgetExceeded()
+        return super().write(data)
+
+class QueryCancelledError(Exception):
+    """Raised inside a QueryStream whose CancelToken was triggered"""
+
+class CancelToken:
+    def __init__(self):
+        """
+        Cooperative cancellation shared between a caller and running queries.
+        Cancelling sends a cancel request to every registered connection.
+        """
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callbacks = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def register(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Register a callback run on cancellation (immediately if already cancelled)
+
+        Args:
+            callback (Callable): e.g. a psycopg2 connection's `cancel` method
+
+        Returns:
+            Callable: Function that unregisters the callback
+        """
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return lambda: self._unregister(callback)
+        callback()
+        return lambda: None
+
+    def _unregister(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def cancel(self):
+        """Cancel all registered work"""
+        # Callbacks run under the lock: unregistering waits for a cancel in flight,
+        # so a connection is never cancelled after it went back to the pool
+        with self._lock:
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception:
+                    pass
+
+class QueryStream:
+    def __init__(
+        self,
+        db_manager: "DatabaseManager",
+        query: str,
+        batch_rows: int = STREAM_CONFIG["batch_rows"],
+        max_rows: Optional[int] = STREAM_CONFIG["max_rows"],
+        max_bytes: Optional[int] = STREAM_CONFIG["max_bytes"],
+        cancel_token: Optional[CancelToken] = None,
+    ):
+        """
+        Iterable over DataFrame batches of a query result, read through a
+        named server-side cursor and bounded by a row and byte budget
+
+        Args:
+            db_manager (DatabaseManager): Manager whose pool provides the connection
+            query (str): SQL query to execute
+            batch_rows (int): Rows fetched per round trip
+            max_rows (Optional[int]): Stop after this many rows, None for no limit
+            max_bytes (Optional[int]): Stop once batches use this much memory, None for no limit
+            cancel_token (Optional[CancelToken]): Cancels the running statement when triggered
+        """
+        self.db_manager = db_manager
+        self.query = query
+        self.batch_rows = batch_rows
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.cancel_token = cancel_token
+
+        self.columns = None
+        self.batches = 0
+        self.rows_fetched = 0
+        self.bytes_fetched = 0
+        self.truncated = False
+        self.error: Optional[str] = None
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        try:
+            with self.db_manager._get_postgres_connection() as conn:
+                unregister = self.cancel_token.register(conn.cancel) if self.cancel_token is not None else None
+                try:
+                    server_side = bool(STREAMABLE_STATEMENT.match(self.query))
+                    if server_side:
+                        cursor = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+                    else:
+                        cursor = conn.cursor()
+                    cursor.execute(self.query)
+
+                    while True:
+                        if self.cancel_token is not None and self.cancel_token.cancelled:
+                            raise QueryCancelledError("Query was cancelled")
+                        fetch_size = self.batch_rows
+                        if self.max_rows is not None:
+                            fetch_size = min(fetch_size, self.max_rows - self.rows_fetched)
+                        # A named cursor only gets its description after the first fetch
+                        has_rows = server_side or cursor.description is not None
+                        rows = cursor.fetchmany(fetch_size) if fetch_size > 0 and has_rows else []
+                        if self.columns is None:
+                            self.columns = [column[0] for column in cursor.description or []]
+                        if not rows:
+                            break
+
+                        batch = pd.DataFrame.from_records(rows, columns=self.columns, coerce_float=True)
+                        self.batches += 1
+                        self.rows_fetched += len(batch)
+                        self.bytes_fetched += int(batch.memory_usage(deep=True).sum())
+                        yield batch
+
+                        over_rows = self.max_rows is not None and self.rows_fetched >= self.max_rows
+                        over_bytes = self.max_bytes is not None and self.bytes_fetched >= self.max_bytes
+                        if over_rows or over_bytes:
+                            # Only report truncation if the result really had more rows
+                            self.truncated = cursor.fetchone() is not None
+                            break
+                    cursor.close()
+                finally:
+                    # Before the connection goes back to the pool, where another
+                    # session may check it out
+                    if unregister is not None:
+                        unregister()
+
+            if self.batches == 0:
+                yield pd.DataFrame(columns=self.columns or [])
+        except Exception as e:
+            if self.cancel_token is not None and self.cancel_token.cancelled:
+                self.error = "Error executing query: query was cancelled"
+            else:
+                self.error = f"Error executing query: {str(e)}"
 
 class DatabaseManager:
     def __init__(self, connection_string: str):
@@ -13,40 +227,303 @@ class DatabaseManager:
             connection_string (str): PostgreSQL connection string
         """
         self.connection_string = connection_string
+        self.pool = None
         self._validate_connection()
+        self.catalog = get_catalog(connection_string, self.pool)
+        self.result_cache = (
+            get_result_cache(connection_string, self.pool, self.catalog)
+            if RESULT_CACHE_CONFIG["enabled"] else None
+        )
+        self.plan_validator = get_plan_validator(connection_string, self.pool, self.catalog)
+        self.query_advisor = (
+            get_query_advisor(connection_string, self.pool, self.catalog)
+            if ADVISOR_CONFIG["enabled"] else None
+        )
+        self.schema_index = get_schema_index(connection_string, self.catalog)
+        self.sql_repairer = get_sql_repairer(connection_string, self.catalog)
 
     def _validate_connection(self):
         """Validate that the PostgreSQL database connection is valid"""
         try:
-            conn = self._get_postgres_connection()
-            conn.close()
+            # Creating the pool opens its first connection, so a reused pool is already validated
+            self.pool = get_pool(self.connection_string)
         except Exception as e:
             raise ConnectionError(f"Failed to connect to PostgreSQL database: {str(e)}")
 
-    def _get_postgres_connection(self):
-        """Get a connection to the PostgreSQL database"""
-        return psycopg2.connect(self.connection_string)
+    def _get_postgres_connection(self, statement_timeout_ms: Optional[int] = None):
+        """
+        Check out a pooled connection to the PostgreSQL database
+
+        Args:
+            statement_timeout_ms (Optional[int]): Per-checkout statement_timeout, pool default if None
+
+        Returns:
+            Context manager yielding a psycopg2 connection
+        """
+        return self.pool.connection(statement_timeout_ms)
+
+    def pool_stats(self) -> dict:
+        """Return metrics of the shared connection pool"""
+        return self.pool.stats()
 
-    def execute_query(self, query: str) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    def result_cache_stats(self) -> dict:
+        """Return counters of the shared result cache, empty if disabled"""
+        return self.result_cache.stats() if self.result_cache is not None else {}
+
+    def advisor_stats(self) -> dict:
+        """Return counters, views and proposals of the query advisor, empty if disabled"""
+        return self.query_advisor.stats() if self.query_advisor is not None else {}
+
+    def stream_query(
+        self,
+        query: str,
+        batch_rows: int = STREAM_CONFIG["batch_rows"],
+        max_rows: Optional[int] = STREAM_CONFIG["max_rows"],
+        max_bytes: Optional[int] = STREAM_CONFIG["max_bytes"],
+        cancel_token: Optional[CancelToken] = None,
+    ) -> QueryStream:
+        """
+        Execute an SQL query lazily, yielding the result in DataFrame batches
+
+        Args:
+            query (str): SQL query to execute
+            batch_rows (int): Rows per batch
+            max_rows (Optional[int]): Row budget, None for no limit
+            max_bytes (Optional[int]): Memory budget in bytes, None for no limit
+            cancel_token (Optional[CancelToken]): Token that can cancel the running statement
+
+        Returns:
+            QueryStream: Iterable of DataFrames; check `error` and `truncated` after iterating
+        """
+        return QueryStream(self, query, batch_rows, max_rows, max_bytes, cancel_token)
+
+    def execute_query_copy(
+        self,
+        query: str,
+        max_rows: Optional[int] = STREAM_CONFIG["max_rows"],
+        max_bytes: Optional[int] = STREAM_CONFIG["max_bytes"],
+    ) -> Tuple[Optional[pd.DataFrame], Optional[str], bool]:
+        """
+        Fetch a query result with `COPY (...) TO STDOUT` and parse it into
+        typed, Arrow-backed DataFrame columns
+
+        Args:
+            query (str): SQL query to execute
+            max_rows (Optional[int]): Row budget, None for no limit. The copied query
+                is limited to one row more, which tells a truncated result apart.
+            max_bytes (Optional[int]): Largest CSV payload accepted, None for no limit
+
+        Returns:
+            Tuple[Optional[pd.DataFrame], Optional[str], bool]:
+                - DataFrame if the COPY path handled the query, None otherwise
+                - None on success, otherwise the error message
+                - Whether the cursor path should run the query instead: True when
+                  COPY cannot wrap the statement or the result is over the byte
+                  budget, False for errors of the query itself
+        """
+        if not _load_arrow():
+            return None, "pyarrow is not installed", True
+        query = query.strip().rstrip(";")
+        if not STREAMABLE_STATEMENT.match(query):
+            return None, "COPY can only wrap SELECT, WITH, VALUES and TABLE statements", True
+
+        try:
+            with self._get_postgres_connection() as conn:
+                cursor = conn.cursor()
+                # Describe the result without executing it
+                try:
+                    cursor.execute(f"SELECT * FROM ({query}) AS _copy_source LIMIT 0")
+                except Exception as e:
+                    return None, f"Error executing query: {str(e)}", False
+                columns = [(column[0], column[1]) for column in cursor.description]
+                names = [name for name, _ in columns]
+                if len(set(names)) != len(names):
+                    return None, "COPY transport needs unique column names", True
+
+                tz_columns = [name for name, oid in columns if oid == TIMESTAMPTZ_OID]
+                limit = f" LIMIT {max_rows + 1}" if max_rows is not None else ""
+                if tz_columns:
+                    quoted = {name: '"' + name.replace('"', '""') + '"' for name in names}
+                    select_list = ", ".join(
+                        f"({quoted[name]} AT TIME ZONE 'UTC') AS {quoted[name]}" if name in tz_columns else quoted[name]
+                        for name in names
+                    )
+                    copy_source = f"SELECT {select_list} FROM ({query}) AS _copy_source{limit}"
+                elif limit:
+                    copy_source = f"SELECT * FROM ({query}) AS _copy_source{limit}"
+                else:
+                    copy_source = query
+
+                cursor.execute("SET LOCAL DateStyle = 'ISO, YMD'")
+                buffer = _BoundedBuffer(max_bytes)
+                try:
+                    cursor.copy_expert(f"COPY ({copy_source}) TO STDOUT WITH (FORMAT csv)", buffer)
+                except _CopyBudgetExceeded:
+                    return None, f"Result exceeds the COPY byte budget of {max_bytes} bytes", True
+                except Exception as e:
+                    return None, f"Error executing query: {str(e)}", False
+                payload_bytes = buffer.tell()
+        except Exception as e:
+            # Checkout or connection failures; the cursor path reports them again if they persist
+            return None, f"Error executing COPY: {str(e)}", True
+
+        buffer.seek(0)
+        try:
+            table = pa_csv.read_csv(
+                buffer,
+                read_options=pa_csv.ReadOptions(column_names=names),
+                convert_options=pa_csv.ConvertOptions(
+                    column_types={name: _arrow_type(oid) for name, oid in columns},
+                    null_values=[""],
+                    strings_can_be_null=True,
+                    quoted_strings_can_be_null=False,
+                    true_values=["t"],
+                    false_values=["f"],
+                ),
+            )
+        except Exception as e:
+            return None, f"Error parsing COPY output: {str(e)}", True
+
+        truncated = max_rows is not None and table.num_rows > max_rows
+        if truncated:
+            table = table.slice(0, max_rows)
+        for name in tz_columns:
+            index = table.schema.get_field_index(name)
+            table = table.set_column(
+                index, name, table.column(index).cast(pa.timestamp("us", tz="UTC"))
+            )
+        df = table.to_pandas(types_mapper=pd.ArrowDtype)
+        df.attrs["truncated"] = truncated
+        df.attrs["rows_fetched"] = len(df)
+        df.attrs["bytes_fetched"] = payload_bytes
+        df.attrs["transport"] = "copy"
+        return df, None, False
+
+    def execute_query(
+        self,
+        query: str,
+        on_batch: Optional[Callable[[pd.DataFrame, QueryStream], None]] = None,
+        transport: Optional[str] = None,
+        use_cache: bool = True,
+        cancel_token: Optional[CancelToken] = None,
+        max_rows: Optional[int] = STREAM_CONFIG["max_rows"],
+    ) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
         """
         Execute an SQL query against PostgreSQL and return results as a DataFrame
         
         Args:
             query (str): SQL query to execute
+            on_batch (Optional[Callable]): Called with each batch and the stream as rows arrive,
+                e.g. to render a preview before the whole result is loaded (cursor transport only)
+            transport (Optional[str]): "cursor" or "copy", defaults to DB_CONFIG["transport"].
+                The COPY transport falls back to the cursor for statements it cannot wrap
+                and results over its byte budget.
+            use_cache (bool): Serve and store the result through the result cache
+            cancel_token (Optional[CancelToken]): Token that can cancel the running statement
+            max_rows (Optional[int]): Row budget, None for no limit
             
         Returns:
             Tuple[Optional[pd.DataFrame], Optional[str]]: 
-                - DataFrame with results if successful, None if failed
+                - DataFrame with results if successful, None if failed.
+                  `df.attrs["truncated"]` is True when the row/byte budget cut the result short.
                 - Error message if failed, None if successful
         """
+        with span("db.execute_query", transport=transport or DB_CONFIG["transport"]) as current:
+            df, error = self._execute_query(query, on_batch, transport, use_cache, cancel_token, max_rows)
+            if df is None:
+                current.fail(error)
+            else:
+                current.set(
+                    rows=len(df),
+                    bytes_fetched=df.attrs.get("bytes_fetched"),
+                    transport=df.attrs.get("transport"),
+                    truncated=df.attrs.get("truncated"),
+                    result_cache_hit=bool(df.attrs.get("result_cache_hit")),
+                )
+            return df, error
+
+    def _execute_query(
+        self,
+        query: str,
+        on_batch: Optional[Callable[[pd.DataFrame, QueryStream], None]],
+        transport: Optional[str],
+        use_cache: bool,
+        cancel_token: Optional[CancelToken],
+        max_rows: Optional[int],
+    ) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+        """Body of execute_query, run inside its span"""
+        cache_token = None
+        if use_cache and self.result_cache is not None:
+            try:
+                cached_df, cache_token = self.result_cache.lookup(query)
+            except Exception as e:
+                print(f"Error checking result cache: {e}")
+                cached_df = None
+            if cached_df is not None:
+                return cached_df, None
+
+        df = None
+        if (transport or DB_CONFIG["transport"]) == "copy" and cancel_token is None:
+            df, error, fallback = self.execute_query_copy(query, max_rows=max_rows)
+            if df is None and not fallback:
+                return None, error
+
+        if df is None:
+            stream = self.stream_query(query, max_rows=max_rows, cancel_token=cancel_token)
+            batches = []
+            for batch in stream:
+                batches.append(batch)
+                if on_batch is not None:
+                    on_batch(batch, stream)
+            if stream.error:
+                return None, stream.error
+
+            df = batches[0] if len(batches) == 1 else pd.concat(batches, ignore_index=True)
+            df.attrs["truncated"] = stream.truncated
+            df.attrs["rows_fetched"] = stream.rows_fetched
+            df.attrs["bytes_fetched"] = stream.bytes_fetched
+            df.attrs["transport"] = "cursor"
+
+        if cache_token is not None and not df.attrs.get("truncated"):
+            self.result_cache.store(cache_token, df)
+        return df, None
+
+    def validate_query(self, query: str) -> dict:
+        """
+        Validate a query by planning it with EXPLAIN, without executing it
+
+        Args:
+            query (str): SQL query to validate
+
+        Returns:
+            dict: PlanValidator result with "ok", structured "error", plan estimates,
+                  "warnings" and "rejected"
+        """
         try:
-            conn = self._get_postgres_connection()
-            df = pd.read_sql_query(query, conn)
-            conn.close()
-            return df, None
+            return self.plan_validator.validate(query)
         except Exception as e:
-            error_message = f"Error executing query: {str(e)}"
-            return None, error_message
+            error = {
+                "sqlstate": None, "kind": "error", "message": str(e),
+                "detail": None, "hint": None, "position": None,
+            }
+            return {"ok": False, "error": error, "plan": None, "warnings": [], "rejected": False}
+
+    def estimate_cost(self, query: str) -> Tuple[Optional[float], Optional[str]]:
+        """
+        Ask the planner for the estimated total cost of a query without running it
+
+        Args:
+            query (str): SQL query to plan
+
+        Returns:
+            Tuple[Optional[float], Optional[str]]:
+                - Estimated total cost if the query plans, None otherwise
+                - Error message if planning failed, None otherwise
+        """
+        check = self.validate_query(query)
+        if not check["ok"]:
+            return None, f"Error planning query: {check['error']['message']}"
+        return check["total_cost"], None
 
     def get_table_schema(self, table_name: str) -> Optional[str]:
         """
@@ -59,42 +536,29 @@ class DatabaseManager:
             Optional[str]: Table schema if successful, None if failed
         """
         try:
-            conn = self._get_postgres_connection()
-            cursor = conn.cursor()
-            
-            # Get table schema information
-            schema_query = """
-            SELECT 
-                column_name, 
-                data_type,
-                is_nullable
-            FROM 
-                information_schema.columns 
-            WHERE 
-                table_name = %s
-            ORDER BY 
-                ordinal_position;
-            """
-            cursor.execute(schema_query, (table_name,))
-            columns = cursor.fetchall()
-            
-            # Format schema information
-            schema = f"CREATE TABLE {table_name} (\n"
-            for i, (column_name, data_type, is_nullable) in enumerate(columns):
-                nullable = "NULL" if is_nullable == "YES" else "NOT NULL"
-                schema += f"    {column_name} {data_type} {nullable}"
-                if i < len(columns) - 1:
-                    schema += ",\n"
-                else:
-                    schema += "\n"
-            schema += ");"
-            
-            conn.close()
-            return schema
+            return self.catalog.get_table_schema(table_name)
         except Exception as e:
             print(f"Error getting table schema: {e}")
             return None
             
+    def select_schema(self, question: str, pinned: Optional[list] = None) -> Optional[dict]:
+        """
+        Pick the tables relevant to a question across the whole schema
+
+        Args:
+            question (str): User's natural language query
+            pinned (Optional[list]): Tables to include regardless of their ranking
+
+        Returns:
+            Optional[dict]: SchemaIndex.select result (tables, scores, joins and the
+                compact schema block for the prompt), None if failed
+        """
+        try:
+            return self.schema_index.select(question, pinned=pinned)
+        except Exception as e:
+            print(f"Error selecting schema: {e}")
+            return None
+
     def list_tables(self) -> list:
         """
         List all tables in the public schema of the PostgreSQL database
@@ -103,12 +567,7 @@ class DatabaseManager:
             list: List of table names
         """
         try:
-            conn = self._get_postgres_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = 'public';")
-            tables = [row[0] for row in cursor.fetchall()]
-            conn.close()
-            return tables
+            return self.catalog.list_tables()
         except Exception as e:
             print(f"Error listing tables: {e}")
             return []
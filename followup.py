@@ -0,0 +1,390 @@
+# src/core/followup.py
+#
+# Follow-up questions answered from the previous result. A follow-up such as
+# "now only for 2023, sorted by revenue" is split into clauses, and each clause
+# must match one of the rules below against the columns and values of the
+# previous result:
+#   filter       "for 2023", "since 2021", "revenue above 1000", "only Paris and Oslo",
+#                "excluding Oslo", "city is Paris"
+#   sort         "sort by revenue", "ordered by date descending"
+#   limit        "top 10 by revenue", "bottom 5 by price", "first 20"
+#   projection   "show only city and revenue", "drop the id column"
+#   aggregation  "total revenue by city", "average price per category", "count by city"
+# The operations then run as vectorized pandas over the cached frame. If any
+# clause does not match, or the previous result is incomplete (truncated,
+# sampled or a preview), the question goes back to PostgreSQL.
+
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+
+# Words around a clause that carry no operation
+LEADING_FILLER = re.compile(
+    r"^(?:(?:now|ok|okay|and|also|then|but|please|can you|could you|show me|give me|"
+    r"what about|how about|only|just|instead|do the same|the same|same|limit it to|restrict to|filter to|filter)\s+)+"
+)
+TRAILING_FILLER = re.compile(r"(?:\s+(?:only|instead|please|too|then|rows|results))+$")
+
+# Clause boundaries; "and" only separates clauses before an operation keyword
+CLAUSE_SEPARATOR = re.compile(
+    r"\s*[,;]\s*|\s+(?:and\s+)?then\s+|\s+and\s+(?=(?:sort|order|rank|top|bottom|first|last|show|keep|drop|"
+    r"remove|hide|only|just|exclude|excluding|without|except|since|after|before|for|in)\b)"
+)
+
+YEAR = re.compile(
+    r"(?:(?:for|in|during|from|of)\s+)?(?:the\s+)?(?:year\s+)?(?P<first>(?:19|20)\d{2})"
+    r"(?:\s*(?:-|to|through|and)\s*(?P<last>(?:19|20)\d{2}))?"
+)
+YEAR_BOUND = re.compile(r"(?P<bound>since|after|before|until|from)\s+(?:the\s+)?(?:year\s+)?(?P<year>(?:19|20)\d{2})(?:\s+on(?:wards?)?)?")
+YEAR_BETWEEN = re.compile(r"between\s+(?P<first>(?:19|20)\d{2})\s+and\s+(?P<last>(?:19|20)\d{2})")
+
+COMPARISON = re.compile(
+    r"(?:where\s+|with\s+)?(?P<column>.+?)\s+(?:is\s+)?(?P<op>>=|<=|!=|==|>|<|=|above|over|greater than|more than|"
+    r"higher than|at least|below|under|less than|lower than|at most|equal to|equals)\s+(?P<value>-?[\d,]*\.?\d+)"
+)
+COMPARISON_OPERATORS = {
+    ">=": ">=", "at least": ">=",
+    "<=": "<=", "at most": "<=",
+    "!=": "!=",
+    "==": "==", "=": "==", "equal to": "==", "equals": "==",
+    ">": ">", "above": ">", "over": ">", "greater than": ">", "more than": ">", "higher than": ">",
+    "<": "<", "below": "<", "under": "<", "less than": "<", "lower than": "<",
+}
+
+SORT = re.compile(r"(?:sort|sorted|order|ordered|rank|ranked)\s+(?:it\s+|them\s+)?by\s+(?P<column>.+?)(?:\s+(?P<direction>asc|ascending|desc|descending|increasing|decreasing|highest first|lowest first|largest first|smallest first))?")
+DESCENDING = ("desc", "descending", "decreasing", "highest first", "largest first")
+
+LIMIT = re.compile(r"(?P<end>top|bottom|first|last)\s+(?P<count>\d+)(?:\s+(?:rows|results|entries))?(?:\s+(?:by|on|in terms of)\s+(?P<column>.+))?")
+
+PROJECT = re.compile(r"(?:show|keep|select|display|return)\s+(?:only\s+)?(?:the\s+)?(?P<columns>.+?)(?:\s+columns?)?")
+DROP = re.compile(r"(?:drop|remove|hide|without)\s+(?:the\s+)?(?P<columns>.+?)(?:\s+columns?)")
+
+AGGREGATE = re.compile(
+    r"(?P<function>total|sum|sum of|average|avg|mean|median|count|number of|max|maximum|highest|min|minimum|lowest)"
+    r"\s+(?:of\s+)?(?:the\s+)?(?P<column>.*?)\s*(?:by|per|for each|for every|grouped by|across)\s+(?P<keys>.+)"
+)
+AGGREGATE_FUNCTIONS = {
+    "total": "sum", "sum": "sum", "sum of": "sum",
+    "average": "mean", "avg": "mean", "mean": "mean",
+    "median": "median",
+    "count": "count", "number of": "count",
+    "max": "max", "maximum": "max", "highest": "max",
+    "min": "min", "minimum": "min", "lowest": "min",
+}
+
+VALUE_FILTER = re.compile(
+    r"(?P<negate>excluding|except|except for|without|not|exclude|other than)?\s*(?:for\s+|in\s+|from\s+|where\s+)?"
+    r"(?:(?P<column>[\w ]+?)\s+(?:is|=|==|equals|in)\s+)?(?P<values>.+)"
+)
+LIST_SEPARATOR = re.compile(r"\s*,\s*|\s+(?:and|or|&)\s+")
+
+# Text columns with more distinct values are not searched for filter values
+MAX_FILTER_VALUES = 10_000
+
+
+@dataclass
+class FollowUpAnswer:
+    """A follow-up question answered from the previous result"""
+    operations: List[str]  # one description per operation, e.g. "filter: order_date in 2023"
+    code: str  # equivalent pandas code over `df`, for display
+    frame: pd.DataFrame  # the previous result with the operations applied
+
+
+def lineage_of(df: pd.DataFrame) -> Optional[dict]:
+    """SQL lineage of a result: the question and SQL it came from, and the follow-ups applied since"""
+    return df.attrs.get("lineage")
+
+def start_lineage(df: pd.DataFrame, question: str, sql_query: str):
+    """Record that `df` was fetched by `sql_query` to answer `question`"""
+    df.attrs["lineage"] = {"question": question, "sql": sql_query, "steps": []}
+
+def contextual_question(question: str, lineage: dict) -> str:
+    """A follow-up phrased with the conversation so far, for questions that go back to PostgreSQL"""
+    chain = [lineage["question"]] + [step["question"] for step in lineage["steps"]]
+    return f"{question} (follow-up to: {' -> '.join(chain)}; the previous result was fetched with: {lineage['sql']})"
+
+def conversation_question(question: str, lineage: dict) -> str:
+    """Self-contained question for the lineage of a result fetched for a follow-up"""
+    chain = [lineage["question"]] + [step["question"] for step in lineage["steps"]]
+    return " -> ".join(chain + [question])
+
+
+def answer_follow_up(question: str, df: pd.DataFrame) -> Tuple[Optional[FollowUpAnswer], Optional[str]]:
+    """
+    Answer a follow-up question from the previous result if it maps to
+    operations over it, each clause planned against the frame as
+    transformed by the clauses before it
+
+    Args:
+        question (str): Follow-up question in natural language
+        df (pd.DataFrame): Previous result, with its lineage (see start_lineage)
+
+    Returns:
+        Tuple[Optional[FollowUpAnswer], Optional[str]]:
+            - Filters, sorts, limits, projections and aggregations applied to
+              `df`, if every part of the question maps to one; None otherwise.
+              The frame carries the lineage of `df` extended by the question.
+            - Why the question needs a new query, None if it does not
+    """
+    lineage = lineage_of(df)
+    if lineage is None:
+        return None, "no previous result"
+    if df.attrs.get("truncated") or df.attrs.get("sampled") or df.attrs.get("preview"):
+        return None, "the previous result is incomplete (cut off, sampled or a preview)"
+
+    text = re.sub(r"\s+", " ", question.lower()).strip(" .?!")
+    operations, code = [], []
+    frame = df
+    for clause in CLAUSE_SEPARATOR.split(text):
+        clause = TRAILING_FILLER.sub("", LEADING_FILLER.sub("", clause or "")).strip()
+        if not clause:
+            continue
+        planned = _plan_clause(clause, frame)
+        if planned is None:
+            return None, f"could not answer \"{clause}\" from the previous result"
+        description, line, step = planned
+        try:
+            frame = step(frame)
+        except Exception as e:
+            return None, f"\"{clause}\" failed on the previous result: {e}"
+        operations.append(description)
+        code.append(line)
+    if not operations:
+        return None, "no operation in the question"
+
+    frame.attrs = {
+        "lineage": {
+            "question": lineage["question"],
+            "sql": lineage["sql"],
+            "steps": lineage["steps"] + [{"question": question, "operations": operations}],
+        }
+    }
+    return FollowUpAnswer(operations=operations, code="\n".join(code), frame=frame), None
+
+def _plan_clause(clause: str, frame: pd.DataFrame):
+    """(description, pandas code, step) for one clause, None if no rule matches"""
+    for rule in (_year_filter, _comparison, _sort, _limit, _aggregate, _projection, _value_filter):
+        planned = rule(clause, frame)
+        if planned is not None:
+            return planned
+    return None
+
+
+def _column_names(column) -> List[str]:
+    """Ways a question may name a column"""
+    name = str(column).lower()
+    spaced = name.replace("_", " ")
+    return [name, spaced, spaced + "s", spaced + "es"] if spaced != name else [name, name + "s", name + "es"]
+
+def _find_column(text: str, columns: list):
+    """Column named exactly by `text` (ignoring "the" and "column"), None if none or ambiguous"""
+    text = re.sub(r"^(?:the\s+)|\s+column$", "", text.strip()).strip("'\"` ")
+    matches = [column for column in columns if text in _column_names(column)]
+    return matches[0] if len(matches) == 1 else None
+
+def _year_values(df: pd.DataFrame, column):
+    """(pandas code, Series of years) for a date or year column, None for other columns"""
+    series = df[column]
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return f"df[{column!r}].dt.year", lambda frame: frame[column].dt.year
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) in ("date", "datetime"):
+        return f"pd.to_datetime(df[{column!r}]).dt.year", lambda frame: pd.to_datetime(frame[column]).dt.year
+    if pd.api.types.is_integer_dtype(series) and "year" in str(column).lower():
+        return f"df[{column!r}]", lambda frame: frame[column]
+    return None
+
+
+def _year_filter(clause: str, frame: pd.DataFrame):
+    """Rows of one year, a range of years, or since/before a year"""
+    for pattern in (YEAR_BETWEEN, YEAR_BOUND, YEAR):
+        match = pattern.search(clause)
+        if match:
+            break
+    else:
+        return None
+    rest = (clause[:match.start()] + clause[match.end():]).strip()
+    rest = re.sub(r"^(?:on|by|using|of|where)\s+|\s+(?:on|by|using)$", "", rest).strip()
+    candidates = [column for column in frame.columns if _year_values(frame, column) is not None]
+    if rest:
+        column = _find_column(rest, candidates)  # "order date in 2023"
+    else:
+        column = candidates[0] if len(candidates) == 1 else None
+    if column is None:
+        return None
+
+    expression, years = _year_values(frame, column)
+    groups = match.groupdict()
+    if "bound" in groups:
+        year = int(groups["year"])
+        op = {"since": ">=", "from": ">=", "after": ">", "before": "<", "until": "<="}[groups["bound"]]
+        description = f"filter: {column} {groups['bound']} {year}"
+        condition = lambda frame: _compare(years(frame), op, year)
+        code = f"df = df[{expression} {op} {year}]"
+    else:
+        first = int(groups["first"])
+        last = int(groups["last"] or first)
+        description = f"filter: {column} in {first}" if first == last else f"filter: {column} in {first}-{last}"
+        condition = lambda frame: years(frame).between(first, last)
+        code = f"df = df[{expression} == {first}]" if first == last else f"df = df[{expression}.between({first}, {last})]"
+    return description, code, lambda frame: frame[condition(frame)]
+
+def _compare(values: pd.Series, op: str, value) -> pd.Series:
+    return {
+        ">": values > value, ">=": values >= value, "<": values < value,
+        "<=": values <= value, "==": values == value, "!=": values != value,
+    }[op]
+
+def _comparison(clause: str, frame: pd.DataFrame):
+    """Rows where a numeric column compares to a number"""
+    match = COMPARISON.fullmatch(clause)
+    if not match:
+        return None
+    column = _find_column(match["column"], frame.columns)
+    if column is None or not pd.api.types.is_numeric_dtype(frame[column]):
+        return None
+    op = COMPARISON_OPERATORS[match["op"]]
+    value = float(match["value"].replace(",", ""))
+    value = int(value) if value.is_integer() else value
+    return (
+        f"filter: {column} {op} {value}",
+        f"df = df[df[{column!r}] {op} {value!r}]",
+        lambda frame: frame[_compare(frame[column], op, value)],
+    )
+
+def _sort(clause: str, frame: pd.DataFrame):
+    match = SORT.fullmatch(clause)
+    if not match:
+        return None
+    column = _find_column(match["column"], frame.columns)
+    if column is None:
+        return None
+    ascending = (match["direction"] or "asc") not in DESCENDING
+    return (
+        f"sort: {column} {'ascending' if ascending else 'descending'}",
+        f"df = df.sort_values({column!r}, ascending={ascending})",
+        lambda frame: frame.sort_values(column, ascending=ascending, kind="stable"),
+    )
+
+def _limit(clause: str, frame: pd.DataFrame):
+    match = LIMIT.fullmatch(clause)
+    if not match:
+        return None
+    count = int(match["count"])
+    largest = match["end"] in ("top", "first")
+    if match["column"]:
+        column = _find_column(match["column"], frame.columns)
+        if column is None:
+            return None
+        method = "nlargest" if largest else "nsmallest"
+        return (
+            f"limit: {match['end']} {count} by {column}",
+            f"df = df.{method}({count}, {column!r})",
+            lambda frame: getattr(frame, method)(count, column),
+        )
+    method = "head" if largest else "tail"
+    return (
+        f"limit: {match['end']} {count} rows",
+        f"df = df.{method}({count})",
+        lambda frame: getattr(frame, method)(count),
+    )
+
+def _column_list(text: str, columns: list) -> Optional[list]:
+    """Columns named by a comma/"and" separated list, None unless every item is a column"""
+    found = [_find_column(item, columns) for item in LIST_SEPARATOR.split(text) if item]
+    if not found or any(column is None for column in found):
+        return None
+    return list(dict.fromkeys(found))
+
+def _projection(clause: str, frame: pd.DataFrame):
+    """Keep or drop columns; a bare list of column names keeps them"""
+    match = DROP.fullmatch(clause)
+    if match:
+        dropped = _column_list(match["columns"], frame.columns)
+        if dropped is None:
+            return None
+        return (
+            f"projection: drop {', '.join(map(str, dropped))}",
+            f"df = df.drop(columns={dropped!r})",
+            lambda frame: frame.drop(columns=dropped),
+        )
+    match = PROJECT.fullmatch(clause)
+    kept = _column_list(match["columns"] if match else clause, frame.columns)
+    if kept is None:
+        return None
+    return (
+        f"projection: {', '.join(map(str, kept))}",
+        f"df = df[{kept!r}]",
+        lambda frame: frame[kept],
+    )
+
+def _aggregate(clause: str, frame: pd.DataFrame):
+    """One aggregate of a column (or a row count) per group"""
+    match = AGGREGATE.fullmatch(clause)
+    if not match:
+        return None
+    keys = _column_list(match["keys"], frame.columns)
+    if keys is None:
+        return None
+    function = AGGREGATE_FUNCTIONS[match["function"]]
+    column = _find_column(match["column"], frame.columns) if match["column"] else None
+    if column is None:
+        # "count by city", "number of orders per city": rows per group
+        if function != "count":
+            return None
+        return (
+            f"aggregation: row count by {', '.join(map(str, keys))}",
+            f"df = df.groupby({keys!r}, observed=True).size().reset_index(name='count')",
+            lambda frame: frame.groupby(keys, observed=True).size().reset_index(name="count"),
+        )
+    if function != "count" and not pd.api.types.is_numeric_dtype(frame[column]):
+        return None
+    return (
+        f"aggregation: {function} of {column} by {', '.join(map(str, keys))}",
+        f"df = df.groupby({keys!r}, observed=True)[{column!r}].{function}().reset_index()",
+        lambda frame: getattr(frame.groupby(keys, observed=True)[column], function)().reset_index(),
+    )
+
+def _text_values(df: pd.DataFrame, column) -> Optional[Dict[str, object]]:
+    """Lowercased distinct values of a text column mapped to the values themselves"""
+    series = df[column]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        values = series.cat.categories
+    elif pd.api.types.is_string_dtype(series) or series.dtype == object:
+        values = series.dropna().unique()
+    else:
+        return None
+    if len(values) > MAX_FILTER_VALUES:
+        return None
+    return {str(value).lower(): value for value in values if isinstance(value, str)}
+
+def _value_filter(clause: str, frame: pd.DataFrame):
+    """Rows whose text column holds (or, negated, does not hold) the named values"""
+    match = VALUE_FILTER.fullmatch(clause)
+    if not match:
+        return None
+    items = [item.strip("'\" ") for item in LIST_SEPARATOR.split(match["values"]) if item.strip("'\" ")]
+    if not items:
+        return None
+    if match["column"]:
+        named = _find_column(match["column"], frame.columns)
+        if named is None:
+            return None
+        candidates = [named]
+    else:
+        candidates = list(frame.columns)
+
+    matches = []
+    for column in candidates:
+        values = _text_values(frame, column)
+        if values and all(item in values for item in items):
+            matches.append((column, [values[item] for item in items]))
+    if len(matches) != 1:
+        return None  # no column, or several, hold all the values
+    column, values = matches[0]
+    negate = bool(match["negate"])
+    return (
+        f"filter: {column} {'not in' if negate else 'in'} {', '.join(values)}",
+        f"df = df[{'~' if negate else ''}df[{column!r}].isin({values!r})]",
+        lambda frame: frame[~frame[column].isin(values) if negate else frame[column].isin(values)],
+    )
@@ -0,0 +1,375 @@
+# src/core/frames.py
+
+import atexit
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+from config import FRAME_CONFIG, PATHS
+
+# pyarrow writes spill files; without it frames over budget are dropped
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+# Integer dtypes tried in order when downcasting, smallest first
+INTEGER_DTYPES = (np.int8, np.int16, np.int32)
+
+def _is_text(column: pd.Series) -> bool:
+    """Whether a column holds strings (object, pandas string or Arrow string dtype)"""
+    dtype = column.dtype
+    if isinstance(dtype, pd.StringDtype):
+        return True
+    if isinstance(dtype, pd.ArrowDtype):
+        return pa is not None and (pa.types.is_string(dtype.pyarrow_dtype) or pa.types.is_large_string(dtype.pyarrow_dtype))
+    return dtype == object and pd.api.types.infer_dtype(column, skipna=True) == "string"
+
+def _compact_column(column: pd.Series, category_max_ratio: float) -> Optional[pd.Series]:
+    """Smaller-dtype copy of a column that restore_frame turns back into the same values, None to keep it"""
+    dtype = column.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in "iu":
+        if column.empty:
+            return None
+        low, high = column.min(), column.max()
+        for target in INTEGER_DTYPES:
+            info = np.iinfo(target)
+            if info.bits < dtype.itemsize * 8 and info.min <= low and high <= info.max:
+                return column.astype(target)
+        return None
+
+    if isinstance(dtype, np.dtype) and dtype == np.float64:
+        values = column.to_numpy()
+        with np.errstate(over="ignore"):
+            narrowed = values.astype(np.float32)
+        # Only when every value survives the round trip: float32 keeps ~7 significant digits
+        if np.array_equal(narrowed.astype(np.float64), values, equal_nan=True):
+            return pd.Series(narrowed, index=column.index, name=column.name)
+        return None
+
+    if _is_text(column) and column.nunique(dropna=True) <= category_max_ratio * len(column):
+        if dtype == object and column.isna().any():
+            return None  # None and NaN would both come back as NaN
+        return column.astype("category")
+    return None
+
+def compact_frame(
+    df: pd.DataFrame,
+    category_max_ratio: float = FRAME_CONFIG["category_max_ratio"],
+    min_rows: int = FRAME_CONFIG["min_rows"],
+) -> Tuple[pd.DataFrame, Dict[int, object]]:
+    """
+    Shrink the dtypes of a frame held at rest (see FrameStore)
+
+    Integers are downcast to the smallest dtype that holds them, float64
+    columns become float32 if that is lossless and low-cardinality text
+    becomes categorical. These dtypes change arithmetic (overflow, float32
+    sums) and text operations, so a compacted frame is never handed to
+    analyses: restore_frame turns it back into the frame as fetched.
+
+    Args:
+        df (pd.DataFrame): Frame to hold
+        category_max_ratio (float): Text columns with at most this share of
+            distinct values become categoricals
+        min_rows (int): Smaller frames are returned as they are
+
+    Returns:
+        Tuple[pd.DataFrame, Dict[int, object]]: The compacted frame, and the
+            original dtype of each changed column by position
+    """
+    if len(df) < min_rows:
+        return df, {}
+    compacted = df.copy(deep=False)
+    dtypes = {}
+    for position in range(df.shape[1]):
+        column = df.iloc[:, position]
+        try:
+            narrowed = _compact_column(column, category_max_ratio)
+        except (TypeError, ValueError):
+            narrowed = None  # e.g. unhashable values in an object column
+        if narrowed is not None:
+            compacted.isetitem(position, narrowed)
+            dtypes[position] = column.dtype
+    return (compacted, dtypes) if dtypes else (df, {})
+
+def restore_frame(df: pd.DataFrame, dtypes: Dict[int, object]) -> pd.DataFrame:
+    """Inverse of compact_frame: cast the changed columns back to their original dtypes"""
+    if not dtypes:
+        return df
+    restored = df.copy(deep=False)
+    for position, dtype in dtypes.items():
+        restored.isetitem(position, df.iloc[:, position].astype(dtype))
+    return restored
+
+
+class FrameStore:
+    def __init__(
+        self,
+        session_budget_bytes: int = FRAME_CONFIG["session_budget_bytes"],
+        process_budget_bytes: int = FRAME_CONFIG["process_budget_bytes"],
+        disk_budget_bytes: int = FRAME_CONFIG["disk_budget_bytes"],
+        spill_dir: Optional[str] = None,
+        compact: bool = FRAME_CONFIG["compact"],
+    ):
+        """
+        Result frames held by sessions, within a memory budget per session and
+        one for the whole process. Frames over budget, least recently used
+        first, are spilled to Arrow IPC files and read back memory-mapped, so
+        a spilled frame only occupies the pages that are touched.
+
+        Held frames are compacted (see compact_frame) and restored to their
+        fetched dtypes when read back, so callers always get the same values
+        and dtypes they stored.
+
+        Args:
+            session_budget_bytes (int): Memory held by one session's frames
+            process_budget_bytes (int): Memory held by all in-memory frames
+            disk_budget_bytes (int): Disk held by spilled frames; beyond it the
+                least recently used are dropped
+            spill_dir (Optional[str]): Directory for spill files, by default one
+                per process under PATHS["temp_dir"]
+            compact (bool): Compact held frames
+        """
+        if spill_dir is None:
+            spill_dir = os.path.join(PATHS["temp_dir"], "frames", str(os.getpid()))
+        self.session_budget_bytes = session_budget_bytes
+        self.process_budget_bytes = process_budget_bytes
+        self.disk_budget_bytes = disk_budget_bytes
+        self.spill_dir = spill_dir
+        self.compact = compact
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], dict]" = OrderedDict()
+        self._session_bytes: Dict[str, int] = {}
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._counters = {
+            "puts": 0,
+            "hits": 0,
+            "misses": 0,
+            "spills": 0,
+            "evictions": 0,
+            "bytes_saved": 0,
+        }
+
+        remove_stale_spill_dirs(os.path.dirname(spill_dir))
+        shutil.rmtree(spill_dir, ignore_errors=True)
+        os.makedirs(spill_dir, exist_ok=True)
+
+    def put(self, session_id: str, name: str, df: pd.DataFrame):
+        """
+        Hold a frame for a session, replacing the frame stored under the same name
+
+        Args:
+            session_id (str): Owning session
+            name (str): Name of the frame within the session
+            df (pd.DataFrame): Frame to hold
+        """
+        key = (session_id, name)
+        held, dtypes = compact_frame(df) if self.compact else (df, {})
+        entry = {
+            "df": held,
+            "path": None,
+            "bytes": int(held.memory_usage(deep=True).sum()),
+            "attrs": dict(df.attrs),
+            "dtypes": dtypes,
+            "spilling": False,
+        }
+        saved = int(df.memory_usage(deep=True).sum()) - entry["bytes"] if dtypes else 0
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = entry
+            self._session_bytes[session_id] = self._session_bytes.get(session_id, 0) + entry["bytes"]
+            self._memory_bytes += entry["bytes"]
+            self._counters["puts"] += 1
+            self._counters["bytes_saved"] += saved
+            victims = self._select_spills(session_id)
+        # Writing happens outside the lock; other sessions keep reading meanwhile
+        for victim_key, victim in victims:
+            self._spill(victim_key, victim)
+
+    def get(self, session_id: str, name: str) -> Optional[pd.DataFrame]:
+        """
+        Frame a session stored under `name`
+
+        Returns:
+            Optional[pd.DataFrame]: The frame (memory-mapped if it was spilled),
+                None if there is none or it was dropped to stay within budget
+        """
+        key = (session_id, name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            df, path = entry["df"], entry["path"]
+
+        if df is not None:
+            return restore_frame(df, entry["dtypes"]) if entry["dtypes"] else df.copy(deep=False)
+        try:
+            with pa.memory_map(path, "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+            # split_blocks keeps numeric columns as zero-copy views of the mapped file
+            df = table.to_pandas(split_blocks=True)
+        except Exception as e:
+            print(f"Error reading spilled frame: {e}")
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._drop(key)
+            return None
+        # Columns that were not compacted stay views of the mapped file
+        df = restore_frame(df, entry["dtypes"])
+        df.attrs.update(entry["attrs"])
+        return df
+
+    def drop(self, session_id: str, name: Optional[str] = None):
+        """Release one frame of a session, or all of them if `name` is None"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == session_id and name in (None, key[1])]:
+                self._drop(key)
+            if name is None:
+                self._session_bytes.pop(session_id, None)
+
+    def _drop(self, key: Tuple[str, str]):
+        """Remove an entry and its spill file. Caller holds the lock."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        if entry["path"] is not None:
+            self._disk_bytes -= entry["bytes"]
+            try:
+                os.remove(entry["path"])
+            except OSError:
+                pass
+        else:
+            self._memory_bytes -= entry["bytes"]
+            self._session_bytes[key[0]] -= entry["bytes"]
+        entry["df"] = None
+
+    def _select_spills(self, session_id: str) -> list:
+        """
+        Pick least recently used in-memory frames until the session's and the
+        process budget hold once they are spilled. Caller holds the lock.
+        """
+        session_bytes = self._session_bytes.get(session_id, 0)
+        memory_bytes = self._memory_bytes
+        victims = []
+        for key, entry in self._entries.items():
+            if session_bytes <= self.session_budget_bytes and memory_bytes <= self.process_budget_bytes:
+                break
+            if entry["path"] is not None or entry["spilling"]:
+                continue
+            over_session = key[0] == session_id and session_bytes > self.session_budget_bytes
+            if over_session or memory_bytes > self.process_budget_bytes:
+                entry["spilling"] = True
+                victims.append((key, entry))
+                memory_bytes -= entry["bytes"]
+                if key[0] == session_id:
+                    session_bytes -= entry["bytes"]
+        return victims
+
+    def _spill(self, key: Tuple[str, str], entry: dict):
+        """Write an in-memory frame to an Arrow IPC file and release its memory"""
+        path = None
+        if pa is not None:
+            path = os.path.join(self.spill_dir, f"{uuid.uuid4().hex}.arrow")
+            try:
+                table = pa.Table.from_pandas(entry["df"])
+                with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            except Exception as e:
+                # e.g. mixed-type object columns Arrow cannot represent: the frame is dropped
+                print(f"Error spilling frame: {e}")
+                path = None
+
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                # Replaced or dropped while it was being written
+                if path is not None:
+                    os.remove(path)
+                return
+            self._drop(key)
+            if path is None:
+                self._counters["evictions"] += 1
+                return
+            entry.update(df=None, path=path, bytes=os.path.getsize(path), spilling=False)
+            self._entries[key] = entry
+            self._entries.move_to_end(key, last=False)  # keeps its place as least recently used
+            self._disk_bytes += entry["bytes"]
+            self._counters["spills"] += 1
+            self._evict_spilled()
+
+    def _evict_spilled(self):
+        """Drop least recently used spilled frames beyond the disk budget. Caller holds the lock."""
+        for key in list(self._entries):
+            if self._disk_bytes <= self.disk_budget_bytes:
+                break
+            if self._entries[key]["path"] is not None:
+                self._drop(key)
+                self._counters["evictions"] += 1
+
+    def stats(self, session_id: Optional[str] = None) -> Dict[str, int]:
+        """
+        Snapshot of store counters and usage
+
+        Args:
+            session_id (Optional[str]): Also report this session's frames
+
+        Returns:
+            Dict[str, int]: Puts, hits, misses, spills, evictions, bytes saved by
+                compaction, and memory and disk held
+        """
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot["frames"] = len(self._entries)
+            snapshot["memory_bytes"] = self._memory_bytes
+            snapshot["disk_bytes"] = self._disk_bytes
+            if session_id is not None:
+                entries = [entry for key, entry in self._entries.items() if key[0] == session_id]
+                snapshot["session_frames"] = len(entries)
+                snapshot["session_memory_bytes"] = self._session_bytes.get(session_id, 0)
+                snapshot["session_disk_bytes"] = sum(entry["bytes"] for entry in entries if entry["path"] is not None)
+        return snapshot
+
+    def close(self):
+        """Release all frames and remove the spill directory"""
+        with self._lock:
+            self._entries.clear()
+            self._session_bytes.clear()
+            self._memory_bytes = self._disk_bytes = 0
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+def remove_stale_spill_dirs(parent: str):
+    """Remove per-process spill directories (named by pid) under `parent` whose process is no longer running"""
+    if not os.path.isdir(parent):
+        return
+    for name in os.listdir(parent):
+        if not name.isdigit() or int(name) == os.getpid():
+            continue
+        try:
+            os.kill(int(name), 0)
+        except ProcessLookupError:
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+        except OSError:
+            pass  # running, under another user
+
+
+# Create a singleton instance shared by all sessions of the process
+_frame_store = None
+_frame_store_lock = threading.Lock()
+
+def get_frame_store() -> FrameStore:
+    """Get or create the shared FrameStore"""
+    global _frame_store
+    with _frame_store_lock:
+        if _frame_store is None:
+            _frame_store = FrameStore()
+            atexit.register(_frame_store.close)
+        return _frame_store
@@ -1,8 +1,12 @@
 # src/utils/helpers.py
 
 import re
+import json
+import hashlib
+import unicodedata
 import sqlparse
-from typing import Optional, Tuple
+from sqlparse import tokens as T
+from typing import List, Optional, Tuple
 
 def extract_python_code(text: str) -> str:
     """
@@ -45,6 +49,77 @@ def clean_sql_response(sql_response: str) -> str:
 
     return cleaned_query
 
+_SQL_START = re.compile(r"^\s*(SELECT|WITH|VALUES|TABLE|EXPLAIN)\b", re.IGNORECASE)
+_DOLLAR_QUOTE = re.compile(r"\$[A-Za-z_]*\$")
+
+def complete_sql_statement(text: str) -> Optional[str]:
+    """
+    Detect a finished SQL statement in partially generated LLM output
+
+    The statement ends at a semicolon or a closing markdown fence that sits
+    outside string literals, quoted identifiers, dollar quotes, comments and
+    parentheses. Text after it (explanations) is not needed.
+
+    Args:
+        text (str): Output generated so far
+
+    Returns:
+        Optional[str]: The complete statement without its terminator, None if
+            the output does not contain one yet
+    """
+    body = text
+    fence = body.find("```")
+    if fence >= 0:
+        newline = body.find("\n", fence)
+        if newline < 0:
+            return None
+        body = body[newline + 1:]
+
+    depth, quote, i = 0, None, 0
+    while i < len(body):
+        char = body[i]
+        if quote is not None:
+            if quote in ("'", '"'):
+                if char == quote:
+                    if body.startswith(quote, i + 1):
+                        i += 2  # doubled quote inside a literal
+                        continue
+                    quote = None
+            elif quote == "--":
+                if char == "\n":
+                    quote = None
+            elif quote == "/*":
+                if body.startswith("*/", i):
+                    quote = None
+                    i += 2
+                    continue
+            elif body.startswith(quote, i):  # dollar quote tag
+                i += len(quote)
+                quote = None
+                continue
+            i += 1
+            continue
+
+        if char in ("'", '"'):
+            quote = char
+        elif body.startswith("--", i) or body.startswith("/*", i):
+            quote = body[i:i + 2]
+            i += 2
+            continue
+        elif char == "$" and _DOLLAR_QUOTE.match(body, i):
+            quote = _DOLLAR_QUOTE.match(body, i).group(0)
+            i += len(quote)
+            continue
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0 and (char == ";" or body.startswith("```", i)):
+            statement = body[:i].strip()
+            return statement if _SQL_START.match(statement) else None
+        i += 1
+    return None
+
 def validate_sql_syntax(sql_query: str) -> Tuple[bool, Optional[str]]:
     """
     Validates the basic syntax of the SQL query using sqlparse.
@@ -73,3 +148,239 @@ def validate_sql_syntax(sql_query: str) -> Tuple[bool, Optional[str]]:
     except Exception as e:
         # sqlparse might raise errors on severely malformed queries
         return False, f"Syntax validation error: {str(e)}"
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a natural language question so trivially different phrasings
+    (case, whitespace, trailing punctuation) share a cache key
+
+    Args:
+        question (str): The user's question.
+
+    Returns:
+        str: The normalized question.
+    """
+    question = unicodedata.normalize("NFKC", question).casefold()
+    question = re.sub(r"\s+", " ", question).strip()
+    return question.rstrip("?.! ")
+
+def schema_fingerprint(table_statement: str) -> str:
+    """
+    Hash a schema text as returned by DatabaseManager.get_table_schema
+
+    Args:
+        table_statement (str): CREATE TABLE statement(s).
+
+    Returns:
+        str: Hex digest that changes whenever the schema text changes.
+    """
+    return hashlib.sha256(table_statement.strip().encode()).hexdigest()
+
+def schema_tables(table_statement: str) -> list:
+    """
+    Extract the table names declared in CREATE TABLE statements
+
+    Args:
+        table_statement (str): CREATE TABLE statement(s).
+
+    Returns:
+        list: Sorted table names.
+    """
+    return sorted(set(re.findall(r"CREATE TABLE\s+(\S+)\s*\(", table_statement, re.IGNORECASE)))
+
+def normalize_sql(sql_query: str) -> str:
+    """
+    Normalize SQL text for use as a cache key: comments dropped, keywords
+    upper-cased, whitespace outside of literals collapsed, trailing
+    semicolons removed
+
+    Args:
+        sql_query (str): The SQL query.
+
+    Returns:
+        str: The normalized SQL query.
+    """
+    parts = []
+    tokens = [token for statement in sqlparse.parse(sql_query.strip()) for token in statement.flatten()]
+    for token in tokens:
+        if token.ttype in T.Comment:
+            continue
+        if token.is_whitespace:
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+            continue
+        parts.append(token.value.upper() if token.is_keyword else token.value)
+    return "".join(parts).strip().rstrip(";").strip()
+
+def sql_shape(sql_query: str) -> str:
+    """
+    Normalize SQL text with its literals replaced by `?`, so queries that
+    differ only in constants (e.g. the year filtered on) share one shape
+
+    Args:
+        sql_query (str): The SQL query.
+
+    Returns:
+        str: The normalized query with numbers and strings as `?` and
+        IN lists collapsed to `IN (?)`.
+    """
+    parts = []
+    tokens = [token for statement in sqlparse.parse(sql_query.strip()) for token in statement.flatten()]
+    for token in tokens:
+        if token.ttype in T.Comment:
+            continue
+        if token.is_whitespace:
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+            continue
+        if token.ttype in T.Literal.Number or token.ttype in T.Literal.String.Single:
+            parts.append("?")
+            continue
+        parts.append(token.value.upper() if token.is_keyword else token.value)
+    shape = "".join(parts).strip().rstrip(";").strip()
+    return re.sub(r"\(\s*\?(?:\s*,\s*\?)*\s*\)", "(?)", shape)
+
+# Functions whose result changes between executions of the same query
+VOLATILE_FUNCTIONS = {
+    "random", "now", "clock_timestamp", "statement_timestamp", "transaction_timestamp",
+    "timeofday", "nextval", "setval", "gen_random_uuid", "uuid_generate_v4",
+    "current_timestamp", "current_date", "current_time", "localtime", "localtimestamp",
+}
+
+# PostgreSQL reserved key words; sqlparse also tags many non-reserved words
+# (e.g. "events", "data") as keywords even though they are valid table names
+RESERVED_WORDS = set("""
+ALL ANALYSE ANALYZE AND ANY ARRAY AS ASC ASYMMETRIC AUTHORIZATION BINARY BOTH CASE CAST CHECK
+COLLATE COLLATION COLUMN CONCURRENTLY CONSTRAINT CREATE CROSS CURRENT_CATALOG CURRENT_DATE
+CURRENT_ROLE CURRENT_SCHEMA CURRENT_TIME CURRENT_TIMESTAMP CURRENT_USER DEFAULT DEFERRABLE DESC
+DISTINCT DO ELSE END EXCEPT FALSE FETCH FOR FOREIGN FREEZE FROM FULL GRANT GROUP HAVING ILIKE IN
+INITIALLY INNER INTERSECT INTO IS ISNULL JOIN LATERAL LEADING LEFT LIKE LIMIT LOCALTIME
+LOCALTIMESTAMP NATURAL NOT NOTNULL NULL OFFSET ON ONLY OR ORDER OUTER OVERLAPS PLACING PRIMARY
+REFERENCES RETURNING RIGHT SELECT SESSION_USER SIMILAR SOME SYMMETRIC TABLE TABLESAMPLE THEN TO
+TRAILING TRUE UNION UNIQUE USER USING VARIADIC VERBOSE WHEN WHERE WINDOW WITH
+""".split())
+
+def is_identifier_token(token) -> bool:
+    """
+    Whether a flattened sqlparse token can be an identifier (table, column or alias name)
+
+    Args:
+        token: A token from sqlparse's `flatten()`.
+
+    Returns:
+        bool: True for names, quoted names and non-reserved key words.
+    """
+    if token.ttype in T.Name or token.ttype in T.Literal.String.Symbol:
+        return True
+    if token.is_keyword:
+        words = token.value.upper().split()
+        return len(words) == 1 and words[0] not in RESERVED_WORDS
+    return False
+
+def referenced_tables(sql_query: str) -> Tuple[List[str], bool]:
+    """
+    Find the relations a query reads from (names following FROM or JOIN),
+    excluding names of common table expressions
+
+    Args:
+        sql_query (str): The SQL query.
+
+    Returns:
+        Tuple[List[str], bool]: (sorted relation names, deterministic) where
+        schema-qualified names read "schema.relation" and deterministic is False if the query reads from a set-returning function
+        or calls a volatile function such as now() or random().
+    """
+    tokens = [
+        token for statement in sqlparse.parse(sql_query)
+        for token in statement.flatten()
+        if not token.is_whitespace and token.ttype not in T.Comment
+    ]
+    cte_names = {
+        name.lower() for name in re.findall(r"(?:\bWITH(?:\s+RECURSIVE)?|,)\s*(\w+)\s+AS\s*\(", sql_query, re.IGNORECASE)
+    }
+
+    tables = set()
+    deterministic = True
+    in_from_list = [False]  # one flag per parenthesis depth
+    # Per depth: whether FROM and JOIN there read relations. Not inside function
+    # calls and expressions, e.g. EXTRACT(YEAR FROM ts) or trim(both ' ' from s)
+    reads_relations = [True]
+    expecting_relation = False
+    for i, token in enumerate(tokens):
+        value = token.value.lower()
+        following = tokens[i + 1].value if i + 1 < len(tokens) else ""
+
+        if (token.ttype in T.Name or token.is_keyword) and value.strip('"') in VOLATILE_FUNCTIONS:
+            deterministic = False
+
+        if token.value == "(":
+            subquery = following.lower() in ("select", "with")
+            # A parenthesis where a relation is expected groups joins: FROM (a JOIN b ON ...)
+            join_group = expecting_relation and not subquery
+            in_from_list.append(join_group)
+            reads_relations.append(subquery or join_group)
+            expecting_relation = join_group
+        elif token.value == ")":
+            if len(in_from_list) > 1:
+                in_from_list.pop()
+                reads_relations.pop()
+            expecting_relation = False
+        elif token.value == ",":
+            expecting_relation = in_from_list[-1]
+        elif expecting_relation and is_identifier_token(token):
+            expecting_relation = False
+            if following == "(":
+                deterministic = False  # set-returning function in FROM
+                continue
+            # Unquoted identifiers are case-folded by PostgreSQL; schema-qualified
+            # names keep their schema as "schema.relation"
+            name = token.value.strip('"') if token.value.startswith('"') else token.value.lower()
+            if following == "." and i + 2 < len(tokens):
+                relation = tokens[i + 2].value
+                relation = relation.strip('"') if relation.startswith('"') else relation.lower()
+                tables.add(f"{name}.{relation}")
+            elif name.lower() not in cte_names:
+                tables.add(name)
+        elif token.is_keyword:
+            if (value == "from" or value.endswith("join")) and reads_relations[-1]:
+                in_from_list[-1] = True
+                expecting_relation = True
+            elif value not in ("as", "only", "lateral"):
+                in_from_list[-1] = False
+                expecting_relation = False
+
+    return sorted(tables), deterministic
+
+def to_json_value(value, preview_rows: int = 50):
+    """
+    Convert an analysis result to something json.dumps accepts
+
+    Args:
+        value: Result of analysis code
+        preview_rows (int): Rows of a DataFrame or Series kept
+
+    Returns:
+        DataFrames and Series as {"type", "shape", "columns", "rows"} with the
+        first rows as records, numpy scalars as Python numbers, anything else
+        JSON cannot hold as its repr
+    """
+    import pandas as pd
+    if isinstance(value, pd.Series):
+        value = value.to_frame()
+    if isinstance(value, pd.DataFrame):
+        return {
+            "type": "dataframe",
+            "shape": list(value.shape),
+            "columns": [str(column) for column in value.columns],
+            "rows": json.loads(value.head(preview_rows).to_json(orient="records", date_format="iso", default_handler=str)),
+        }
+    if hasattr(value, "item") and callable(value.item):
+        try:
+            value = value.item()  # numpy scalar
+        except (TypeError, ValueError):
+            pass
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return repr(value)
@@ -0,0 +1,497 @@
+# src/core/llm_backends.py
+
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Iterator, List, Optional
+from config import MODEL_CONFIG
+
+class LLMBackend:
+    """Interface of a text generation engine behind LLMModel"""
+
+    name = "base"
+
+    def generate(self, prompt: str, max_new_tokens: int, temperature: Optional[float] = None) -> str:
+        """
+        Generate a completion
+
+        Args:
+            prompt (str): Input prompt
+            max_new_tokens (int): Maximum number of tokens to generate
+            temperature (Optional[float]): Sampling temperature, backend default if None
+
+        Returns:
+            str: Generated text, or a string starting with "Error:" if generation failed
+        """
+        raise NotImplementedError
+
+    def stream(self, prompt: str, max_new_tokens: int, temperature: Optional[float] = None) -> Iterator[str]:
+        """
+        Generate a completion as a stream of text chunks. Closing the
+        iterator stops generation. Backends without streaming yield the
+        whole completion at once.
+
+        Args:
+            prompt (str): Input prompt
+            max_new_tokens (int): Maximum number of tokens to generate
+            temperature (Optional[float]): Sampling temperature, backend default if None
+
+        Yields:
+            str: The next piece of generated text
+        """
+        yield self.generate(prompt, max_new_tokens, temperature)
+
+    async def agenerate(self, prompt: str, max_new_tokens: int, temperature: Optional[float] = None) -> str:
+        """
+        Async variant of generate. Backends without native async support
+        run generate in a worker thread.
+        """
+        import asyncio  # only the async API needs it
+        return await asyncio.to_thread(self.generate, prompt, max_new_tokens, temperature)
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Count the tokens of a prompt. Without a local tokenizer this is an
+        estimate: words and punctuation count one token, long words one per
+        four characters.
+        """
+        return sum(max(1, len(piece) // 4) for piece in re.findall(r"\w+|[^\w\s]", text))
+
+    def stats(self) -> Dict[str, float]:
+        """Backend counters for the UI"""
+        return {}
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self, model_name: str = MODEL_CONFIG["gemini_model_name"]):
+        """
+        Google Gemini over the network
+
+        Args:
+            model_name (str): Gemini model, e.g. 'gemini-1.5-flash' or 'gemini-pro'
+        """
+        import google.generativeai as genai
+
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY environment variable not set.")
+        try:
+            genai.configure(api_key=api_key)
+            self.model = genai.GenerativeModel(model_name)
+            print("Gemini model configured successfully.")
+        except Exception as e:
+            raise RuntimeError(f"Failed to configure Gemini: {str(e)}")
+
+    def generate(self, prompt: str, max_new_tokens: int, temperature: Optional[float] = None) -> str:
+        try:
+            generation_config = {"temperature": temperature} if temperature is not None else None
+            response = self.model.generate_content(prompt, generation_config=generation_config)
+            if response.parts:
+                return response.text.strip()
+            # Handle cases where the response might be blocked or empty
+            safety_feedback = response.prompt_feedback if hasattr(response, 'prompt_feedback') else 'N/A'
+            finish_reason = response.candidates[0].finish_reason if response.candidates else 'N/A'
+            print(f"Warning: Gemini response was empty or blocked. Finish Reason: {finish_reason}, Safety Feedback: {safety_feedback}")
+            return f"Error: Failed to get response from Gemini. Finish Reason: {finish_reason}"
+        except Exception as e:
+            print(f"Error during Gemini API call: {str(e)}")
+            return f"Error: Exception during Gemini API call: {str(e)}"
+
+    async def agenerate(self, prompt: str, max_new_tokens: int, temperature: Optional[float] = None) -> str:
+        generation_config = {"max_output_tokens": max_new_tokens}
+        if temperature is not None:
+            generation_config["temperature"] = temperature
+        try:
+            response = await self.model.generate_content_async(prompt, generation_config=generation_config)
+            if response.parts:
+                return response.text.strip()
+            finish_reason = response.candidates[0].finish_reason if response.candidates else 'N/A'
+            print(f"Warning: Gemini response was empty or blocked. Finish Reason: {finish_reason}")
+            return f"Error: Failed to get response from Gemini. Finish Reason: {finish_reason}"
+        except Exception as e:
+            print(f"Error during Gemini API call: {str(e)}")
+            return f"Error: Exception during Gemini API call: {str(e)}"
+
+    def stream(self, prompt: str, max_new_tokens: int, temperature: Optional[float] = None) -> Iterator[str]:
+        generation_config = {"max_output_tokens": max_new_tokens}
+        if temperature is not None:
+            generation_config["temperature"] = temperature
+        try:
+            response = self.model.generate_content(prompt, generation_config=generation_config, stream=True)
+            for chunk in response:
+                # Leaving the loop early (the consumer closed us) drops the HTTP stream
+                if chunk.parts:
+                    yield chunk.text
+        except Exception as e:
+            print(f"Error during Gemini API call: {str(e)}")
+            yield f"Error: Exception during Gemini API call: {str(e)}"
+
+
+class _Request:
+    def __init__(self, prompt: str, max_new_tokens: int, temperature: Optional[float]):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.future: Future = Future()
+        self.input_ids: List[int] = []
+        self.chunks: Optional["queue.Queue[Optional[str]]"] = None  # set for streaming requests
+        self.cancelled = False  # set by the consumer to stop decoding this row
+
+
+class PrefixKVCache:
+    def __init__(self, max_entries: int):
+        """
+        LRU of prompt key/value tensors, keyed by token ids. A new prompt
+        reuses the longest token prefix it shares with any stored prompt,
+        so the static instruction and schema block at the start of the SQL
+        prompt is only run through the model once per schema.
+
+        Args:
+            max_entries (int): Prompts kept
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _common_length(a, b) -> int:
+        length = min(len(a), len(b))
+        for i in range(length):
+            if a[i] != b[i]:
+                return i
+        return length
+
+    def match(self, input_ids: List[int]):
+        """
+        Find the stored prompt sharing the longest prefix with `input_ids`
+
+        Returns:
+            Tuple[int, Optional[tuple]]: Shared length and the stored legacy
+                ((key, value), ...) tensors, batch size 1, covering at least that length
+        """
+        best_length, best_key = 0, None
+        with self._lock:
+            for key in self._entries:
+                length = self._common_length(key, input_ids)
+                if length > best_length:
+                    best_length, best_key = length, key
+            if best_key is None:
+                return 0, None
+            self._entries.move_to_end(best_key)
+            return best_length, self._entries[best_key]
+
+    def store(self, input_ids: List[int], layers: tuple):
+        """Remember the key/value tensors of a prompt"""
+        with self._lock:
+            self._entries[tuple(input_ids)] = layers
+            self._entries.move_to_end(tuple(input_ids))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class TransformersBackend(LLMBackend):
+    name = "local"
+
+    def __init__(
+        self,
+        model_name: str = MODEL_CONFIG["model_name"],
+        device: Optional[str] = MODEL_CONFIG["device"],
+        max_batch_size: int = MODEL_CONFIG["max_batch_size"],
+        batch_window_ms: float = MODEL_CONFIG["batch_window_ms"],
+        prefix_cache_entries: int = MODEL_CONFIG["prefix_cache_entries"],
+        min_prefix_tokens: int = MODEL_CONFIG["min_prefix_tokens"],
+    ):
+        """
+        Local Hugging Face causal LM, CPU capable
+
+        Requests from all sessions go through one scheduler thread, which
+        gathers prompts arriving within `batch_window_ms` into a single
+        forward pass per decoding step. The prompt prefix shared by the batch
+        is restored from the PrefixKVCache instead of being recomputed.
+
+        Args:
+            model_name (str): Hugging Face model id or local path
+            device (Optional[str]): "cpu", "cuda", ...; picked automatically if None
+            max_batch_size (int): Prompts decoded together at most
+            batch_window_ms (float): How long the scheduler waits for more prompts
+            prefix_cache_entries (int): Prompts whose key/value tensors are kept
+            min_prefix_tokens (int): Shorter shared prefixes are recomputed
+        """
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        self.torch = torch
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        dtype = torch.float16 if self.device.startswith("cuda") else torch.float32
+        try:
+            self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+            self.model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=dtype).to(self.device)
+            self.model.eval()
+        except Exception as e:
+            raise RuntimeError(f"Failed to load local model {model_name}: {str(e)}")
+        if self.tokenizer.pad_token_id is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        print(f"Local model {model_name} loaded on {self.device}.")
+
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window_ms / 1000.0
+        self.min_prefix_tokens = min_prefix_tokens
+        self.prefix_cache = PrefixKVCache(prefix_cache_entries)
+
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0,
+            "batches": 0,
+            "prompt_tokens": 0,
+            "reused_prefix_tokens": 0,
+            "generated_tokens": 0,
+        }
+        self._scheduler = threading.Thread(target=self._schedule, name="llm-batcher", daemon=True)
+        self._scheduler.start()
+
+    def _encode(self, prompt: str) -> List[int]:
+        """Apply the chat template (if the model has one) and tokenize"""
+        if getattr(self.tokenizer, "chat_template", None):
+            encoded = self.tokenizer.apply_chat_template(
+                [{"role": "user", "content": prompt}], add_generation_prompt=True, tokenize=True
+            )
+            return list(encoded["input_ids"] if hasattr(encoded, "keys") else encoded)
+        return self.tokenizer(prompt)["input_ids"]
+
+    def count_tokens(self, text: str) -> int:
+        return len(self._encode(text))
+
+    def generate(self, prompt: str, max_new_tokens: int, temperature: Optional[float] = None) -> str:
+        request = _Request(prompt, max_new_tokens, temperature)
+        self._queue.put(request)
+        try:
+            return request.future.result()
+        except Exception as e:
+            print(f"Error during local generation: {str(e)}")
+            return f"Error: Exception during local generation: {str(e)}"
+
+    async def agenerate(self, prompt: str, max_new_tokens: int, temperature: Optional[float] = None) -> str:
+        import asyncio
+        request = _Request(prompt, max_new_tokens, temperature)
+        self._queue.put(request)
+        try:
+            # Awaits the batcher's future without tying up a thread
+            return await asyncio.wrap_future(request.future)
+        except asyncio.CancelledError:
+            request.cancelled = True  # the row stops at the next decoding step
+            raise
+        except Exception as e:
+            print(f"Error during local generation: {str(e)}")
+            return f"Error: Exception during local generation: {str(e)}"
+
+    def stream(self, prompt: str, max_new_tokens: int, temperature: Optional[float] = None) -> Iterator[str]:
+        request = _Request(prompt, max_new_tokens, temperature)
+        request.chunks = queue.Queue()
+        self._queue.put(request)
+        try:
+            while True:
+                chunk = request.chunks.get()
+                if chunk is None:
+                    break
+                yield chunk
+            request.future.result()
+        except GeneratorExit:
+            request.cancelled = True  # the row stops at the next decoding step
+            raise
+        except Exception as e:
+            print(f"Error during local generation: {str(e)}")
+            yield f"Error: Exception during local generation: {str(e)}"
+
+    def _schedule(self):
+        """Scheduler thread: gather concurrent requests into batches"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                texts = self._generate_batch(batch)
+                for request, text in zip(batch, texts):
+                    if not request.future.done():  # an async caller may have cancelled it
+                        request.future.set_result(text)
+            except Exception as e:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+            for request in batch:
+                if request.chunks is not None:
+                    request.chunks.put(None)
+
+    def _to_cache(self, layers: tuple):
+        """Wrap legacy ((key, value), ...) tensors in the cache class the model expects"""
+        try:
+            from transformers import DynamicCache
+        except ImportError:
+            return layers
+        if hasattr(DynamicCache, "from_legacy_cache"):
+            return DynamicCache.from_legacy_cache(layers)
+        return DynamicCache(layers)  # transformers 5 dropped the legacy conversions
+
+    @staticmethod
+    def _to_layers(past) -> tuple:
+        """Inverse of _to_cache"""
+        if hasattr(past, "to_legacy_cache"):
+            return past.to_legacy_cache()
+        if hasattr(past, "layers"):
+            return tuple((layer.keys, layer.values) for layer in past.layers)
+        # Entries may carry more than (key, value), e.g. a sliding window size
+        return tuple(tuple(entry[:2]) for entry in past)
+
+    def _generate_batch(self, batch: List[_Request]) -> List[str]:
+        """Decode a batch of prompts together, reusing their shared cached prefix"""
+        torch = self.torch
+        for request in batch:
+            request.input_ids = self._encode(request.prompt)
+
+        # Prefix shared by every prompt in the batch, limited to what is cached
+        shared = min(len(request.input_ids) for request in batch) - 1  # keep at least one token to run
+        first = batch[0].input_ids
+        for request in batch[1:]:
+            shared = min(shared, PrefixKVCache._common_length(first, request.input_ids))
+        reused, layers = self.prefix_cache.match(first[:shared])
+        reused = min(reused, shared)
+        if reused < self.min_prefix_tokens:
+            reused, layers = 0, None
+
+        # Suffixes are left padded so the prompts end together; the padding
+        # sits between the cached prefix and the suffix and is masked out
+        suffixes = [request.input_ids[reused:] for request in batch]
+        width = max(len(suffix) for suffix in suffixes)
+        pad_id = self.tokenizer.pad_token_id
+        input_ids = torch.tensor(
+            [[pad_id] * (width - len(suffix)) + suffix for suffix in suffixes], device=self.device
+        )
+        attention_mask = torch.tensor(
+            [[1] * reused + [0] * (width - len(suffix)) + [1] * len(suffix) for suffix in suffixes],
+            device=self.device,
+        )
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, reused:]
+
+        past = None
+        if layers is not None:
+            rows = len(batch)
+            past = self._to_cache(tuple(
+                (key[:, :, :reused].expand(rows, -1, -1, -1).contiguous(),
+                 value[:, :, :reused].expand(rows, -1, -1, -1).contiguous())
+                for key, value in layers
+            ))
+
+        max_new_tokens = max(request.max_new_tokens for request in batch)
+        eos_ids = self.tokenizer.eos_token_id
+        eos_ids = set(eos_ids if isinstance(eos_ids, list) else [eos_ids])
+        generated = [[] for _ in batch]
+        emitted = [""] * len(batch)
+        finished = [False] * len(batch)
+        prompt_layers = None
+
+        with torch.no_grad():
+            for step in range(max_new_tokens):
+                outputs = self.model(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    position_ids=position_ids,
+                    past_key_values=past,
+                    use_cache=True,
+                )
+                past = outputs.past_key_values
+                if step == 0:
+                    prompt_layers = self._to_layers(past)
+                logits = outputs.logits[:, -1, :].float()
+
+                next_tokens = []
+                for row, request in enumerate(batch):
+                    if request.temperature:
+                        probs = torch.softmax(logits[row] / request.temperature, dim=-1)
+                        token = int(torch.multinomial(probs, 1))
+                    else:
+                        token = int(torch.argmax(logits[row]))
+                    if finished[row]:
+                        token = pad_id
+                    elif token in eos_ids or len(generated[row]) >= request.max_new_tokens or request.cancelled:
+                        finished[row] = True
+                        token = pad_id
+                    else:
+                        generated[row].append(token)
+                        if request.chunks is not None:
+                            # Decode the whole row so multi-token characters come out whole
+                            text = self.tokenizer.decode(generated[row], skip_special_tokens=True)
+                            if len(text) > len(emitted[row]) and not text.endswith("\ufffd"):
+                                request.chunks.put(text[len(emitted[row]):])
+                                emitted[row] = text
+                    next_tokens.append(token)
+                if all(finished):
+                    break
+
+                input_ids = torch.tensor(next_tokens, device=self.device).unsqueeze(-1)
+                attention_mask = torch.cat(
+                    [attention_mask, torch.tensor([[0 if done else 1] for done in finished], device=self.device)],
+                    dim=-1,
+                )
+                position_ids = position_ids[:, -1:] + 1
+
+        # Store each prompt's key/value tensors without the padding columns
+        for row, request in enumerate(batch):
+            keep = attention_mask[row, :reused + width].bool()
+            self.prefix_cache.store(request.input_ids, tuple(
+                (key[row:row + 1, :, keep].clone(), value[row:row + 1, :, keep].clone())
+                for key, value in prompt_layers
+            ))
+
+        with self._lock:
+            self._counters["requests"] += len(batch)
+            self._counters["batches"] += 1
+            self._counters["prompt_tokens"] += sum(len(request.input_ids) for request in batch)
+            self._counters["reused_prefix_tokens"] += reused * len(batch)
+            self._counters["generated_tokens"] += sum(len(tokens) for tokens in generated)
+
+        return [self.tokenizer.decode(tokens, skip_special_tokens=True).strip() for tokens in generated]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            snapshot = dict(self._counters)
+        snapshot["cached_prefixes"] = len(self.prefix_cache)
+        snapshot["mean_batch_size"] = snapshot["requests"] / snapshot["batches"] if snapshot["batches"] else 0.0
+        return snapshot
+
+
+def create_backend(model_type: str) -> LLMBackend:
+    """
+    Build the backend for a MODEL_TYPE
+
+    Args:
+        model_type (str): "gemini", "local" (MODEL_CONFIG["model_name"]) or
+            "tiny" (a tiny random model on CPU, for tests and smoke runs)
+
+    Returns:
+        LLMBackend: The configured backend
+    """
+    if model_type == "gemini":
+        return GeminiBackend()
+    if model_type == "local":
+        return TransformersBackend()
+    if model_type == "tiny":
+        return TransformersBackend(model_name=MODEL_CONFIG["tiny_model_name"], device="cpu", min_prefix_tokens=1)
+    raise ValueError(f"Unknown MODEL_TYPE '{model_type}', expected 'gemini', 'local' or 'tiny'.")
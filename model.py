@@ -1,71 +1,188 @@
-import os
+import importlib
+import threading
+import time
+from typing import Callable, Optional, Tuple
 from dotenv import load_dotenv
-import google.generativeai as genai
+from config import MODEL_CONFIG
+from llm_backends import LLMBackend, create_backend
+from tracing import span
 
 load_dotenv()
 
 class LLMModel:
     def __init__(self):
         """Initialize the LLM model with configurations based on environment variables"""
-        self.model_type = os.getenv("MODEL_TYPE", "gemini")  # 'local' or 'gemini'
-        self.model = None
-        self.tokenizer = None
-        self.device = None  # Only set for local models
+        self.model_type = MODEL_CONFIG["type"]  # 'gemini', 'local' or 'tiny'
+        self.backend: Optional[LLMBackend] = None
         self.setup_model()
 
     def setup_model(self):
-        """Set up the model based on self.model_type"""
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY environment variable not set.")
-        try:
-            genai.configure(api_key=api_key)
-            # Choose a suitable Gemini model, e.g., 'gemini-1.5-flash' or 'gemini-pro'
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-            print("Gemini model configured successfully.")
-        except Exception as e:
-            raise RuntimeError(f"Failed to configure Gemini: {str(e)}")
-
-    def generate_response(self, prompt: str, max_new_tokens: int = 2048) -> str:
+        """Set up the backend for self.model_type"""
+        self.backend = create_backend(self.model_type)
+
+    def generate_response(self, prompt: str, max_new_tokens: int = MODEL_CONFIG["max_new_tokens"], temperature: Optional[float] = None) -> str:
         """
         Generate response from the configured model for a given prompt
 
         Args:
             prompt (str): Input prompt for the model
             max_new_tokens (int): Maximum number of tokens to generate (used by local model)
+            temperature (Optional[float]): Sampling temperature, model default if None
 
         Returns:
             str: Generated response
         """
+        with span("llm.generate", backend=self.model_type) as current:
+            response = self.backend.generate(prompt, max_new_tokens, temperature)
+            current.set(response_tokens=self.count_tokens(response))
+            return response
+
+    async def agenerate_response(self, prompt: str, max_new_tokens: int = MODEL_CONFIG["max_new_tokens"], temperature: Optional[float] = None) -> str:
+        """
+        Async variant of generate_response: waits for the model without
+        blocking the event loop. Cancelling the awaiting task stops local
+        generation at the next decoding step.
+
+        Args:
+            prompt (str): Input prompt for the model
+            max_new_tokens (int): Maximum number of tokens to generate
+            temperature (Optional[float]): Sampling temperature, model default if None
+
+        Returns:
+            str: Generated response
+        """
+        with span("llm.generate", backend=self.model_type, asynchronous=True) as current:
+            response = await self.backend.agenerate(prompt, max_new_tokens, temperature)
+            current.set(response_tokens=self.count_tokens(response))
+            return response
+
+    def generate_streaming(
+        self,
+        prompt: str,
+        on_text: Optional[Callable[[str], None]] = None,
+        stop_when: Optional[Callable[[str], Optional[str]]] = None,
+        max_new_tokens: int = MODEL_CONFIG["max_new_tokens"],
+        temperature: Optional[float] = None
+    ) -> Tuple[str, dict]:
+        """
+        Generate a response token by token
+
+        Args:
+            prompt (str): Input prompt for the model
+            on_text (Optional[Callable[[str], None]]): Called with the text generated so far after every chunk
+            stop_when (Optional[Callable[[str], Optional[str]]]): Called with the text so far; returning
+                a string stops generation and makes that string the response
+            max_new_tokens (int): Maximum number of tokens to generate
+            temperature (Optional[float]): Sampling temperature, model default if None
+
+        Returns:
+            Tuple[str, dict]:
+                - Generated response
+                - Timings: ttfb_seconds (first chunk), total_seconds, stopped_early
+        """
+        with span("llm.generate", backend=self.model_type, streaming=True) as current:
+            text, timings = self._stream(prompt, on_text, stop_when, max_new_tokens, temperature)
+            current.set(
+                response_tokens=self.count_tokens(text),
+                ttfb_ms=round(timings["ttfb_seconds"] * 1000, 3),
+                stopped_early=timings["stopped_early"],
+            )
+            return text, timings
+
+    def _stream(self, prompt, on_text, stop_when, max_new_tokens, temperature) -> Tuple[str, dict]:
+        """Body of generate_streaming, run inside its span"""
+        started = time.perf_counter()
+        ttfb = None
+        text = ""
+        stopped_early = False
+        chunks = self.backend.stream(prompt, max_new_tokens, temperature)
         try:
-                response = self.model.generate_content(prompt)
-                # Add more robust error checking if needed based on Gemini response structure
-                if response.parts:
-                    return response.text.strip()
-                else:
-                    # Handle cases where the response might be blocked or empty
-                    safety_feedback = response.prompt_feedback if hasattr(response, 'prompt_feedback') else 'N/A'
-                    finish_reason = response.candidates[0].finish_reason if response.candidates else 'N/A'
-                    print(f"Warning: Gemini response was empty or blocked. Finish Reason: {finish_reason}, Safety Feedback: {safety_feedback}")
-                    return f"Error: Failed to get response from Gemini. Finish Reason: {finish_reason}"
-        except Exception as e:
-                print(f"Error during Gemini API call: {str(e)}")
-                return f"Error: Exception during Gemini API call: {str(e)}"
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                text += chunk
+                if stop_when is not None:
+                    final = stop_when(text)
+                    if final is not None:
+                        text, stopped_early = final, True
+                if on_text is not None:
+                    on_text(text)
+                if stopped_early:
+                    break
+        finally:
+            chunks.close()  # stops the backend when we leave early
+        total = time.perf_counter() - started
+        timings = {
+            "ttfb_seconds": ttfb if ttfb is not None else total,
+            "total_seconds": total,
+            "stopped_early": stopped_early,
+        }
+        return text.strip(), timings
+
+    def count_tokens(self, text: str) -> int:
+        """Number of tokens `text` occupies in the model's context"""
+        return self.backend.count_tokens(text)
+
+    def stats(self) -> dict:
+        """Backend counters (batching and prefix reuse for local models)"""
+        return self.backend.stats()
 
 
 # Create a singleton instance
 _model_instance = None
+_model_lock = threading.Lock()
+_warm_up_thread: Optional[threading.Thread] = None
 
 def get_model_instance():
-    """Get or create a singleton instance of LLMModel"""
+    """Get or create a singleton instance of LLMModel. Concurrent callers wait for the one being built."""
     global _model_instance
-    if _model_instance is None:
-        try:
-            _model_instance = LLMModel()  # Constructor now reads env vars
-        except (ValueError, RuntimeError, Exception) as e:
-             # Handle initialization errors gracefully, e.g., log and exit or raise
-             print(f"Fatal Error: Failed to initialize LLMModel: {str(e)}")
-             # Depending on the application context, you might raise the error
-             # or return None and handle it upstream.
-             raise e  # Re-raise for now to make the failure obvious
-    return _model_instance
+    with _model_lock:
+        if _model_instance is None:
+            try:
+                _model_instance = LLMModel()  # Constructor now reads env vars
+            except (ValueError, RuntimeError, Exception) as e:
+                 # Handle initialization errors gracefully, e.g., log and exit or raise
+                 print(f"Fatal Error: Failed to initialize LLMModel: {str(e)}")
+                 # Depending on the application context, you might raise the error
+                 # or return None and handle it upstream.
+                 raise e  # Re-raise for now to make the failure obvious
+        return _model_instance
+
+def model_ready() -> bool:
+    """True once the model singleton has been built"""
+    return _model_instance is not None
+
+def warm_up_model(preload: Tuple[str, ...] = ()) -> threading.Thread:
+    """
+    Build the model singleton in a background thread. Idempotent: the
+    thread is started once per process.
+
+    Args:
+        preload (Tuple[str, ...]): Modules to import first in the same thread,
+            e.g. the services, so the first request finds them loaded
+
+    Returns:
+        threading.Thread: The warm-up thread
+    """
+    global _warm_up_thread
+    with _model_lock:
+        if _warm_up_thread is not None:
+            return _warm_up_thread
+
+        def warm_up():
+            started = time.perf_counter()
+            try:
+                for module in preload:
+                    importlib.import_module(module)
+                get_model_instance()
+            except Exception as e:
+                # The next get_model_instance() call retries and surfaces the error
+                print(f"Model warm-up failed: {str(e)}")
+                return
+            print(f"Model warm-up finished in {time.perf_counter() - started:.2f}s.")
+
+        _warm_up_thread = threading.Thread(target=warm_up, name="model-warm-up", daemon=True)
+        _warm_up_thread.start()
+        return _warm_up_thread
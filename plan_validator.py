@@ -0,0 +1,201 @@
+# src/core/plan_validator.py
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import VALIDATION_CONFIG
+from helpers import normalize_sql
+
+# SQLSTATE codes the retry loop (and local repair) know how to act on
+SQLSTATE_KINDS = {
+    "42601": "syntax_error",
+    "42703": "undefined_column",
+    "42P01": "undefined_table",
+    "42702": "ambiguous_column",
+    "42883": "undefined_function",
+    "42804": "datatype_mismatch",
+    "42846": "cannot_coerce",
+    "42803": "grouping_error",
+    "42P10": "invalid_column_reference",
+    "42P18": "indeterminate_datatype",
+    "22P02": "invalid_text_representation",
+    "22007": "invalid_datetime_format",
+    "22008": "datetime_field_overflow",
+    "42501": "insufficient_privilege",
+}
+
+def _plan_error(exc: Exception) -> dict:
+    """Build a structured error from a psycopg2 exception"""
+    diag = getattr(exc, "diag", None)
+    sqlstate = getattr(exc, "pgcode", None)
+    position = getattr(diag, "statement_position", None) if diag else None
+    message = getattr(diag, "message_primary", None) if diag else None
+    return {
+        "sqlstate": sqlstate,
+        "kind": SQLSTATE_KINDS.get(sqlstate, "error"),
+        "message": message or str(exc).strip().splitlines()[0],
+        "detail": getattr(diag, "message_detail", None) if diag else None,
+        "hint": getattr(diag, "message_hint", None) if diag else None,
+        "position": int(position) if position else None,
+    }
+
+def format_plan_error(error: dict, query: Optional[str] = None) -> str:
+    """
+    Render a structured planning error for the LLM repair prompt
+
+    Args:
+        error (dict): Error as returned in a PlanValidator result
+        query (Optional[str]): The query, used to quote the text at the error position
+
+    Returns:
+        str: One-line description of the error
+    """
+    text = f"{error['kind']} (SQLSTATE {error['sqlstate']}): {error['message']}"
+    if error.get("position") and query:
+        start = max(error["position"] - 1, 0)
+        text += f" near '{query[start:start + 30]}'"
+    if error.get("detail"):
+        text += f". Detail: {error['detail']}"
+    if error.get("hint"):
+        text += f". Hint: {error['hint']}"
+    return text
+
+class PlanValidator:
+    def __init__(
+        self,
+        pool,
+        catalog,
+        max_total_cost: Optional[float] = VALIDATION_CONFIG["max_total_cost"],
+        max_plan_rows: Optional[float] = VALIDATION_CONFIG["max_plan_rows"],
+        over_limit_action: str = VALIDATION_CONFIG["over_limit_action"],
+        timeout_ms: int = VALIDATION_CONFIG["timeout_ms"],
+        cache_entries: int = VALIDATION_CONFIG["plan_cache_entries"],
+    ):
+        """
+        Validate queries with EXPLAIN (FORMAT JSON): the query is parsed,
+        analyzed against the schema and planned, but never executed
+
+        Args:
+            pool (ConnectionPool): Pool used for EXPLAIN
+            catalog (SchemaCatalog): Its fingerprint scopes cached plans to a schema version
+            max_total_cost (Optional[float]): Planner cost above which a query is over the limit
+            max_plan_rows (Optional[float]): Estimated result rows above which a query is over the limit
+            over_limit_action (str): "reject" fails over-limit queries, "flag" only warns
+            timeout_ms (int): statement_timeout for planning
+            cache_entries (int): Parsed plans kept per normalized query
+        """
+        self.pool = pool
+        self.catalog = catalog
+        self.max_total_cost = max_total_cost
+        self.max_plan_rows = max_plan_rows
+        self.over_limit_action = over_limit_action
+        self.timeout_ms = timeout_ms
+        self.cache_entries = cache_entries
+
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._counters = {"validations": 0, "cache_hits": 0, "errors": 0, "over_limit": 0}
+
+    def _explain(self, query: str) -> dict:
+        """Run EXPLAIN and summarize the plan or the error"""
+        prefix = "EXPLAIN (FORMAT JSON) "
+        try:
+            with self.pool.connection(self.timeout_ms) as conn:
+                cursor = conn.cursor()
+                cursor.execute(prefix + query)
+                plan = cursor.fetchone()[0][0]["Plan"]
+        except Exception as e:
+            if getattr(e, "pgcode", None) is None:
+                raise  # connection problems are not the query's fault
+            error = _plan_error(e)
+            if error["position"]:
+                # Report positions within the query, not within the EXPLAIN statement
+                error["position"] = max(error["position"] - len(prefix), 1)
+            return {"ok": False, "error": error, "plan": None}
+        return {
+            "ok": True,
+            "error": None,
+            "plan": plan,
+            "total_cost": float(plan["Total Cost"]),
+            "plan_rows": float(plan["Plan Rows"]),
+            "plan_width": int(plan["Plan Width"]),
+        }
+
+    def _apply_limits(self, result: dict) -> dict:
+        """Add over-limit warnings to a successful plan"""
+        result = dict(result)
+        warnings = []
+        if result["ok"]:
+            if self.max_total_cost is not None and result["total_cost"] > self.max_total_cost:
+                warnings.append(
+                    f"estimated cost {result['total_cost']:,.0f} exceeds the limit of {self.max_total_cost:,.0f}"
+                )
+            if self.max_plan_rows is not None and result["plan_rows"] > self.max_plan_rows:
+                warnings.append(
+                    f"estimated {result['plan_rows']:,.0f} result rows exceed the limit of {self.max_plan_rows:,.0f}"
+                )
+        result["warnings"] = warnings
+        result["rejected"] = bool(warnings) and self.over_limit_action == "reject"
+        return result
+
+    def validate(self, query: str) -> dict:
+        """
+        Plan a query without executing it
+
+        Args:
+            query (str): SQL query to validate
+
+        Returns:
+            dict: {"ok", "error", "plan", "total_cost", "plan_rows", "plan_width",
+                   "warnings", "rejected"}. `error` is a structured dict
+                   (sqlstate, kind, message, detail, hint, position) when planning failed;
+                   `rejected` is True when the query is over a limit and the action is "reject".
+        """
+        query = query.strip().rstrip(";")
+        self.catalog.refresh()
+        key = (normalize_sql(query), self.catalog.fingerprint)
+        with self._lock:
+            self._counters["validations"] += 1
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self._counters["cache_hits"] += 1
+
+        if cached is None:
+            cached = self._explain(query)
+            sqlstate = (cached["error"] or {}).get("sqlstate") or ""
+            # Schema-dependent outcomes are cacheable; timeouts and the like are not
+            if cached["ok"] or sqlstate[:2] in ("42", "22"):
+                with self._lock:
+                    self._cache[key] = cached
+                    while len(self._cache) > self.cache_entries:
+                        self._cache.popitem(last=False)
+
+        result = self._apply_limits(cached)
+        with self._lock:
+            if not result["ok"]:
+                self._counters["errors"] += 1
+            if result["warnings"]:
+                self._counters["over_limit"] += 1
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """Return validation counters"""
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot["cached_plans"] = len(self._cache)
+        return snapshot
+
+
+# Validators (and their plan caches) are shared by every session using the same connection string
+_validators: Dict[str, PlanValidator] = {}
+_validators_lock = threading.Lock()
+
+def get_plan_validator(connection_string: str, pool, catalog) -> PlanValidator:
+    """Get or create the shared PlanValidator for a connection string"""
+    with _validators_lock:
+        validator = _validators.get(connection_string)
+        if validator is None or validator.pool is not pool:
+            validator = PlanValidator(pool, catalog)
+            _validators[connection_string] = validator
+        return validator
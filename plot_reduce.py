@@ -0,0 +1,319 @@
+# src/core/plot_reduce.py
+#
+# Reduces plot-bound data before it is drawn. Figures are reduced after the
+# analysis code built them and before they are rendered to PNG, so plots made
+# through matplotlib, pandas or seaborn are all covered:
+#   - lines beyond the point budget are downsampled with LTTB
+#     (Largest-Triangle-Three-Buckets), which keeps peaks and dips
+#   - single-colored scatters beyond it become a hexbin density
+#   - scatters colored per point keep one point per grid cell and color
+# pandas line and area plots are reduced when they are called instead, since
+# pandas' own handling of a long datetime x axis already takes seconds.
+# Recorded st.line_chart/area_chart/scatter_chart calls are reduced the same
+# way before their data is sent to the browser.
+
+import contextlib
+import contextvars
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from config import PLOT_CONFIG
+
+# Recorded Streamlit chart calls whose data is reduced, and how
+CHART_CALLS = {"line_chart": "lttb", "area_chart": "lttb", "scatter_chart": "grid"}
+
+# pandas plot kinds drawn as lines, reduced when called
+LINE_KINDS = ("line", "area")
+
+# (notes by figure id, point budget) of the enclosing `reducing` block
+_active: contextvars.ContextVar = contextvars.ContextVar("plot_reduce_active", default=None)
+_original_plot_call = None
+_hook_lock = threading.Lock()
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Indices of the points Largest-Triangle-Three-Buckets keeps
+
+    Args:
+        x (np.ndarray): Ordered x values as floats
+        y (np.ndarray): y values as floats, NaN for gaps
+        threshold (int): Points to keep
+
+    Returns:
+        np.ndarray: Sorted indices of `threshold` points, the first and last included
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    # The inner points split into threshold - 2 buckets; each keeps the point
+    # forming the largest triangle with the previous pick and the next bucket's mean
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    with np.errstate(invalid="ignore"):
+        for bucket in range(threshold - 2):
+            start, end = edges[bucket], edges[bucket + 1]
+            next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+            mean_x = np.nanmean(x[end:next_end]) if np.isfinite(x[end:next_end]).any() else x[end]
+            mean_y = np.nanmean(y[end:next_end]) if np.isfinite(y[end:next_end]).any() else y[end]
+            area = np.abs(
+                (x[previous] - mean_x) * (y[start:end] - y[previous])
+                - (x[previous] - x[start:end]) * (mean_y - y[previous])
+            )
+            previous = start + int(np.argmax(np.where(np.isnan(area), -1.0, area)))
+            selected[bucket + 1] = previous
+    return selected
+
+def thin_grid(x: np.ndarray, y: np.ndarray, max_points: int, keys: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Indices of one point per cell of a grid over the data, per distinct key
+
+    Args:
+        x (np.ndarray): x values as floats
+        y (np.ndarray): y values as floats
+        max_points (int): Most points to keep
+        keys (Optional[np.ndarray]): Integer key per point, e.g. a color, kept apart
+
+    Returns:
+        np.ndarray: Sorted indices of the kept points; non-finite points are dropped
+    """
+    finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    x, y = x[finite], y[finite]
+    if len(finite) == 0:
+        return finite
+    distinct = 1
+    if keys is not None:
+        keys = keys[finite]
+        distinct = int(keys.max()) + 1
+    # Coarser cells when keys split them, so at most max_points remain
+    side = max(int(np.sqrt(max_points / distinct)), 1)
+    cells = _grid_index(x, side) * side + _grid_index(y, side)
+    if keys is not None:
+        cells = cells * distinct + keys
+    _, first = np.unique(cells, return_index=True)
+    return finite[np.sort(first)]
+
+def _grid_index(values: np.ndarray, side: int) -> np.ndarray:
+    low, high = values.min(), values.max()
+    if high == low:
+        return np.zeros(len(values), dtype=np.int64)
+    return np.minimum(((values - low) / (high - low) * side).astype(np.int64), side - 1)
+
+def _as_float(values) -> Optional[np.ndarray]:
+    """Numeric or datetime values as floats, None for anything else"""
+    values = np.asarray(values)
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    if values.dtype.kind in "iufb":
+        return values.astype(np.float64)
+    return None
+
+def _take(values, index: np.ndarray):
+    """`values` at positions `index`, keeping pandas types"""
+    if hasattr(values, "iloc"):
+        return values.iloc[index]
+    return np.asarray(values)[index]
+
+def _color_keys(colors: np.ndarray) -> np.ndarray:
+    """Integer key per RGBA row"""
+    packed = np.round(np.asarray(colors)[:, :4] * 255).astype(np.int64)
+    return np.unique(packed @ np.array([1 << 24, 1 << 16, 1 << 8, 1]), return_inverse=True)[1].ravel()
+
+
+def _lttb_rows(frame: pd.DataFrame, x_name, y_names, max_points: int) -> Optional[np.ndarray]:
+    """Rows of a frame LTTB keeps for each y column over x (a column name or None for the index)"""
+    x = _as_float(frame[x_name]) if isinstance(x_name, str) and x_name in frame.columns else None
+    if x is None:
+        x = _as_float(frame.index)
+        if x is None:
+            x = np.arange(len(frame), dtype=np.float64)
+    if isinstance(y_names, str):
+        y_names = [y_names]
+    elif not y_names:
+        y_names = [name for name in frame.columns if name != x_name]
+    series = [_as_float(frame[name]) for name in y_names if name in frame.columns]
+    series = [values for values in series if values is not None]
+    if not series:
+        return None
+    budget = max(max_points // len(series), 3)
+    return np.unique(np.concatenate([lttb(x, values, budget) for values in series]))
+
+
+@contextlib.contextmanager
+def reducing(max_points: int = PLOT_CONFIG["max_points"]):
+    """
+    Reduce pandas line and area plots called inside the block to `max_points`
+    per series, before pandas converts their x values
+
+    Yields:
+        Dict[int, List[str]]: Notes on the reduced plots by id of their figure
+    """
+    _install_pandas_hook()
+    notes: Dict[int, List[str]] = {}
+    token = _active.set((notes, max_points))
+    try:
+        yield notes
+    finally:
+        _active.reset(token)
+
+def _install_pandas_hook():
+    """Wrap PlotAccessor.__call__ once per process; outside `reducing` the wrapper passes through"""
+    global _original_plot_call
+    with _hook_lock:
+        if _original_plot_call is None:
+            _original_plot_call = pd.plotting.PlotAccessor.__call__
+            pd.plotting.PlotAccessor.__call__ = _reduced_plot_call
+
+def _reduced_plot_call(self, *args, **kwargs):
+    active = _active.get()
+    data = self._parent
+    if active is None or len(data) <= active[1]:
+        return _original_plot_call(self, *args, **kwargs)
+    try:
+        x, y, kind, _ = self._get_call_args("matplotlib", data, args, dict(kwargs))
+        index = _lttb_rows(data.to_frame() if isinstance(data, pd.Series) else data, x, y, active[1]) if kind in LINE_KINDS else None
+    except Exception:
+        index = None  # anything unexpected plots unreduced
+    if index is None:
+        return _original_plot_call(self, *args, **kwargs)
+
+    result = _original_plot_call(type(self)(data.iloc[index]), *args, **kwargs)
+    axes = result.flat[0] if isinstance(result, np.ndarray) else result
+    figure = getattr(axes, "figure", None)
+    if figure is not None:
+        active[0].setdefault(id(figure), []).append(
+            f"{kind} plot of {len(data):,} rows downsampled to {len(index):,} (LTTB)"
+        )
+    return result
+
+
+def reduce_figure(
+    fig,
+    max_points: int = PLOT_CONFIG["max_points"],
+    gridsize: int = PLOT_CONFIG["hexbin_gridsize"],
+) -> List[str]:
+    """
+    Reduce the lines and scatters of a matplotlib figure that exceed the point budget
+
+    Args:
+        fig (matplotlib.figure.Figure): Figure built by analysis code, not yet rendered
+        max_points (int): Points kept per line or scatter
+        gridsize (int): Hexagons across the x axis of a scatter density
+
+    Returns:
+        List[str]: One note per reduced artist, empty if nothing was reduced
+    """
+    from matplotlib.collections import PathCollection
+    notes = []
+    for ax in fig.axes:
+        for line in list(ax.lines):
+            note = _reduce_line(line, max_points)
+            if note:
+                notes.append(note)
+        for collection in list(ax.collections):
+            if type(collection) is PathCollection and collection.get_offset_transform() is ax.transData:
+                note = _reduce_scatter(ax, collection, max_points, gridsize)
+                if note:
+                    notes.append(note)
+    return notes
+
+def _reduce_line(line, max_points: int) -> Optional[str]:
+    xy = line.get_xydata()
+    n = len(xy)
+    if n <= max_points:
+        return None
+    index = lttb(xy[:, 0], xy[:, 1], max_points)
+    x, y = line.get_xdata(orig=True), line.get_ydata(orig=True)
+    if len(x) == n and len(y) == n:
+        line.set_data(_take(x, index), _take(y, index))
+    else:
+        line.set_data(xy[index, 0], xy[index, 1])
+    return f"line of {n:,} points downsampled to {len(index):,} (LTTB)"
+
+def _reduce_scatter(ax, collection, max_points: int, gridsize: int) -> Optional[str]:
+    offsets = np.ma.getdata(collection.get_offsets())
+    n = len(offsets)
+    if n <= max_points:
+        return None
+    x, y = offsets[:, 0].astype(np.float64), offsets[:, 1].astype(np.float64)
+    facecolors = collection.get_facecolors()
+    values = collection.get_array()
+
+    if values is None and len(facecolors) <= 1:
+        # One color carries no information per point: draw where the points are dense
+        xlim, ylim = ax.get_xlim(), ax.get_ylim()
+        collection.remove()
+        ax.hexbin(
+            x, y, gridsize=gridsize, mincnt=1, bins="log",
+            zorder=collection.get_zorder(), label=collection.get_label(), alpha=collection.get_alpha(),
+        )
+        ax.set_xlim(xlim)
+        ax.set_ylim(ylim)
+        return f"scatter of {n:,} points drawn as a hexbin density (log counts)"
+
+    if values is not None and len(values) == n:
+        # Colormapped values: keep 16 levels apart within each cell
+        levels = np.ma.filled(np.asarray(values, dtype=np.float64), np.nan)
+        low, high = np.nanmin(levels), np.nanmax(levels)
+        keys = np.nan_to_num(np.floor((levels - low) / ((high - low) or 1) * 15), nan=0).astype(np.int64)
+    elif len(facecolors) == n:
+        keys = _color_keys(facecolors)
+    else:
+        keys = None
+    index = thin_grid(x, y, max_points, keys)
+    collection.set_offsets(offsets[index])
+    for getter, setter in (
+        (collection.get_facecolors, collection.set_facecolors),
+        (collection.get_edgecolors, collection.set_edgecolors),
+        (collection.get_sizes, collection.set_sizes),
+    ):
+        current = getter()
+        if len(current) == n:
+            setter(current[index])
+    if values is not None and len(values) == n:
+        collection.set_array(values[index])
+    paths = collection.get_paths()
+    if len(paths) == n:
+        collection.set_paths([paths[i] for i in index])
+    return f"scatter of {n:,} points thinned to {len(index):,} (one per grid cell and color)"
+
+
+def reduce_chart_call(output: dict, max_points: int = PLOT_CONFIG["max_points"]) -> Optional[str]:
+    """
+    Reduce the data of a recorded st.line_chart/area_chart/scatter_chart call in place
+
+    Args:
+        output (dict): Recorded call ({"call", "args", "kwargs"})
+        max_points (int): Points kept per series
+
+    Returns:
+        Optional[str]: Note describing the reduction, None if the call was left as is
+    """
+    method = CHART_CALLS.get(output["call"])
+    args, kwargs = output["args"], output["kwargs"]
+    data = args[0] if args else kwargs.get("data")
+    if method is None or not isinstance(data, (pd.DataFrame, pd.Series)) or len(data) <= max_points:
+        return None
+    frame = data.to_frame() if isinstance(data, pd.Series) else data
+
+    if method == "lttb":
+        index = _lttb_rows(frame, kwargs.get("x"), kwargs.get("y"), max_points)
+        description = "downsampled"
+    else:
+        x, y = (_as_float(frame[kwargs[name]]) if kwargs.get(name) in frame.columns else None for name in ("x", "y"))
+        if x is None or y is None:
+            return None
+        color = kwargs.get("color")
+        keys = pd.factorize(frame[color])[0] + 1 if isinstance(color, str) and color in frame.columns else None
+        index = thin_grid(x, y, max_points, keys)
+        description = "thinned"
+    if index is None:
+        return None
+    reduced = data.iloc[index]
+    if args:
+        output["args"] = (reduced,) + tuple(args[1:])
+    else:
+        output["kwargs"] = dict(kwargs, data=reduced)
+    return f"chart of {len(data):,} rows {description} to {len(index):,}"
@@ -22,21 +22,23 @@ def get_sql_prompt(
     Returns:
         str: The generated prompt string.
     """
+    # Static part first: instructions and schema form a prefix that is identical
+    # for every question on the same schema, so local backends reuse its KV cache
     prompt = f"""You are an expert {db_type} data analyst. Your task is to generate a {db_type} SQL query based on the user's question and the provided table schema.
 
-Database Schema:
-```sql
-{table_statement}
-```
-
-User Question: "{user_query}"
-
 Instructions:
 1.  Analyze the user question and the table schema carefully.
 2.  Generate a SINGLE, syntactically correct {db_type} query that answers the user's question.
 3.  ONLY output the SQL query. Do not include any explanations, comments, or markdown formatting (like ```sql).
 4.  Ensure the query is compatible with standard {db_type} syntax.
 5.  If the question cannot be answered with the given schema, respond with "Error: Cannot answer question with the provided schema."
+
+Database Schema:
+```sql
+{table_statement}
+```
+
+User Question: "{user_query}"
 """
 
     if previous_query and error_message:
@@ -52,7 +54,7 @@ Error Message: "{error_message}"
 Please analyze the error message and the previous query, then generate a corrected {db_type} SQL query based on the original user question and schema. ONLY output the corrected SQL query.
 """
     else:
-        prompt += """
+        prompt += f"""
 Generate the {db_type} SQL query now:
 """
 
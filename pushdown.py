@@ -0,0 +1,698 @@
+# src/core/pushdown.py
+#
+# Aggregation pushdown: compile the pandas aggregation in generated analysis
+# code into a second SQL stage over the query that produced the data, so
+# PostgreSQL returns the aggregate instead of every row.
+#
+# Recognized over `df` (optionally filtered by boolean masks or dropna):
+#   - column aggregates: df["c"].mean(), sum, min, max, count, nunique, median,
+#     std, var, quantile(q or [q, ...]); df[["a", "b"]].mean(); len(df), df.shape[0]
+#   - group-bys: df.groupby(keys)["c"].mean(), [["a", "b"]].sum(), .size(),
+#     .quantile(q), .agg("mean" | ["min", "max"] | {"c": "sum"} | total=("c", "sum"))
+#     with keys being columns, df["ts"].dt.year (month, day, ...), .dt.date,
+#     .dt.to_period(freq), pd.Grouper(key="ts", freq=...) or df.resample(freq, on="ts")
+#   - df["c"].value_counts()
+#   - histograms: np.histogram(df["c"], bins=n), plt.hist / ax.hist(df["c"], bins=n)
+#
+# Each recognized expression becomes one query; whatever is chained after it
+# (sort_values, head, reset_index, plotting) stays pandas code running over the
+# small result. Code that reads `df` in any other way is not compiled and runs
+# in pandas over the full result.
+
+import ast
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+
+@dataclass
+class PushdownPlan:
+    """Second SQL stage of one analysis"""
+    queries: List[str]  # one aggregate over the base query per compiled expression
+    code: str  # the analysis code, reading the aggregates from `_pushdown_frames`
+    operations: List[str]  # "aggregate", "groupby", "value_counts" or "histogram" per query
+
+
+class _Unsupported(Exception):
+    """The expression has no SQL equivalent here"""
+
+
+_AGGREGATES = ("mean", "sum", "min", "max", "count", "nunique", "median", "std", "var")
+
+# pandas Period frequencies and resample rules to date_trunc fields
+_PERIOD_FIELDS = {"D": "day", "W": "week", "M": "month", "Q": "quarter", "Y": "year", "A": "year", "h": "hour", "H": "hour"}
+_RESAMPLE_FIELDS = {
+    "D": "day", "h": "hour", "H": "hour", "min": "minute", "T": "minute",
+    "W": "week", "W-SUN": "week",  # pandas weeks end on Sunday: they start on Monday like date_trunc's
+    "M": "month", "ME": "month", "MS": "month",
+    "Q": "quarter", "QE": "quarter", "QS": "quarter",
+    "Y": "year", "YE": "year", "YS": "year", "A": "year", "AS": "year",
+}
+# Series.dt attributes to EXTRACT fields
+_DATE_PARTS = {
+    "year": "EXTRACT(YEAR FROM {x})::int",
+    "month": "EXTRACT(MONTH FROM {x})::int",
+    "day": "EXTRACT(DAY FROM {x})::int",
+    "hour": "EXTRACT(HOUR FROM {x})::int",
+    "minute": "EXTRACT(MINUTE FROM {x})::int",
+    "quarter": "EXTRACT(QUARTER FROM {x})::int",
+    "dayofyear": "EXTRACT(DOY FROM {x})::int",
+    "dayofweek": "(EXTRACT(ISODOW FROM {x})::int - 1)",  # pandas: Monday is 0
+    "weekday": "(EXTRACT(ISODOW FROM {x})::int - 1)",
+    "date": "({x})::date",
+}
+_COMPARISONS = {ast.Eq: "=", ast.Lt: "<", ast.LtE: "<=", ast.Gt: ">", ast.GtE: ">="}
+_MIRRORED = {ast.Lt: ast.Gt, ast.LtE: ast.GtE, ast.Gt: ast.Lt, ast.GtE: ast.LtE, ast.Eq: ast.Eq, ast.NotEq: ast.NotEq}
+
+
+def quote_identifier(name) -> str:
+    """Quote a column name as a PostgreSQL identifier"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _literal(value) -> str:
+    """Render a Python constant as an SQL literal"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float) and value == value and value not in (float("inf"), float("-inf")):
+        return repr(value)
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    raise _Unsupported(f"literal {value!r}")
+
+def _constant(node: ast.AST):
+    """Value of a literal expression: constants, negated numbers, lists and tuples of them"""
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant):
+        if isinstance(node.operand.value, (int, float)) and not isinstance(node.operand.value, bool):
+            return -node.operand.value
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_constant(element) for element in node.elts]
+    raise _Unsupported("expected a literal")
+
+def _kwargs(call: ast.Call, allowed: Dict[str, object]) -> dict:
+    """Literal keyword arguments of a call, with defaults; anything else is unsupported"""
+    values = dict(allowed)
+    for keyword in call.keywords:
+        if keyword.arg is None or keyword.arg not in allowed:
+            raise _Unsupported(f"argument {keyword.arg}")
+        values[keyword.arg] = _constant(keyword.value)
+    return values
+
+def _is_df(node: ast.AST) -> bool:
+    return isinstance(node, ast.Name) and node.id == "df"
+
+def _reads_df(node: ast.AST) -> bool:
+    return any(isinstance(child, ast.Name) and child.id == "df" for child in ast.walk(node))
+
+def _method(node: ast.AST, *names: str) -> bool:
+    """Whether `node` is a call of a method named one of `names`"""
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in names
+
+
+class _Compiler:
+    def __init__(self, base_query: str, columns: Dict[str, str], numpy_names: set, pandas_names: set):
+        """
+        Compile one pandas expression over `df` at a time
+
+        Args:
+            base_query (str): Query whose result `df` holds
+            columns (Dict[str, str]): Column names of `df` and their dtype kinds
+            numpy_names (set): Names numpy is imported as in the code
+            pandas_names (set): Names pandas is imported as in the code
+        """
+        self.base_query = base_query.strip().rstrip(";")
+        self.columns = columns
+        self.numpy_names = numpy_names
+        self.pandas_names = pandas_names | {"pd"}  # the runner provides `pd`
+
+    # --- Frames, columns and filters ---
+
+    def frame(self, node: ast.AST) -> List[str]:
+        """WHERE predicates of `df`, `df[mask]` or `df.dropna(...)`"""
+        if _is_df(node):
+            return []
+        if isinstance(node, ast.Subscript) and not isinstance(node.slice, (ast.Constant, ast.List)):
+            return self.frame(node.value) + [self.predicate(node.slice)]
+        if _method(node, "dropna") and not node.args:
+            options = _kwargs(node, {"subset": None, "how": "any"})
+            if options["how"] != "any":
+                raise _Unsupported("dropna(how=...)")
+            subset = options["subset"]
+            names = list(self.columns) if subset is None else ([subset] if isinstance(subset, str) else subset)
+            return self.frame(node.func.value) + [f"{self.column_sql(name)} IS NOT NULL" for name in names]
+        raise _Unsupported("not a frame of df")
+
+    def column(self, node: ast.AST) -> Tuple[List[str], str]:
+        """(predicates, column name) of `frame["c"]` or `frame.c`"""
+        if isinstance(node, ast.Subscript) and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str):
+            return self.frame(node.value), self.known(node.slice.value)
+        if isinstance(node, ast.Attribute) and node.attr in self.columns:
+            return self.frame(node.value), node.attr
+        raise _Unsupported("not a column of df")
+
+    def known(self, name) -> str:
+        if name not in self.columns:
+            raise _Unsupported(f"unknown column {name!r}")
+        return name
+
+    def column_sql(self, name: str) -> str:
+        return quote_identifier(self.known(name))
+
+    def predicate(self, node: ast.AST) -> str:
+        """Null-safe SQL condition of a boolean mask: NaN compares false, as in pandas"""
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr)):
+            joiner = "AND" if isinstance(node.op, ast.BitAnd) else "OR"
+            return f"({self.predicate(node.left)} {joiner} {self.predicate(node.right)})"
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Invert):
+            return f"NOT {self.predicate(node.operand)}"
+        if isinstance(node, ast.Compare) and len(node.ops) == 1:
+            left, op, right = node.left, type(node.ops[0]), node.comparators[0]
+            try:
+                column = self.mask_column(left)
+                value = self.mask_value(right)
+            except _Unsupported:
+                column = self.mask_column(right)
+                value = self.mask_value(left)
+                op = _MIRRORED.get(op, op)
+            if op is ast.NotEq:
+                return f"{column} IS DISTINCT FROM {_literal(value)}"
+            if op not in _COMPARISONS or value is None:
+                raise _Unsupported("comparison")
+            return f"COALESCE({column} {_COMPARISONS[op]} {_literal(value)}, FALSE)"
+        if _method(node, "isin") and len(node.args) == 1 and not node.keywords:
+            column = self.mask_column(node.func.value)
+            values = _constant(node.args[0])
+            if not isinstance(values, list):
+                raise _Unsupported("isin of a non-list")
+            if not values:
+                return "FALSE"
+            return f"COALESCE({column} IN ({', '.join(_literal(value) for value in values)}), FALSE)"
+        if _method(node, "notna", "notnull", "isna", "isnull") and not node.args and not node.keywords:
+            column = self.mask_column(node.func.value)
+            return f"{column} IS {'NOT ' if node.func.attr in ('notna', 'notnull') else ''}NULL"
+        if _method(node, "between") and len(node.args) == 2 and not node.keywords:
+            column = self.mask_column(node.func.value)
+            low, high = (_literal(self.mask_value(arg)) for arg in node.args)
+            return f"COALESCE({column} BETWEEN {low} AND {high}, FALSE)"
+        raise _Unsupported("mask")
+
+    def mask_column(self, node: ast.AST) -> str:
+        predicates, name = self.column(node)
+        if predicates:
+            raise _Unsupported("mask over a filtered frame")
+        return self.column_sql(name)
+
+    def mask_value(self, node: ast.AST):
+        """Literal of a mask comparison; pd.Timestamp("...") and pd.to_datetime("...") as strings"""
+        if (
+            isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+            and isinstance(node.func.value, ast.Name) and node.func.value.id in self.pandas_names
+            and node.func.attr in ("Timestamp", "to_datetime") and len(node.args) == 1 and not node.keywords
+        ):
+            node = node.args[0]
+        value = _constant(node)
+        if isinstance(value, list):
+            raise _Unsupported("list comparison")
+        return value
+
+    # --- Aggregates ---
+
+    def aggregate_sql(self, function: str, name: str, call: Optional[ast.Call] = None) -> str:
+        """SQL aggregate matching pandas `function` over column `name`"""
+        kind = self.columns[self.known(name)]
+        column = self.column_sql(name)
+        numeric = f"({column})::int" if kind == "b" else column
+        allowed = {"ddof": 1} if function in ("std", "var") else {}
+        options = _kwargs(call, allowed) if call is not None else allowed
+        if call is not None and call.args:
+            raise _Unsupported(f"positional arguments of {function}")
+        if function == "mean":
+            return f"avg({numeric})::float8"
+        if function == "sum":
+            cast = "::bigint" if kind in "biu" else "::float8" if kind == "f" else ""
+            return f"COALESCE(sum({numeric}), 0){cast}"
+        if function in ("min", "max"):
+            if kind == "b":
+                raise _Unsupported("min/max of booleans")
+            return f"{function}({column})"
+        if function == "count":
+            return f"count({column})"
+        if function == "nunique":
+            return f"count(DISTINCT {column})"
+        if function == "median":
+            return f"percentile_cont(0.5) WITHIN GROUP (ORDER BY ({numeric})::float8)"
+        if function in ("std", "var"):
+            if options["ddof"] not in (0, 1):
+                raise _Unsupported("ddof")
+            suffix = "samp" if options["ddof"] == 1 else "pop"
+            return f"{'stddev' if function == 'std' else 'var'}_{suffix}({numeric})::float8"
+        raise _Unsupported(function)
+
+    def quantile_sql(self, name: str, q) -> str:
+        if isinstance(q, bool) or not isinstance(q, (int, float)) or not 0 <= q <= 1:
+            raise _Unsupported("quantile")
+        kind = self.columns[self.known(name)]
+        column = self.column_sql(name)
+        numeric = f"({column})::int" if kind == "b" else column
+        return f"percentile_cont({float(q)!r}) WITHIN GROUP (ORDER BY ({numeric})::float8)"
+
+    def query(self, select: List[str], predicates: List[str], group_count: int = 0, order: str = "") -> str:
+        sql = f"WITH pushdown_base AS (\n{self.base_query}\n)\nSELECT {', '.join(select)}\nFROM pushdown_base"
+        if predicates:
+            sql += "\nWHERE " + " AND ".join(predicates)
+        if group_count:
+            sql += "\nGROUP BY " + ", ".join(str(position) for position in range(1, group_count + 1))
+        if order:
+            sql += f"\nORDER BY {order}"
+        return sql
+
+    # --- Expressions ---
+
+    def compile(self, node: ast.AST) -> Tuple[str, dict, str]:
+        """
+        Compile one expression
+
+        Returns:
+            Tuple[str, dict, str]: second-stage query, rebuild spec and operation
+
+        Raises:
+            _Unsupported: If the expression is not an aggregation this module knows
+        """
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "len" and len(node.args) == 1:
+            return self.query(["count(*) AS v0"], self.frame(node.args[0])), {"kind": "scalar"}, "aggregate"
+        if (
+            isinstance(node, ast.Subscript) and isinstance(node.value, ast.Attribute) and node.value.attr == "shape"
+            and isinstance(node.slice, ast.Constant) and node.slice.value == 0
+        ):
+            return self.query(["count(*) AS v0"], self.frame(node.value.value)), {"kind": "scalar"}, "aggregate"
+        if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Attribute):
+            raise _Unsupported("not a call")
+
+        if node.func.attr == "histogram" and isinstance(node.func.value, ast.Name) and node.func.value.id in self.numpy_names:
+            return self.histogram(node, as_hist_arguments=False)
+        if node.func.attr == "hist" and node.args and not _reads_df(node.func.value):
+            return self.histogram(node, as_hist_arguments=True)
+
+        function, target = node.func.attr, node.func.value
+        if function == "value_counts":
+            return self.value_counts(node)
+        grouped = self.grouped(target)
+        if grouped is not None:
+            return self.grouped_aggregate(grouped, node)
+
+        if function in _AGGREGATES + ("quantile",):
+            try:
+                predicates, name = self.column(target)
+            except _Unsupported:
+                predicates, names = self.projection(target)
+                select = [f"{self.aggregate_sql(function, name, node)} AS v{i}" for i, name in enumerate(names)]
+                return self.query(select, predicates), {"kind": "values", "index": names, "name": None}, "aggregate"
+            if function != "quantile":
+                return self.query([f"{self.aggregate_sql(function, name, node)} AS v0"], predicates), {"kind": "scalar"}, "aggregate"
+            options = _kwargs(node, {"q": 0.5, "interpolation": "linear"})
+            if len(node.args) > 1 or options["interpolation"] != "linear":
+                raise _Unsupported("quantile arguments")
+            q = _constant(node.args[0]) if node.args else options["q"]
+            if not isinstance(q, list):
+                return self.query([f"{self.quantile_sql(name, q)} AS v0"], predicates), {"kind": "scalar"}, "aggregate"
+            select = [f"{self.quantile_sql(name, value)} AS v{i}" for i, value in enumerate(q)]
+            return self.query(select, predicates), {"kind": "values", "index": [float(value) for value in q], "name": name}, "aggregate"
+        raise _Unsupported(function)
+
+    def projection(self, node: ast.AST) -> Tuple[List[str], List[str]]:
+        """(predicates, columns) of `frame[["a", "b"]]`"""
+        if isinstance(node, ast.Subscript) and isinstance(node.slice, ast.List):
+            names = _constant(node.slice)
+            if all(isinstance(name, str) for name in names):
+                return self.frame(node.value), [self.known(name) for name in names]
+        raise _Unsupported("not a projection of df")
+
+    def value_counts(self, node: ast.Call):
+        predicates, name = self.column(node.func.value)
+        if node.args:
+            raise _Unsupported("value_counts arguments")
+        options = _kwargs(node, {"normalize": False, "sort": True, "ascending": False, "dropna": True})
+        column = self.column_sql(name)
+        if options["dropna"]:
+            predicates = predicates + [f"{column} IS NOT NULL"]
+        label = "proportion" if options["normalize"] else "count"
+        value = "count(*)::float8 / sum(count(*)) OVER ()" if options["normalize"] else "count(*)"
+        spec = {"kind": "value_counts", "name": name, "label": label, "sort": options["sort"], "ascending": options["ascending"]}
+        return self.query([f"{column} AS k0", f"{value} AS v0"], predicates, group_count=1), spec, "value_counts"
+
+    def histogram(self, node: ast.Call, as_hist_arguments: bool):
+        if not node.args or len(node.args) > 2:
+            raise _Unsupported("histogram arguments")
+        predicates, name = self.column(node.args[0])
+        bins = _constant(node.args[1]) if len(node.args) > 1 else 10
+        for keyword in node.keywords:
+            if keyword.arg == "bins":
+                bins = _constant(keyword.value)
+            elif not as_hist_arguments or keyword.arg in (None, "x", "weights", "range", "density", "cumulative"):
+                raise _Unsupported(f"histogram argument {keyword.arg}")
+        if isinstance(bins, bool) or not isinstance(bins, int) or bins < 1:
+            raise _Unsupported("bins must be a number")
+        kind = self.columns[self.known(name)]
+        if kind not in "biuf":
+            raise _Unsupported("histogram of a non-numeric column")
+        column = self.column_sql(name)
+        value = f"({column})::int::float8" if kind == "b" else f"({column})::float8"
+        where = " AND ".join([f"{column} IS NOT NULL"] + predicates)
+        query = (
+            f"WITH pushdown_base AS (\n{self.base_query}\n),\n"
+            f"pushdown_values AS (SELECT {value} AS v FROM pushdown_base WHERE {where}),\n"
+            "pushdown_bounds AS (SELECT min(v) AS lo, max(v) AS hi FROM pushdown_values),\n"
+            # numpy widens an empty range by 0.5 on both sides
+            "pushdown_edges AS (SELECT CASE WHEN hi = lo THEN lo - 0.5 ELSE lo END AS lo,"
+            " CASE WHEN hi = lo THEN hi + 0.5 ELSE hi END AS hi FROM pushdown_bounds)\n"
+            f"SELECT e.lo, e.hi, LEAST(width_bucket(v.v, e.lo, e.hi, {bins}), {bins}) AS bucket, count(*) AS count\n"
+            "FROM pushdown_values v CROSS JOIN pushdown_edges e\n"
+            "GROUP BY 1, 2, 3"
+        )
+        spec = {"kind": "histogram", "bins": bins, "hist_arguments": as_hist_arguments}
+        return query, spec, "histogram"
+
+    # --- Group-bys ---
+
+    def grouped(self, node: ast.AST) -> Optional[dict]:
+        """Parse `frame.groupby(...)` or `frame.resample(...)`, optionally followed by a column selection"""
+        selection = None
+        if isinstance(node, ast.Subscript) and isinstance(node.slice, (ast.Constant, ast.List)):
+            selection = _constant(node.slice)
+            node = node.value
+        elif isinstance(node, ast.Attribute) and _method(node.value, "groupby", "resample") and node.attr in self.columns:
+            selection = node.attr
+            node = node.value
+        if _method(node, "groupby"):
+            options = _kwargs(node, {"by": None, "as_index": True, "sort": True, "dropna": True, "observed": True})
+            if len(node.args) > 1 or (node.args and options["by"] is not None):
+                raise _Unsupported("groupby arguments")
+            by = node.args[0] if node.args else next(k.value for k in node.keywords if k.arg == "by")
+            key_nodes = by.elts if isinstance(by, ast.List) else [by]
+            keys = [self.group_key(key) for key in key_nodes]
+            grouped = {"predicates": self.frame(node.func.value), "keys": keys, "as_index": options["as_index"],
+                       "sort": options["sort"], "dropna": options["dropna"]}
+        elif _method(node, "resample") and len(node.args) == 1:
+            options = _kwargs(node, {"on": None})
+            if options["on"] is None:
+                raise _Unsupported("resample without on=")
+            keys = [self.time_key(self.known(options["on"]), _constant(node.args[0]), resample=True)]
+            grouped = {"predicates": self.frame(node.func.value), "keys": keys, "as_index": True, "sort": True, "dropna": True}
+        else:
+            return None
+        if isinstance(selection, list) and not all(isinstance(name, str) for name in selection):
+            raise _Unsupported("selection")
+        key_names = {key["name"] for key in keys}
+        grouped["selection"] = selection
+        grouped["value_columns"] = [name for name in self.columns if name not in key_names]
+        return grouped
+
+    def group_key(self, node: ast.AST) -> dict:
+        """Group key: a column name, a df column, a .dt accessor, .dt.to_period(freq) or pd.Grouper(key, freq)"""
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            name = self.known(node.value)
+            return {"sql": self.column_sql(name), "name": name}
+        if (
+            isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "Grouper"
+            and isinstance(node.func.value, ast.Name) and node.func.value.id in self.pandas_names and not node.args
+        ):
+            options = _kwargs(node, {"key": None, "freq": None})
+            if options["key"] is None or options["freq"] is None:
+                raise _Unsupported("Grouper without key and freq")
+            return self.time_key(self.known(options["key"]), options["freq"], resample=True)
+        if _method(node, "to_period") and isinstance(node.func.value, ast.Attribute) and node.func.value.attr == "dt":
+            predicates, name = self.column(node.func.value.value)
+            freq = _constant(node.args[0]) if node.args else None
+            if predicates or node.keywords or len(node.args) != 1:
+                raise _Unsupported("to_period arguments")
+            return self.time_key(name, freq, resample=False)
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Attribute) and node.value.attr == "dt":
+            predicates, name = self.column(node.value.value)
+            if predicates or node.attr not in _DATE_PARTS:
+                raise _Unsupported(f"dt.{node.attr}")
+            return {"sql": _DATE_PARTS[node.attr].format(x=self.column_sql(name)), "name": name}
+        predicates, name = self.column(node)
+        if predicates:
+            raise _Unsupported("key from a filtered frame")
+        return {"sql": self.column_sql(name), "name": name}
+
+    def time_key(self, name: str, freq, resample: bool) -> dict:
+        fields = _RESAMPLE_FIELDS if resample else _PERIOD_FIELDS
+        if freq not in fields:
+            raise _Unsupported(f"frequency {freq!r}")
+        key = {"sql": f"date_trunc('{fields[freq]}', {self.column_sql(name)})", "name": name}
+        key["resample" if resample else "period"] = freq
+        return key
+
+    def grouped_aggregate(self, grouped: dict, node: ast.Call):
+        """Compile the aggregation applied to a group-by"""
+        function, selection = node.func.attr, grouped["selection"]
+        if sum("resample" in key for key in grouped["keys"]) and len(grouped["keys"]) > 1:
+            raise _Unsupported("time bins mixed with other keys")
+        if isinstance(selection, str):
+            names = [self.known(selection)]
+        elif isinstance(selection, list):
+            names = [self.known(name) for name in selection]
+        else:
+            names = grouped["value_columns"]
+        series = isinstance(selection, str)
+
+        values = []  # (label, sql, fill: whether empty time bins count as 0)
+        if function == "size" and not node.args and not node.keywords:
+            values.append(("size" if not grouped["as_index"] else None, "count(*)", True))
+            series = True
+        elif function in _AGGREGATES:
+            if selection is None and function not in ("count", "nunique"):
+                raise _Unsupported(f"{function} without a column selection")
+            for name in names:
+                values.append((name, self.aggregate_sql(function, name, node), function in ("sum", "count", "nunique")))
+        elif function == "quantile":
+            options = _kwargs(node, {"q": 0.5})
+            q = _constant(node.args[0]) if len(node.args) == 1 else options["q"]
+            if selection is None or isinstance(q, list) or len(node.args) > 1:
+                raise _Unsupported("quantile arguments")
+            for name in names:
+                values.append((name, self.quantile_sql(name, q), False))
+        elif function in ("agg", "aggregate"):
+            values, series = self.agg_values(node, selection, names)
+        else:
+            raise _Unsupported(function)
+
+        keys = grouped["keys"]
+        predicates = list(grouped["predicates"])
+        if grouped["dropna"]:
+            predicates += [f"{key['sql']} IS NOT NULL" for key in keys]
+        select = [f"{key['sql']} AS k{i}" for i, key in enumerate(keys)]
+        select += [f"{sql} AS v{i}" for i, (_, sql, _) in enumerate(values)]
+        spec = {
+            "kind": "groupby",
+            "keys": [{k: v for k, v in key.items() if k != "sql"} for key in keys],
+            "labels": [label for label, _, _ in values],
+            "fill": [fill for _, _, fill in values],
+            "series": series,
+            "as_index": grouped["as_index"],
+            "sort": grouped["sort"],
+        }
+        return self.query(select, predicates, group_count=len(keys)), spec, "groupby"
+
+    def agg_values(self, node: ast.Call, selection, names: List[str]):
+        """Values of .agg(...): a function name, a list of them, a dict per column or named aggregations"""
+        values = []
+        if node.keywords and not node.args:
+            for keyword in node.keywords:
+                spec = _constant(keyword.value)
+                if keyword.arg is None or not isinstance(spec, list) or len(spec) != 2:
+                    raise _Unsupported("named aggregation")
+                name, function = spec
+                values.append((keyword.arg, self.function_sql(function, name), function in ("sum", "count", "nunique", "size")))
+            return values, False
+        if len(node.args) != 1 or node.keywords:
+            raise _Unsupported("agg arguments")
+        argument = node.args[0]
+        if isinstance(argument, ast.Dict):
+            per_column = [(_constant(key), _constant(value)) for key, value in zip(argument.keys, argument.values)]
+            nested = any(isinstance(functions, list) for _, functions in per_column)
+            for name, functions in per_column:
+                for function in functions if isinstance(functions, list) else [functions]:
+                    label = (name, function) if nested else name
+                    values.append((label, self.function_sql(function, name), function in ("sum", "count", "nunique", "size")))
+            return values, False
+        functions = _constant(argument)
+        if selection is None:
+            raise _Unsupported("agg without a column selection")
+        if isinstance(functions, str):
+            for name in names:
+                values.append((name, self.function_sql(functions, name), functions in ("sum", "count", "nunique", "size")))
+            return values, isinstance(selection, str)
+        for name in names:
+            for function in functions:
+                label = function if isinstance(selection, str) else (name, function)
+                values.append((label, self.function_sql(function, name), function in ("sum", "count", "nunique", "size")))
+        return values, False
+
+    def function_sql(self, function, name: str) -> str:
+        if function == "size":
+            return "count(*)"
+        if not isinstance(function, str) or function not in _AGGREGATES:
+            raise _Unsupported(f"aggregation {function!r}")
+        return self.aggregate_sql(function, name)
+
+
+class _Rewriter(ast.NodeTransformer):
+    def __init__(self, compiler: _Compiler):
+        self.compiler = compiler
+        self.sites = []  # (query, operation) per compiled expression, read from _pushdown_frames[i]
+
+    def visit(self, node):
+        if isinstance(node, ast.expr) and _reads_df(node):
+            try:
+                compiled = self.compiler.compile(node)
+            except _Unsupported:
+                compiled = None
+            if compiled is not None:
+                query, spec, operation = compiled
+                frame = ast.parse(f"_pushdown_frames[{len(self.sites)}]", mode="eval").body
+                self.sites.append((query, operation))
+                rebuilt = ast.Call(
+                    func=ast.Name(id="_pushdown_rebuild", ctx=ast.Load()),
+                    args=[frame, ast.parse(repr(spec), mode="eval").body],
+                    keywords=[],
+                )
+                if operation == "histogram" and spec["hist_arguments"]:
+                    # plt.hist(df["c"], ...) -> plt.hist(**edges and counts, ...): the same bars,
+                    # styling keywords pass through
+                    styling = [keyword for keyword in node.keywords if keyword.arg != "bins"]
+                    return ast.Call(func=node.func, args=[], keywords=[ast.keyword(arg=None, value=rebuilt)] + styling)
+                return rebuilt
+        return self.generic_visit(node)
+
+
+def column_kinds(data: pd.DataFrame) -> Dict[str, str]:
+    """Column names of a DataFrame and their dtype kinds ("i", "f", "b", "M", "O", ...)"""
+    kinds = {}
+    for name, dtype in data.dtypes.items():
+        if isinstance(name, str) and list(data.columns).count(name) == 1:
+            kinds[name] = getattr(dtype, "kind", "O")
+    return kinds
+
+def plan_pushdown(code: str, base_query: str, columns: Dict[str, str]) -> Tuple[Optional[PushdownPlan], Optional[str]]:
+    """
+    Compile the aggregation in analysis code into a second SQL stage
+
+    Args:
+        code (str): Generated analysis code reading `df`
+        base_query (str): Query whose result `df` holds
+        columns (Dict[str, str]): Columns of `df` and their dtype kinds, see column_kinds
+
+    Returns:
+        Tuple[Optional[PushdownPlan], Optional[str]]:
+            - Plan if the code reads `df` only through aggregations, None otherwise
+            - Why the code cannot be pushed down, None if it can
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return None, f"code does not parse: {e}"
+
+    numpy_names, pandas_names = set(), set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name in ("numpy", "pandas"):
+                    (numpy_names if alias.name == "numpy" else pandas_names).add(alias.asname or alias.name)
+        elif (isinstance(node, ast.arg) and node.arg == "df") or (
+            isinstance(node, ast.Name) and node.id == "df" and not isinstance(node.ctx, ast.Load)
+        ):
+            return None, "the code rebinds df"
+
+    rewriter = _Rewriter(_Compiler(base_query, columns, numpy_names, pandas_names))
+    tree = ast.fix_missing_locations(rewriter.visit(tree))
+    if _reads_df(tree):
+        return None, "df is used beyond the aggregations compiled to SQL"
+    if not rewriter.sites:
+        return None, "the code does not read df"
+
+    prologue = "from pushdown import rebuild as _pushdown_rebuild\n"
+    return PushdownPlan(
+        queries=[query for query, _ in rewriter.sites],
+        code=prologue + ast.unparse(tree),
+        operations=[operation for _, operation in rewriter.sites],
+    ), None
+
+def rebuild(frame: pd.DataFrame, spec: dict):
+    """
+    Turn a second-stage result back into the value of the pandas expression it replaced
+
+    Args:
+        frame (pd.DataFrame): Result of PushdownPlan.query
+        spec (dict): Shape of the value, written into the rewritten code
+
+    Returns:
+        The scalar, Series, DataFrame or histogram the expression evaluates to
+    """
+    kind = spec["kind"]
+    if kind == "scalar":
+        value = frame.iloc[0, 0] if len(frame) else None
+        return float("nan") if value is None or value is pd.NA else value
+    if kind == "values":
+        row = frame.iloc[0].tolist() if len(frame) else [None] * len(spec["index"])
+        return pd.Series(row, index=pd.Index(spec["index"]), name=spec["name"]).infer_objects()
+    if kind == "value_counts":
+        index = pd.Index(frame["k0"], name=spec["name"])
+        counts = pd.Series(frame["v0"].to_numpy(), index=index, name=spec["label"])
+        if spec["sort"]:
+            counts = counts.sort_values(ascending=spec["ascending"], kind="stable")
+        return counts
+    if kind == "histogram":
+        import numpy as np
+        bins = spec["bins"]
+        counts = np.zeros(bins, dtype=np.int64)
+        counts[frame["bucket"].astype(int).to_numpy() - 1] = frame["count"].to_numpy()
+        low, high = (float(frame["lo"].iloc[0]), float(frame["hi"].iloc[0])) if len(frame) else (0.0, 1.0)
+        edges = np.linspace(low, high, bins + 1)
+        if spec["hist_arguments"]:
+            return {"x": edges[:-1], "bins": edges, "weights": counts}
+        return counts, edges
+    if kind == "groupby":
+        return _rebuild_groupby(frame, spec)
+    raise ValueError(f"Unknown pushdown result kind {kind!r}")
+
+def _rebuild_groupby(frame: pd.DataFrame, spec: dict):
+    levels = []
+    for i, key in enumerate(spec["keys"]):
+        level = frame[f"k{i}"]
+        if key.get("period"):
+            stamps = pd.to_datetime(level)
+            if getattr(stamps.dt, "tz", None) is not None:
+                stamps = stamps.dt.tz_localize(None)
+            level = stamps.dt.to_period(key["period"])
+        elif key.get("resample"):
+            level = pd.to_datetime(level)
+        levels.append(pd.Index(level, name=key["name"]))
+    index = levels[0] if len(levels) == 1 else pd.MultiIndex.from_arrays(levels)
+
+    labels = spec["labels"]
+    data = pd.DataFrame({i: frame[f"v{i}"].to_numpy() for i in range(len(labels))})
+    data.index = index
+    resample = next((key["resample"] for key in spec["keys"] if key.get("resample")), None)
+    if resample:
+        # Add the empty bins pandas would show: 0 for counts and sums, NaN otherwise
+        data = data.resample(resample).agg({i: "sum" if fill else "max" for i, fill in enumerate(spec["fill"])})
+    elif spec["sort"]:
+        data = data.sort_index()
+    if any(isinstance(label, tuple) for label in labels):
+        data.columns = pd.MultiIndex.from_tuples(labels)
+    else:
+        data.columns = labels
+
+    if not spec["as_index"]:
+        return data.reset_index()
+    if spec["series"]:
+        result = data.iloc[:, 0]
+        result.name = labels[0]
+        return result
+    return data
@@ -0,0 +1,303 @@
+# src/core/query_history.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+from config import ADVISOR_CONFIG, PATHS
+from helpers import normalize_sql, referenced_tables, sql_shape
+
+# How a recorded run was executed: as generated, TABLESAMPLE-rewritten, cut to a
+# pushdown preview, served by the result cache or rewritten to a materialized view
+RUN_MODES = ("full", "sampled", "preview", "cached", "view")
+
+# Modes whose timing is the cost of the query as generated
+BASELINE_MODES = ("full", "preview")
+
+def query_key(sql_query: str) -> str:
+    """Key of a query: hash of its normalized SQL"""
+    return hashlib.sha256(normalize_sql(sql_query).encode()).hexdigest()
+
+class QueryHistory:
+    def __init__(
+        self,
+        scope: str,
+        db_path: str = os.path.join(PATHS["temp_dir"], ADVISOR_CONFIG["history_file"]),
+        max_rows: int = ADVISOR_CONFIG["history_rows"],
+    ):
+        """
+        Persistent history of executed generated queries (timings, row counts
+        and plans) and of the materialized views created for them
+
+        Runs are keyed twice: by the normalized query and by its shape, the
+        query with literals stripped (see helpers.sql_shape), so queries that
+        only differ in constants cluster together.
+
+        Args:
+            scope (str): Database the runs belong to (hash of its connection string)
+            db_path (str): SQLite file shared by all scopes
+            max_rows (int): Runs kept per scope, oldest pruned first
+        """
+        self.scope = scope
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._recorded = 0
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS query_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                scope TEXT NOT NULL,
+                executed_at REAL NOT NULL,
+                query_key TEXT NOT NULL,
+                shape_key TEXT NOT NULL,
+                sql TEXT NOT NULL,
+                shape TEXT NOT NULL,
+                tables TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                view TEXT,
+                seconds REAL NOT NULL,
+                rows INTEGER NOT NULL,
+                total_cost REAL,
+                plan_rows REAL,
+                plan TEXT
+            );
+            CREATE INDEX IF NOT EXISTS query_history_scope ON query_history (scope, executed_at);
+            CREATE TABLE IF NOT EXISTS materialized_views (
+                scope TEXT NOT NULL,
+                query_key TEXT NOT NULL,
+                name TEXT NOT NULL,
+                sql TEXT NOT NULL,
+                columns TEXT NOT NULL,
+                tables TEXT NOT NULL,
+                versions TEXT NOT NULL,
+                baseline_seconds REAL,
+                created_at REAL NOT NULL,
+                refreshed_at REAL NOT NULL,
+                PRIMARY KEY (scope, query_key)
+            );
+            """
+        )
+        self._db.commit()
+
+    def record(
+        self,
+        sql_query: str,
+        seconds: float,
+        rows: int,
+        mode: str = "full",
+        view: Optional[str] = None,
+        plan_check: Optional[dict] = None,
+    ):
+        """
+        Record one execution of a generated query
+
+        Args:
+            sql_query (str): The query as generated (before sampling or view rewrites)
+            seconds (float): Execution and fetch time
+            rows (int): Rows returned
+            mode (str): One of RUN_MODES
+            view (Optional[str]): Materialized view the query was served from
+            plan_check (Optional[dict]): PlanValidator.validate result of the query
+        """
+        tables, _ = referenced_tables(sql_query)
+        shape = sql_shape(sql_query)
+        plan = plan_check.get("plan") if plan_check else None
+        row = (
+            self.scope,
+            time.time(),
+            query_key(sql_query),
+            hashlib.sha256(shape.encode()).hexdigest(),
+            sql_query,
+            shape,
+            json.dumps(tables),
+            mode,
+            view,
+            float(seconds),
+            int(rows),
+            plan_check.get("total_cost") if plan_check else None,
+            plan_check.get("plan_rows") if plan_check else None,
+            json.dumps(plan) if plan is not None else None,
+        )
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO query_history (scope, executed_at, query_key, shape_key, sql, shape, tables, mode, view, "
+                "seconds, rows, total_cost, plan_rows, plan) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+            self._recorded += 1
+            if self._recorded % 1000 == 0:
+                self._db.execute(
+                    "DELETE FROM query_history WHERE scope = ? AND id <= "
+                    "(SELECT id FROM query_history WHERE scope = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (self.scope, self.scope, self.max_rows),
+                )
+            self._db.commit()
+
+    def queries(self, since: float) -> List[dict]:
+        """
+        Per-query summary of the runs recorded since a point in time
+
+        Args:
+            since (float): Unix timestamp
+
+        Returns:
+            List[dict]: One entry per normalized query with its shape, runs by
+            mode, mean baseline and view latency and the largest row count
+        """
+        baseline = ", ".join(f"'{mode}'" for mode in BASELINE_MODES)
+        with self._lock:
+            cursor = self._db.execute(
+                f"""
+                SELECT query_key, shape_key, max(sql), max(shape), max(tables), count(*),
+                       sum(mode IN ({baseline})), avg(CASE WHEN mode IN ({baseline}) THEN seconds END),
+                       max(CASE WHEN mode IN ({baseline}) THEN rows END),
+                       sum(mode = 'view'), avg(CASE WHEN mode = 'view' THEN seconds END),
+                       max(executed_at)
+                FROM query_history
+                WHERE scope = ? AND executed_at >= ?
+                GROUP BY query_key
+                """,
+                (self.scope, since),
+            )
+            rows = cursor.fetchall()
+        return [
+            {
+                "query_key": row[0],
+                "shape_key": row[1],
+                "sql": row[2],
+                "shape": row[3],
+                "tables": json.loads(row[4]),
+                "runs": row[5],
+                "baseline_runs": row[6] or 0,
+                "baseline_seconds": row[7],
+                "max_rows": row[8],
+                "view_runs": row[9] or 0,
+                "view_seconds": row[10],
+                "last_run": row[11],
+            }
+            for row in rows
+        ]
+
+    def latest_plan(self, query_keys: List[str]) -> Optional[dict]:
+        """Return the most recently recorded plan of any of the given queries"""
+        placeholders = ", ".join("?" for _ in query_keys)
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT plan FROM query_history WHERE scope = ? AND query_key IN ({placeholders}) "
+                "AND plan IS NOT NULL ORDER BY id DESC LIMIT 1",
+                (self.scope, *query_keys),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def latency(self, key: str, view: str) -> Dict[str, Optional[float]]:
+        """
+        Before/after latency of a query served from a materialized view
+
+        Returns:
+            Dict[str, Optional[float]]: Mean seconds and runs of the query as
+            generated ("baseline") and served from the view ("view")
+        """
+        baseline = ", ".join(f"'{mode}'" for mode in BASELINE_MODES)
+        with self._lock:
+            row = self._db.execute(
+                f"""
+                SELECT avg(CASE WHEN mode IN ({baseline}) THEN seconds END), sum(mode IN ({baseline})),
+                       avg(CASE WHEN mode = 'view' AND view = ? THEN seconds END), sum(mode = 'view' AND view = ?)
+                FROM query_history WHERE scope = ? AND query_key = ?
+                """,
+                (view, view, self.scope, key),
+            ).fetchone()
+        return {
+            "baseline_seconds": row[0],
+            "baseline_runs": row[1] or 0,
+            "view_seconds": row[2],
+            "view_runs": row[3] or 0,
+        }
+
+    def views(self) -> List[dict]:
+        """Return the materialized views registered for this scope"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT query_key, name, sql, columns, tables, versions, baseline_seconds, created_at, refreshed_at "
+                "FROM materialized_views WHERE scope = ?",
+                (self.scope,),
+            ).fetchall()
+        return [
+            {
+                "query_key": row[0],
+                "name": row[1],
+                "sql": row[2],
+                "columns": json.loads(row[3]),
+                "tables": json.loads(row[4]),
+                # JSON turns the counter tuples into lists
+                "versions": {table: tuple(counters) for table, counters in json.loads(row[5]).items()},
+                "baseline_seconds": row[6],
+                "created_at": row[7],
+                "refreshed_at": row[8],
+            }
+            for row in rows
+        ]
+
+    def save_view(self, view: dict):
+        """Register or update a materialized view (see `views` for the keys)"""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO materialized_views (scope, query_key, name, sql, columns, tables, versions, "
+                "baseline_seconds, created_at, refreshed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.scope,
+                    view["query_key"],
+                    view["name"],
+                    view["sql"],
+                    json.dumps(view["columns"]),
+                    json.dumps(view["tables"]),
+                    json.dumps(view["versions"]),
+                    view["baseline_seconds"],
+                    view["created_at"],
+                    view["refreshed_at"],
+                ),
+            )
+            self._db.commit()
+
+    def delete_view(self, name: str):
+        """Unregister a materialized view"""
+        with self._lock:
+            self._db.execute("DELETE FROM materialized_views WHERE scope = ? AND name = ?", (self.scope, name))
+            self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Snapshot of the history size
+
+        Returns:
+            Dict[str, int]: Recorded runs, distinct queries and shapes, registered views
+        """
+        with self._lock:
+            runs, queries, shapes = self._db.execute(
+                "SELECT count(*), count(DISTINCT query_key), count(DISTINCT shape_key) FROM query_history WHERE scope = ?",
+                (self.scope,),
+            ).fetchone()
+            views = self._db.execute(
+                "SELECT count(*) FROM materialized_views WHERE scope = ?", (self.scope,)
+            ).fetchone()[0]
+        return {"runs": runs, "queries": queries, "shapes": shapes, "views": views}
+
+
+# Histories are shared by every session using the same connection string
+_histories: Dict[str, QueryHistory] = {}
+_histories_lock = threading.Lock()
+
+def get_query_history(connection_string: str) -> QueryHistory:
+    """Get or create the shared QueryHistory for a connection string"""
+    with _histories_lock:
+        history = _histories.get(connection_string)
+        if history is None:
+            history = QueryHistory(hashlib.sha256(connection_string.encode()).hexdigest()[:16])
+            _histories[connection_string] = history
+        return history
@@ -0,0 +1,247 @@
+# src/core/result_cache.py
+
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import pandas as pd
+from config import PATHS, RESULT_CACHE_CONFIG
+from frames import remove_stale_spill_dirs
+from helpers import normalize_sql, referenced_tables
+
+# Modification counters of the tables a cached result was read from. Writes to
+# a partitioned table are counted on its leaf partitions, which are summed
+# (with their number, so attaching or detaching one counts as a change)
+TABLE_VERSION_QUERY = """
+SELECT c.relname, sum(s.n_tup_ins)::bigint, sum(s.n_tup_upd)::bigint, sum(s.n_tup_del)::bigint,
+       sum(s.n_live_tup)::bigint, count(s.relid)
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+CROSS JOIN LATERAL (
+    SELECT c.oid AS relid WHERE c.relkind <> 'p'
+    UNION ALL
+    SELECT tree.relid FROM pg_partition_tree(c.oid) tree WHERE c.relkind = 'p' AND tree.isleaf
+) leaf
+JOIN pg_stat_user_tables s ON s.relid = leaf.relid
+WHERE n.nspname = %s AND c.relname = ANY(%s)
+GROUP BY c.relname;
+"""
+
+class ResultCache:
+    def __init__(
+        self,
+        pool,
+        catalog,
+        memory_budget_bytes: int = RESULT_CACHE_CONFIG["memory_budget_bytes"],
+        spill_bytes: int = RESULT_CACHE_CONFIG["spill_bytes"],
+        disk_budget_bytes: int = RESULT_CACHE_CONFIG["disk_budget_bytes"],
+        spill_dir: Optional[str] = None,
+    ):
+        """
+        LRU cache of query results in front of DatabaseManager.execute_query
+
+        Results are keyed by normalized SQL and remember the pg_stat_user_tables
+        modification counters of the tables they read. A lookup re-reads the
+        counters and drops the entry if any of them moved. Note that the
+        statistics collector publishes counters with a short delay (about a
+        second), so writes in that window can still be served stale.
+
+        Args:
+            pool (ConnectionPool): Pool used for the version checks
+            catalog (SchemaCatalog): Catalog used to tell base tables from views
+            memory_budget_bytes (int): Memory held by in-memory entries
+            spill_bytes (int): Results at least this large are spilled to Parquet files
+            disk_budget_bytes (int): Disk held by spilled entries
+            spill_dir (Optional[str]): Directory for spilled results, by default one per
+                connection string and process under PATHS["temp_dir"]
+        """
+        if spill_dir is None:
+            spill_dir = os.path.join(
+                PATHS["temp_dir"], "result_cache", hashlib.sha256(pool.connection_string.encode()).hexdigest()[:16],
+                str(os.getpid()),
+            )
+        self.pool = pool
+        self.catalog = catalog
+        self.memory_budget_bytes = memory_budget_bytes
+        self.spill_bytes = spill_bytes
+        self.disk_budget_bytes = disk_budget_bytes
+        self.spill_dir = spill_dir
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "evictions": 0,
+            "spills": 0,
+            "uncacheable": 0,
+        }
+
+        # Spilled files do not survive a restart of the process. Other processes
+        # (API, batch runs, more app workers) keep their own directories
+        remove_stale_spill_dirs(os.path.dirname(spill_dir))
+        shutil.rmtree(spill_dir, ignore_errors=True)
+        os.makedirs(spill_dir, exist_ok=True)
+
+    def _table_versions(self, tables: list) -> Dict[str, tuple]:
+        """Read the current modification counters of the given tables"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(TABLE_VERSION_QUERY, (self.catalog.schema_name, tables))
+            return {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+
+    def _drop(self, key: str):
+        """Remove an entry and its spill file. Caller holds the lock."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        if entry["path"] is not None:
+            self._disk_bytes -= entry["bytes"]
+            try:
+                os.remove(entry["path"])
+            except OSError:
+                pass
+        else:
+            self._memory_bytes -= entry["bytes"]
+
+    def _evict(self):
+        """Evict least recently used entries until both budgets hold. Caller holds the lock."""
+        for key in list(self._entries):
+            if self._memory_bytes <= self.memory_budget_bytes and self._disk_bytes <= self.disk_budget_bytes:
+                break
+            entry = self._entries[key]
+            over_memory = entry["path"] is None and self._memory_bytes > self.memory_budget_bytes
+            over_disk = entry["path"] is not None and self._disk_bytes > self.disk_budget_bytes
+            if over_memory or over_disk:
+                self._drop(key)
+                self._counters["evictions"] += 1
+
+    def lookup(self, query: str) -> Tuple[Optional[pd.DataFrame], Optional[dict]]:
+        """
+        Look up the result of a query
+
+        Args:
+            query (str): SQL query about to be executed
+
+        Returns:
+            Tuple[Optional[pd.DataFrame], Optional[dict]]:
+                - Cached result (a private copy) on a hit, None otherwise
+                - On a miss, a token to pass to `store` after executing the query;
+                  None if the query cannot be cached
+        """
+        tables, deterministic = referenced_tables(query)
+        tables = [self.catalog.local_name(t) for t in tables]
+        if not tables or not deterministic or not all(t is not None and self.catalog.is_base_table(t) for t in tables):
+            # Views, functions, volatile expressions and tables of other schemas
+            # cannot be tracked through the counters of this schema's tables
+            with self._lock:
+                self._counters["uncacheable"] += 1
+            return None, None
+
+        tables = sorted(set(tables))
+        key = hashlib.sha256(normalize_sql(query).encode()).hexdigest()
+        versions = self._table_versions(tables)
+        token = {"key": key, "tables": tables, "versions": versions}
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["versions"] != versions:
+                self._drop(key)
+                self._counters["invalidations"] += 1
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None, token
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            path, df = entry["path"], entry["df"]
+
+        if path is not None:
+            try:
+                df = pd.read_parquet(path, memory_map=True)
+            except Exception:
+                with self._lock:
+                    self._drop(key)
+                return None, token
+        else:
+            df = df.copy()
+        df.attrs.update(entry["attrs"])
+        df.attrs["result_cache_hit"] = True
+        return df, None
+
+    def store(self, token: dict, df: pd.DataFrame):
+        """
+        Store a result fetched after a cache miss
+
+        Args:
+            token (dict): Token returned by `lookup`
+            df (pd.DataFrame): Complete (not truncated) query result
+        """
+        size = int(df.memory_usage(deep=True).sum())
+        entry = {
+            "tables": token["tables"],
+            "versions": token["versions"],
+            "bytes": size,
+            "attrs": dict(df.attrs),
+            "df": None,
+            "path": None,
+        }
+
+        if size >= self.spill_bytes:
+            if size > self.disk_budget_bytes:
+                return
+            path = os.path.join(self.spill_dir, f"{token['key']}-{uuid.uuid4().hex[:8]}.parquet")
+            try:
+                df.to_parquet(path, index=False)
+            except Exception:
+                return  # e.g. object columns Parquet cannot represent
+            entry["path"] = path
+            entry["bytes"] = os.path.getsize(path)
+        else:
+            if size > self.memory_budget_bytes:
+                return
+            entry["df"] = df.copy()
+
+        with self._lock:
+            self._drop(token["key"])
+            self._entries[token["key"]] = entry
+            if entry["path"] is not None:
+                self._disk_bytes += entry["bytes"]
+                self._counters["spills"] += 1
+            else:
+                self._memory_bytes += entry["bytes"]
+            self._evict()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Snapshot of cache counters
+
+        Returns:
+            Dict[str, float]: Hits, misses, invalidations, evictions, spills and bytes held
+        """
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot["entries"] = len(self._entries)
+            snapshot["memory_bytes"] = self._memory_bytes
+            snapshot["disk_bytes"] = self._disk_bytes
+        return snapshot
+
+
+# Result caches are shared by every session using the same connection string
+_result_caches: Dict[str, ResultCache] = {}
+_result_caches_lock = threading.Lock()
+
+def get_result_cache(connection_string: str, pool, catalog) -> ResultCache:
+    """Get or create the shared ResultCache for a connection string"""
+    with _result_caches_lock:
+        cache = _result_caches.get(connection_string)
+        if cache is None or cache.pool is not pool:
+            cache = ResultCache(pool, catalog)
+            _result_caches[connection_string] = cache
+        return cache
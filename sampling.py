@@ -0,0 +1,101 @@
+# src/core/sampling.py
+
+import re
+from typing import Optional
+import sqlparse
+from sqlparse import tokens as T
+from config import SAMPLING_CONFIG
+from helpers import is_identifier_token
+
+# Constructs whose result changes meaning (not just size) when input rows are sampled
+_NOT_ROW_SAMPLEABLE = re.compile(
+    r"\b(GROUP\s+BY|DISTINCT|LIMIT|FETCH|OFFSET|UNION|INTERSECT|EXCEPT|OVER|HAVING|JOIN|"
+    r"COUNT|SUM|AVG|MIN|MAX|ARRAY_AGG|STRING_AGG|PERCENTILE_CONT|PERCENTILE_DISC|TABLESAMPLE)\b",
+    re.IGNORECASE,
+)
+
+def _tablesample_rewrite(query: str, percent: float, method: str, seed: int) -> Optional[str]:
+    """
+    Insert a TABLESAMPLE clause into a plain single-table SELECT
+
+    Returns:
+        Optional[str]: Rewritten query, None if the query is not a plain
+        `SELECT ... FROM table [alias] [WHERE ...] [ORDER BY ...]`
+    """
+    if _NOT_ROW_SAMPLEABLE.search(query) or query.count("(") != query.count(")"):
+        return None
+    statements = sqlparse.parse(query)
+    if len(statements) != 1 or statements[0].get_type() != "SELECT":
+        return None
+
+    tokens = [token for token in statements[0].flatten()]
+    significant = [i for i, token in enumerate(tokens) if not token.is_whitespace and token.ttype not in T.Comment]
+    from_positions = [i for i in significant if tokens[i].is_keyword and tokens[i].value.upper() == "FROM"]
+    if len(from_positions) != 1:
+        return None
+
+    # Walk: table name [. name] [AS] [alias]; TABLESAMPLE goes after the alias
+    cursor = significant.index(from_positions[0]) + 1
+    if cursor >= len(significant) or not is_identifier_token(tokens[significant[cursor]]):
+        return None
+    end = significant[cursor]
+    if cursor + 2 < len(significant) and tokens[significant[cursor + 1]].value == ".":
+        cursor += 2
+        end = significant[cursor]
+    cursor += 1
+    if cursor < len(significant) and tokens[significant[cursor]].is_keyword and tokens[significant[cursor]].value.upper() == "AS":
+        cursor += 1
+    if cursor < len(significant) and is_identifier_token(tokens[significant[cursor]]):
+        end = significant[cursor]
+        cursor += 1
+    if cursor < len(significant):
+        following = tokens[significant[cursor]]
+        if not following.is_keyword or following.value.upper() not in ("WHERE", "ORDER BY"):
+            return None  # functions, subqueries or several relations in FROM
+
+    clause = f" TABLESAMPLE {method} ({percent:.6g}) REPEATABLE ({seed})"
+    return "".join(token.value for token in tokens[:end + 1]) + clause + "".join(token.value for token in tokens[end + 1:])
+
+def plan_sample(
+    query: str,
+    plan_rows: float,
+    row_budget: int = SAMPLING_CONFIG["row_budget"],
+    method: str = SAMPLING_CONFIG["method"],
+    seed: int = SAMPLING_CONFIG["seed"],
+) -> Optional[dict]:
+    """
+    Decide how to shrink a query whose planner estimate exceeds the row budget
+
+    Plain single-table selects are sampled with TABLESAMPLE at the fraction
+    that brings the estimate down to the budget, so the sample stays spread
+    over the whole table. Anything else (joins, aggregates, ...) gets a LIMIT,
+    which keeps exact values but only the first rows.
+
+    Args:
+        query (str): Validated SQL query
+        plan_rows (float): Planner estimate of result rows
+        row_budget (int): Rows the analysis needs at most
+        method (str): TABLESAMPLE method, "SYSTEM" (block sampling, fast) or "BERNOULLI" (row sampling)
+        seed (int): REPEATABLE seed so reruns return the same sample
+
+    Returns:
+        Optional[dict]: None if no sampling is needed, otherwise
+            {"query", "method", "estimated_rows", "percent"}; LIMIT rewrites
+            have "percent" None and the row limit in "rows"
+    """
+    if plan_rows <= row_budget:
+        return None
+    query = query.strip().rstrip(";")
+    percent = max(min(100.0 * row_budget / plan_rows, 100.0), 0.0001)
+
+    sampled = _tablesample_rewrite(query, percent, method.upper(), seed)
+    if sampled is not None:
+        return {"query": sampled, "method": f"TABLESAMPLE {method.upper()}", "estimated_rows": plan_rows, "percent": percent}
+    # A LIMIT keeps the first rows, not a share of every table: no percentage applies
+    return {
+        "query": f"SELECT * FROM (\n{query}\n) AS _sampled LIMIT {int(row_budget)}",
+        "method": "LIMIT",
+        "estimated_rows": plan_rows,
+        "percent": None,
+        "rows": int(row_budget),
+    }
@@ -0,0 +1,488 @@
+# src/core/sandbox.py
+
+import gc
+import io
+import multiprocessing
+import pickle
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+from analysis_runner import AnalysisResult
+from config import SANDBOX_CONFIG
+
+try:
+    import resource  # POSIX only: CPU and memory limits are skipped elsewhere
+except ImportError:
+    resource = None
+
+class SandboxError(RuntimeError):
+    """Raised when analysis code fails inside the sandbox or breaks its limits"""
+
+
+class SharedFrame:
+    def __init__(self, df: pd.DataFrame):
+        """
+        A DataFrame published to shared memory as an Arrow IPC stream.
+        Workers map the segment and read it without the data passing through
+        a pipe or pickle. Falls back to pickling for frames Arrow cannot hold.
+
+        Args:
+            df (pd.DataFrame): Data to publish
+        """
+        self.shm = None
+        self.size = 0
+        self.pickled = None
+        try:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            sizer = pa.MockOutputStream()
+            with pa.ipc.new_stream(sizer, table.schema) as writer:
+                writer.write_table(table)
+            self.size = sizer.size()
+            self.shm = shared_memory.SharedMemory(create=True, size=max(self.size, 1))
+            # Serialize straight into the shared segment, no intermediate buffer
+            target = pa.py_buffer(self.shm.buf)
+            sink = pa.FixedSizeBufferWriter(target)
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            sink.close()
+            del sink, target  # release the exported view so the segment can be closed
+        except Exception:
+            self.close()
+            self.pickled = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def descriptor(self) -> dict:
+        """What a worker needs to read the frame"""
+        if self.shm is not None:
+            return {"shm_name": self.shm.name, "size": self.size}
+        return {"pickled": self.pickled}
+
+    def close(self):
+        """Release the shared memory segment"""
+        if self.shm is not None:
+            self.shm.close()
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def _read_frame(descriptor: dict):
+    """
+    Worker side: map the DataFrame described by SharedFrame.descriptor()
+
+    Returns:
+        Tuple[pd.DataFrame, Optional[SharedMemory]]: The frame, whose columns may
+            point straight into the segment, and the segment to close once the
+            frame and everything derived from it are gone
+    """
+    if "pickled" in descriptor:
+        return pickle.loads(descriptor["pickled"]), None
+    import pyarrow as pa
+    try:
+        shm = shared_memory.SharedMemory(name=descriptor["shm_name"], track=False)
+    except TypeError:
+        # Python < 3.13 has no `track`; workers share the parent's resource tracker,
+        # which already knows the segment and unlinks it if the parent dies
+        shm = shared_memory.SharedMemory(name=descriptor["shm_name"])
+    table = pa.ipc.open_stream(pa.py_buffer(shm.buf)[:descriptor["size"]]).read_all()
+    return table.to_pandas(), shm
+
+
+def _close_segment(shm):
+    """Worker side: unmap a segment once no array points into it"""
+    if shm is None:
+        return
+    gc.collect()
+    try:
+        shm.close()
+    except BufferError:
+        pass  # something still references the data; the mapping goes when it does
+
+
+def _frame_to_arrow_bytes(df: pd.DataFrame) -> Optional[bytes]:
+    """Serialize a DataFrame as Arrow IPC, None if Arrow cannot hold it"""
+    try:
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    except Exception:
+        return None
+
+
+def _arrow_bytes_to_frame(data: bytes) -> pd.DataFrame:
+    """Parent side: inverse of _frame_to_arrow_bytes"""
+    import pyarrow as pa
+    return pa.ipc.open_stream(data).read_all().to_pandas()
+
+
+# Values that cross the pipe as they are. Exact types only: a subclass could
+# bring its own __reduce__
+_PLAIN_TYPES = (type(None), bool, int, float, complex, str, bytes)
+_CONTAINERS = {"list": list, "tuple": tuple, "set": set, "frozenset": frozenset}
+_MAX_DEPTH = 32
+
+
+def _safe_text(value, render=repr) -> str:
+    """Worker side: text of a value from generated code, whose __repr__/__str__ may misbehave"""
+    try:
+        text = render(value)
+        if type(text) is str:
+            return text
+    except Exception:
+        pass
+    return f"<{type(value).__name__} object>"
+
+
+def _encode(value, depth: int = 0):
+    """
+    Worker side: turn an analysis value into tagged builtins the parent can
+    load without resolving a class (see _loads). Frames, series and 1-D
+    arrays travel as Arrow IPC, pandas scalars (timestamps and the like) as
+    a one-row Arrow column, anything else as its repr.
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if type(value) in _PLAIN_TYPES:
+        return ("plain", value)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        frame = value.to_frame() if isinstance(value, pd.Series) else value
+        data = _frame_to_arrow_bytes(frame)
+        if data is not None:
+            return ("arrow", data, isinstance(value, pd.Series))
+    elif isinstance(value, np.ndarray):
+        data = _frame_to_arrow_bytes(pd.DataFrame({"values": value})) if value.ndim == 1 else None
+        if data is not None:
+            return ("array", data)
+    elif type(value).__name__ in _CONTAINERS and type(value) is _CONTAINERS[type(value).__name__]:
+        if depth < _MAX_DEPTH:
+            return (type(value).__name__, [_encode(item, depth + 1) for item in value])
+    elif type(value) is dict:
+        if depth < _MAX_DEPTH:
+            return ("dict", [(_encode(key, depth + 1), _encode(item, depth + 1)) for key, item in value.items()])
+    else:
+        try:
+            column = pd.Series([value])
+            data = _frame_to_arrow_bytes(column.to_frame("value")) if column.dtype != object else None
+        except Exception:
+            data = None
+        if data is not None:
+            return ("scalar", data)
+    return ("repr", _safe_text(value))
+
+
+def _decode(node):
+    """Parent side: inverse of _encode"""
+    kind = node[0]
+    if kind == "plain":
+        return node[1]
+    if kind == "arrow":
+        df = _arrow_bytes_to_frame(node[1])
+        return df.iloc[:, 0] if node[2] else df
+    if kind == "array":
+        return _arrow_bytes_to_frame(node[1]).iloc[:, 0].to_numpy()
+    if kind == "scalar":
+        return _arrow_bytes_to_frame(node[1]).iloc[0, 0]
+    if kind in _CONTAINERS:
+        return _CONTAINERS[kind](_decode(item) for item in node[1])
+    if kind == "dict":
+        return {_decode(key): _decode(item) for key, item in node[1]}
+    if kind == "repr":
+        return str(node[1])
+    raise SandboxError(f"unknown value kind in sandbox reply: {kind!r}")
+
+
+def _encode_outputs(outputs: list) -> list:
+    """Worker side: recorded display calls with their arguments encoded"""
+    return [
+        {"call": str(output["call"]), "args": _encode(tuple(output["args"])), "kwargs": _encode(dict(output["kwargs"]))}
+        for output in outputs
+    ]
+
+
+def _decode_outputs(outputs: list) -> list:
+    """Parent side: inverse of _encode_outputs"""
+    return [
+        {"call": str(output["call"]), "args": tuple(_decode(output["args"])), "kwargs": dict(_decode(output["kwargs"]))}
+        for output in outputs
+    ]
+
+
+class _PlainUnpickler(pickle.Unpickler):
+    """Loads builtins only: a reply that names any class or callable is refused"""
+
+    def find_class(self, module, name):
+        if (module, name) == ("builtins", "complex"):
+            return complex
+        raise pickle.UnpicklingError(f"sandbox reply references {module}.{name}")
+
+
+def _loads(data: bytes):
+    """Parent side: load a worker message. Workers run untrusted code, so
+    replies are plain data and never go through pickle.loads"""
+    return _PlainUnpickler(io.BytesIO(data)).load()
+
+
+def _send_plain(conn, message: dict):
+    """Worker side: send a message made of builtins, see _loads"""
+    conn.send_bytes(pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _worker_main(conn, memory_mb: Optional[int], cpu_seconds: Optional[float]):
+    """Entry point of a sandbox worker process"""
+    if resource is not None and memory_mb:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = memory_mb * 1024 * 1024
+        # Lowering the hard limit as well keeps generated code from raising it again
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit if hard == resource.RLIM_INFINITY or hard > limit else hard))
+
+    # Pre-warm: pay the heavy imports once per worker, not per analysis
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+    import pyarrow  # noqa: F401
+    try:
+        import seaborn  # noqa: F401
+    except ImportError:
+        pass
+    from analysis_runner import run_analysis_code
+
+    _send_plain(conn, {"ready": True})
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+
+        if resource is not None and cpu_seconds:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            used = usage.ru_utime + usage.ru_stime
+            _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            # SIGXCPU terminates the worker once this task used its CPU budget
+            resource.setrlimit(resource.RLIMIT_CPU, (int(used + cpu_seconds) + 1, hard))
+
+        shm = None
+        try:
+            started = time.perf_counter()
+            df, shm = _read_frame(task["frame"])
+            load_seconds = time.perf_counter() - started
+            result = run_analysis_code(task["code"], df, task.get("variables"))
+            result.timings["load_seconds"] = load_seconds
+            reply = {
+                "ok": True,
+                "value": _encode(result.value),
+                "outputs": _encode_outputs(result.outputs),
+                "figures": [bytes(figure) for figure in result.figures],
+                "timings": {str(name): float(seconds) for name, seconds in result.timings.items()},
+                "reductions": [str(note) for note in result.reductions],
+            }
+        except MemoryError:
+            reply = {"ok": False, "error": f"analysis exceeded the memory limit of {memory_mb} MB"}
+        except Exception as e:
+            reply = {"ok": False, "error": _safe_text(e, str)}
+        df = result = None
+        _close_segment(shm)
+        _send_plain(conn, reply)
+
+
+class _Worker:
+    def __init__(self, context, memory_mb, cpu_seconds):
+        parent_conn, child_conn = context.Pipe()
+        self.conn = parent_conn
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, memory_mb, cpu_seconds), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self, timeout: float) -> bool:
+        if not self.ready and self.conn.poll(timeout):
+            self.ready = _loads(self.conn.recv_bytes()).get("ready", False) is True
+        return self.ready
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(1)
+        except Exception:
+            pass
+        self.conn.close()
+
+
+class SandboxPool:
+    def __init__(
+        self,
+        workers: int = SANDBOX_CONFIG["workers"],
+        cpu_seconds: Optional[float] = SANDBOX_CONFIG["cpu_seconds"],
+        memory_mb: Optional[int] = SANDBOX_CONFIG["memory_mb"],
+        wall_timeout: float = SANDBOX_CONFIG["wall_timeout"],
+        start_method: str = SANDBOX_CONFIG["start_method"],
+        checkout_timeout: float = SANDBOX_CONFIG["checkout_timeout"],
+    ):
+        """
+        Pool of pre-warmed worker processes that run generated analysis code
+        outside the Streamlit server process
+
+        Args:
+            workers (int): Number of worker processes
+            cpu_seconds (Optional[float]): CPU time per analysis before the worker is killed
+            memory_mb (Optional[int]): Address-space limit of each worker
+            wall_timeout (float): Wall-clock seconds per analysis before the worker is killed
+            start_method (str): multiprocessing start method; "forkserver" avoids forking
+                the threaded server process where it is available
+            checkout_timeout (float): Seconds an analysis waits for an idle worker
+        """
+        if start_method not in multiprocessing.get_all_start_methods():
+            start_method = "spawn"
+        self.context = multiprocessing.get_context(start_method)
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.wall_timeout = wall_timeout
+        self.checkout_timeout = checkout_timeout
+
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._counters = {"runs": 0, "failures": 0, "killed": 0, "restarts": 0}
+        for _ in range(workers):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self.context, self.memory_mb, self.cpu_seconds)
+
+    def _replace(self, worker: _Worker):
+        """Kill a broken worker and put a fresh one in its place"""
+        worker.kill()
+        with self._lock:
+            self._counters["restarts"] += 1
+        self._idle.put(self._spawn())
+
+    def run(self, code: str, frame: SharedFrame, variables: Optional[dict] = None) -> AnalysisResult:
+        """
+        Run analysis code in a worker
+
+        Args:
+            code (str): Generated analysis code
+            frame (SharedFrame): The data, already published to shared memory
+            variables (Optional[dict]): More names defined for the code; pickled
+                through the pipe, so keep them small
+
+        Returns:
+            AnalysisResult: Deserialized value, display calls, PNG figures and timings
+
+        Raises:
+            SandboxError: The code raised, or the worker broke a limit or died
+        """
+        try:
+            worker = self._idle.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            raise SandboxError(f"no sandbox worker became free within {self.checkout_timeout:.0f}s")
+        with self._lock:
+            self._counters["runs"] += 1
+        try:
+            if not worker.wait_ready(self.wall_timeout):
+                raise SandboxError("sandbox worker failed to start")
+            started = time.perf_counter()
+            worker.conn.send({"code": code, "frame": frame.descriptor(), "variables": variables})
+            if not worker.conn.poll(self.wall_timeout):
+                with self._lock:
+                    self._counters["killed"] += 1
+                raise SandboxError(f"analysis exceeded the time limit of {self.wall_timeout:.0f}s")
+            reply = _loads(worker.conn.recv_bytes())
+            if reply["ok"]:
+                result = AnalysisResult(
+                    code=code,
+                    value=_decode(reply["value"]),
+                    outputs=_decode_outputs(reply["outputs"]),
+                    figures=[bytes(figure) for figure in reply["figures"]],
+                    reductions=[str(note) for note in reply["reductions"]],
+                    timings={str(name): float(seconds) for name, seconds in reply["timings"].items()},
+                )
+            else:
+                error = str(reply["error"])
+        except (EOFError, OSError, BrokenPipeError):
+            with self._lock:
+                self._counters["failures"] += 1
+                self._counters["killed"] += 1
+            self._replace(worker)
+            raise SandboxError(
+                f"analysis worker died (CPU limit of {self.cpu_seconds}s or memory limit of {self.memory_mb} MB exceeded?)"
+            )
+        except SandboxError:
+            with self._lock:
+                self._counters["failures"] += 1
+            self._replace(worker)
+            raise
+        except BaseException as e:
+            # Unpicklable variables, a malformed or refused reply: the pipe may
+            # hold half a message, so the worker is not reused
+            with self._lock:
+                self._counters["failures"] += 1
+            self._replace(worker)
+            if not isinstance(e, Exception):
+                raise
+            raise SandboxError(f"sandbox transfer failed: {e}") from e
+
+        self._idle.put(worker)
+        if not reply["ok"]:
+            with self._lock:
+                self._counters["failures"] += 1
+            raise SandboxError(error)
+
+        result.timings["sandbox_seconds"] = time.perf_counter() - started
+        return result
+
+    def stats(self) -> dict:
+        """Return run/failure counters"""
+        with self._lock:
+            snapshot = dict(self._counters)
+        snapshot["idle_workers"] = self._idle.qsize()
+        return snapshot
+
+    def worker_pids(self) -> List[int]:
+        """Process ids of the idle workers, e.g. to read their memory use"""
+        with self._idle.mutex:
+            return [worker.process.pid for worker in self._idle.queue]
+
+    def close(self):
+        """Stop all idle workers"""
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                worker.conn.send(None)
+            except Exception:
+                pass
+            worker.kill()
+
+
+# Create a singleton instance shared by all sessions
+_sandbox_pool = None
+_sandbox_pool_lock = threading.Lock()
+
+def get_sandbox_pool() -> SandboxPool:
+    """Get or create the shared SandboxPool"""
+    global _sandbox_pool
+    with _sandbox_pool_lock:
+        if _sandbox_pool is None:
+            _sandbox_pool = SandboxPool()
+        return _sandbox_pool
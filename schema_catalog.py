@@ -0,0 +1,243 @@
+# src/core/schema_catalog.py
+
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from config import ADVISOR_CONFIG, SCHEMA_CONFIG
+
+# One round trip for every table, column, type, comment, primary key and foreign key
+CATALOG_QUERY = """
+SELECT
+    c.relname,
+    c.relkind,
+    COALESCE((
+        SELECT json_agg(json_build_array(
+            a.attname, format_type(a.atttypid, a.atttypmod), a.attnotnull, col_description(c.oid, a.attnum)
+        ) ORDER BY a.attnum)
+        FROM pg_attribute a
+        WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    ), '[]'::json),
+    COALESCE((
+        SELECT json_agg(json_build_array(
+            con.contype,
+            con.conname,
+            (SELECT json_agg(a.attname ORDER BY k.ord)
+             FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+             JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum),
+            fc.relname,
+            (SELECT json_agg(a.attname ORDER BY k.ord)
+             FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, ord)
+             JOIN pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum)
+        ) ORDER BY con.conname)
+        FROM pg_constraint con
+        LEFT JOIN pg_class fc ON fc.oid = con.confrelid
+        WHERE con.conrelid = c.oid AND con.contype IN ('p', 'f')
+    ), '[]'::json),
+    obj_description(c.oid, 'pg_class')
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = %s AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+ORDER BY c.relname;
+"""
+
+# Cheap DDL detector: any CREATE/ALTER/DROP rewrites rows in these catalogs,
+# which changes their row counts or the newest xmin
+CATALOG_VERSION_QUERY = """
+SELECT
+    (SELECT count(*) || ':' || COALESCE(max(c.xmin::text::bigint), 0)
+     FROM pg_class c WHERE c.relnamespace = n.oid),
+    (SELECT count(*) || ':' || COALESCE(max(a.xmin::text::bigint), 0)
+     FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid
+     WHERE c.relnamespace = n.oid),
+    (SELECT count(*) || ':' || COALESCE(max(con.xmin::text::bigint), 0)
+     FROM pg_constraint con WHERE con.connamespace = n.oid)
+FROM pg_namespace n
+WHERE n.nspname = %s;
+"""
+
+BASE_TABLE_KINDS = ("r", "p")
+
+class SchemaCatalog:
+    def __init__(
+        self,
+        pool,
+        schema_name: str = SCHEMA_CONFIG["schema_name"],
+        version_check_interval: float = SCHEMA_CONFIG["version_check_interval"],
+    ):
+        """
+        In-memory catalog of the tables in one PostgreSQL schema
+
+        Args:
+            pool (ConnectionPool): Pool used for the catalog queries
+            schema_name (str): Schema whose tables are exposed
+            version_check_interval (float): Minimum seconds between DDL version checks
+        """
+        self.pool = pool
+        self.schema_name = schema_name
+        self.version_check_interval = version_check_interval
+
+        self._lock = threading.Lock()
+        self._tables: Dict[str, dict] = {}
+        self._table_names: List[str] = []
+        self._schema_text: Dict[str, str] = {}
+        self._table_fingerprints: Dict[str, str] = {}
+        self.fingerprint: Optional[str] = None
+        self.version: Optional[tuple] = None
+        self._last_check = 0.0
+        self.loads = 0
+
+    def _fetch_version(self, conn) -> tuple:
+        """Fetch the current catalog version token"""
+        cursor = conn.cursor()
+        cursor.execute(CATALOG_VERSION_QUERY, (self.schema_name,))
+        row = cursor.fetchone()
+        return tuple(row) if row else ()
+
+    def _load(self, conn, version: tuple):
+        """Bulk-load the catalog. Caller holds the lock."""
+        cursor = conn.cursor()
+        cursor.execute(CATALOG_QUERY, (self.schema_name,))
+        tables = {}
+        for relname, relkind, columns, constraints, comment in cursor.fetchall():
+            if relkind == "m" and relname.startswith(ADVISOR_CONFIG["view_prefix"]):
+                continue  # queries are rewritten to advisor views, never generated against them
+            primary_key = []
+            foreign_keys = []
+            for contype, conname, con_columns, ref_table, ref_columns in constraints:
+                if contype == "p":
+                    primary_key = con_columns or []
+                else:
+                    foreign_keys.append({
+                        "name": conname,
+                        "columns": con_columns or [],
+                        "ref_table": ref_table,
+                        "ref_columns": ref_columns or [],
+                    })
+            tables[relname] = {
+                "kind": relkind,
+                "columns": [(name, data_type, not_null) for name, data_type, not_null, _ in columns],
+                "primary_key": primary_key,
+                "foreign_keys": foreign_keys,
+                "comment": comment,
+                "column_comments": {name: text for name, _, _, text in columns if text},
+            }
+
+        self._tables = tables
+        self._table_names = list(tables)
+        self._schema_text = {}
+        self._table_fingerprints = {
+            name: hashlib.sha256(json.dumps(table, sort_keys=True).encode()).hexdigest()
+            for name, table in tables.items()
+        }
+        self.fingerprint = hashlib.sha256(
+            json.dumps(self._table_fingerprints, sort_keys=True).encode()
+        ).hexdigest()
+        self.version = version
+        self.loads += 1
+
+    def refresh(self, force: bool = False):
+        """
+        Reload the catalog if DDL changed it since the last load
+
+        Args:
+            force (bool): Reload without comparing catalog versions
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and self.version is not None and now - self._last_check < self.version_check_interval:
+                return
+            with self.pool.connection() as conn:
+                version = self._fetch_version(conn)
+                if force or version != self.version:
+                    self._load(conn, version)
+            self._last_check = now
+
+    def list_tables(self) -> List[str]:
+        """Return the table names of the schema"""
+        self.refresh()
+        return list(self._table_names)
+
+    def get_table(self, table_name: str) -> Optional[dict]:
+        """Return the catalog entry of a table, or None if it does not exist"""
+        self.refresh()
+        return self._tables.get(table_name)
+
+    def snapshot(self) -> Tuple[Optional[str], Dict[str, dict]]:
+        """Return the catalog fingerprint together with every table entry"""
+        self.refresh()
+        with self._lock:
+            return self.fingerprint, dict(self._tables)
+
+    def table_fingerprint(self, table_name: str) -> Optional[str]:
+        """Return a hash identifying the current definition of a table"""
+        self.refresh()
+        return self._table_fingerprints.get(table_name)
+
+    def local_name(self, table_name: str) -> Optional[str]:
+        """
+        Resolve a name returned by helpers.referenced_tables against this schema
+
+        Args:
+            table_name (str): Relation name, possibly qualified as "schema.relation"
+
+        Returns:
+            Optional[str]: The unqualified name, None if it is qualified with another schema
+        """
+        schema, dot, name = table_name.rpartition(".")
+        if not dot:
+            return table_name
+        return name if schema == self.schema_name else None
+
+    def is_base_table(self, table_name: str) -> bool:
+        """Whether the name refers to a regular or partitioned table (not a view)"""
+        table = self.get_table(table_name)
+        return table is not None and table["kind"] in BASE_TABLE_KINDS
+
+    def get_table_schema(self, table_name: str) -> Optional[str]:
+        """
+        Format a table as a CREATE TABLE statement
+
+        Args:
+            table_name (str): Name of the table
+
+        Returns:
+            Optional[str]: CREATE TABLE statement, None if the table does not exist
+        """
+        self.refresh()
+        schema = self._schema_text.get(table_name)
+        if schema is not None:
+            return schema
+        table = self._tables.get(table_name)
+        if table is None:
+            return None
+
+        lines = []
+        for column_name, data_type, not_null in table["columns"]:
+            nullable = "NOT NULL" if not_null else "NULL"
+            lines.append(f"    {column_name} {data_type} {nullable}")
+        if table["primary_key"]:
+            lines.append(f"    PRIMARY KEY ({', '.join(table['primary_key'])})")
+        for fk in table["foreign_keys"]:
+            lines.append(
+                f"    FOREIGN KEY ({', '.join(fk['columns'])}) "
+                f"REFERENCES {fk['ref_table']} ({', '.join(fk['ref_columns'])})"
+            )
+        schema = f"CREATE TABLE {table_name} (\n" + ",\n".join(lines) + "\n);"
+        self._schema_text[table_name] = schema
+        return schema
+
+
+# Catalogs are shared by every session using the same connection string
+_catalogs: Dict[str, SchemaCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+def get_catalog(connection_string: str, pool) -> SchemaCatalog:
+    """Get or create the shared SchemaCatalog for a connection string"""
+    with _catalogs_lock:
+        catalog = _catalogs.get(connection_string)
+        if catalog is None or catalog.pool is not pool:
+            catalog = SchemaCatalog(pool)
+            _catalogs[connection_string] = catalog
+        return catalog
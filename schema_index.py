@@ -0,0 +1,277 @@
+# src/core/schema_index.py
+
+import math
+import re
+import threading
+from collections import Counter, deque
+from typing import Dict, List, Optional, Tuple
+from config import SCHEMA_CONFIG
+
+# Words that say nothing about which table a question is about
+STOPWORDS = set("""
+a an and are as at be by for from has have how i in is it its me my of on or per show
+tell than that the their them there these this those to was we were what when where which
+who whom why with give list find get all each every many much most top count
+average avg sum over between during please table tables
+""".split())
+
+def _stem(word: str) -> str:
+    """Crude plural stripping so 'orders' matches 'order' and 'categories' matches 'category'"""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("ses", "xes", "ches", "shes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split identifiers and prose into lower-case, stemmed terms
+
+    snake_case and camelCase identifiers are split into their words, so
+    `customer_id` and `customerId` both yield `customer` and `id`.
+    """
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text or "")
+    words = re.findall(r"[A-Za-z]+|\d+", text)
+    return [_stem(word.lower()) for word in words if word.lower() not in STOPWORDS]
+
+
+class SchemaIndex:
+    def __init__(
+        self,
+        catalog,
+        k1: float = 1.2,
+        b: float = 0.75,
+        table_name_weight: int = SCHEMA_CONFIG["table_name_weight"],
+    ):
+        """
+        BM25 index over the tables of a SchemaCatalog. A table's document holds
+        its name, column names, table and column comments and the names of the
+        tables it references. The index is rebuilt whenever the catalog
+        fingerprint changes.
+
+        Args:
+            catalog (SchemaCatalog): Catalog to index
+            k1 (float): BM25 term frequency saturation
+            b (float): BM25 length normalization
+            table_name_weight (int): How many times the table name counts in its document
+        """
+        self.catalog = catalog
+        self.k1 = k1
+        self.b = b
+        self.table_name_weight = table_name_weight
+
+        self._lock = threading.Lock()
+        self.fingerprint: Optional[str] = None
+        self._tables: Dict[str, dict] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._average_length = 0.0
+        self._graph: Dict[str, List[Tuple[str, str]]] = {}
+
+    def _build(self, fingerprint: str, tables: Dict[str, dict]):
+        """Build postings and the foreign key graph. Caller holds the lock."""
+        postings: Dict[str, Dict[str, int]] = {}
+        lengths = {}
+        graph: Dict[str, List[Tuple[str, str]]] = {name: [] for name in tables}
+        for name, table in tables.items():
+            terms = tokenize(name) * self.table_name_weight
+            terms += tokenize(table.get("comment") or "")
+            for column_name, _, _ in table["columns"]:
+                terms += tokenize(column_name)
+            for text in table.get("column_comments", {}).values():
+                terms += tokenize(text)
+            for fk in table["foreign_keys"]:
+                terms += tokenize(fk["ref_table"] or "")
+                if fk["ref_table"] in graph:
+                    condition = " AND ".join(
+                        f"{name}.{column} = {fk['ref_table']}.{ref_column}"
+                        for column, ref_column in zip(fk["columns"], fk["ref_columns"])
+                    )
+                    graph[name].append((fk["ref_table"], condition))
+                    if fk["ref_table"] != name:
+                        graph[fk["ref_table"]].append((name, condition))
+            for term, count in Counter(terms).items():
+                postings.setdefault(term, {})[name] = count
+            lengths[name] = len(terms)
+
+        self._tables = tables
+        self._postings = postings
+        self._lengths = lengths
+        self._average_length = sum(lengths.values()) / len(lengths) if lengths else 0.0
+        self._graph = graph
+        self.fingerprint = fingerprint
+
+    def _refresh(self):
+        """Rebuild the index if the catalog changed"""
+        fingerprint, tables = self.catalog.snapshot()
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                self._build(fingerprint, tables)
+
+    def rank(self, question: str) -> List[Tuple[str, float]]:
+        """
+        Score every table against a question with BM25
+
+        Returns:
+            List[Tuple[str, float]]: (table, score) for tables with a positive score, best first
+        """
+        self._refresh()
+        with self._lock:
+            count = len(self._lengths)
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(question)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for table, frequency in postings.items():
+                    norm = 1 - self.b + self.b * self._lengths[table] / (self._average_length or 1)
+                    scores[table] = scores.get(table, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + self.k1 * norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def _path(self, start: str, goal: str, max_hops: int) -> Optional[List[Tuple[str, str, str]]]:
+        """Shortest foreign key path as (from, to, join condition) edges. Caller holds the lock."""
+        parents = {start: None}
+        frontier = deque([(start, 0)])
+        while frontier:
+            table, depth = frontier.popleft()
+            if table == goal:
+                path = []
+                while parents[table] is not None:
+                    previous, condition = parents[table]
+                    path.append((previous, table, condition))
+                    table = previous
+                return list(reversed(path))
+            if depth == max_hops:
+                continue
+            for neighbour, condition in self._graph.get(table, []):
+                if neighbour not in parents:
+                    parents[neighbour] = (table, condition)
+                    frontier.append((neighbour, depth + 1))
+        return None
+
+    def select(
+        self,
+        question: str,
+        top_k: int = SCHEMA_CONFIG["top_k"],
+        max_join_hops: int = SCHEMA_CONFIG["max_join_hops"],
+        pinned: Optional[List[str]] = None,
+    ) -> dict:
+        """
+        Choose the tables a question needs and the joins between them
+
+        Args:
+            question (str): User's natural language query
+            top_k (int): Tables taken from the ranking
+            max_join_hops (int): Longest foreign key path used to connect two selected tables
+            pinned (Optional[List[str]]): Tables always included (e.g. picked in the UI)
+
+        Returns:
+            dict: {"tables": selected tables, ranked ones first then bridge tables,
+                   "scores": {table: score}, "joins": [(from, to, condition)],
+                   "schema": compact schema block for get_sql_prompt}
+        """
+        ranking = self.rank(question)
+        # Weak matches (e.g. only on `id`) are not worth their prompt tokens
+        cutoff = ranking[0][1] * SCHEMA_CONFIG["min_relative_score"] if ranking else 0.0
+        ranked = [table for table, score in ranking[:top_k] if score >= cutoff]
+        selected = list(dict.fromkeys((pinned or []) + ranked))
+        if not selected:
+            # Nothing matched: fall back to the tables with the most references
+            with self._lock:
+                selected = sorted(self._graph, key=lambda t: (-len(self._graph[t]), t))[:top_k]
+
+        joins: List[Tuple[str, str, str]] = []
+        with self._lock:
+            selected = [table for table in selected if table in self._tables]
+            connected = selected[:1]
+            remaining = selected[1:]
+            # Prim-style: repeatedly attach the table with the shortest path to the connected set
+            while remaining:
+                best = None
+                for table in remaining:
+                    for anchor in connected:
+                        path = self._path(anchor, table, max_join_hops)
+                        if path is not None and (best is None or len(path) < len(best[1])):
+                            best = (table, path)
+                if best is None:
+                    connected.extend(remaining)  # no foreign key path; the model has to infer the join
+                    break
+                table, path = best
+                remaining.remove(table)
+                for edge in path:
+                    if edge not in joins:
+                        joins.append(edge)
+                    for node in edge[:2]:
+                        if node not in connected:
+                            connected.append(node)
+                            if node in remaining:
+                                remaining.remove(node)
+            # Ranked tables first, bridge tables after them
+            connected = [table for table in selected if table in connected] + [
+                table for table in connected if table not in selected
+            ]
+            tables = {name: self._tables[name] for name in connected}
+
+        return {
+            "tables": connected,
+            "scores": dict(ranking),
+            "joins": joins,
+            "schema": format_compact_schema(tables, joins),
+        }
+
+
+def format_compact_schema(tables: Dict[str, dict], joins: List[Tuple[str, str, str]]) -> str:
+    """
+    One-line CREATE TABLE statements with keys and comments, followed by the join paths
+
+    Args:
+        tables (Dict[str, dict]): Catalog entries, in the order to print
+        joins (List[Tuple[str, str, str]]): (from, to, condition) edges
+
+    Returns:
+        str: Schema block for the SQL prompt
+    """
+    lines = []
+    for name, table in tables.items():
+        references = {}
+        for fk in table["foreign_keys"]:
+            for column, ref_column in zip(fk["columns"], fk["ref_columns"]):
+                references[column] = f"{fk['ref_table']}({ref_column})"
+        comments = table.get("column_comments", {})
+        columns = []
+        for column_name, data_type, _ in table["columns"]:
+            column = f"{column_name} {data_type}"
+            if column_name in table["primary_key"] and len(table["primary_key"]) == 1:
+                column += " PRIMARY KEY"
+            if column_name in references:
+                column += f" REFERENCES {references[column_name]}"
+            if column_name in comments:
+                column += f" /* {comments[column_name][:80]} */"
+            columns.append(column)
+        if len(table["primary_key"]) > 1:
+            columns.append(f"PRIMARY KEY ({', '.join(table['primary_key'])})")
+        line = f"CREATE TABLE {name} ({', '.join(columns)});"
+        if table.get("comment"):
+            line += f" -- {table['comment'][:120]}"
+        lines.append(line)
+    if joins:
+        lines.append("-- Join paths:")
+        lines.extend(f"--   {condition}" for _, _, condition in joins)
+    return "\n".join(lines)
+
+
+# Indexes are shared by every session using the same connection string
+_indexes: Dict[str, SchemaIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_schema_index(connection_string: str, catalog) -> SchemaIndex:
+    """Get or create the shared SchemaIndex for a connection string"""
+    with _indexes_lock:
+        index = _indexes.get(connection_string)
+        if index is None or index.catalog is not catalog:
+            index = SchemaIndex(catalog)
+            _indexes[connection_string] = index
+        return index
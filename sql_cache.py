@@ -0,0 +1,169 @@
+# src/core/sql_cache.py
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from config import CACHE_CONFIG, PATHS
+from helpers import normalize_question, schema_fingerprint, schema_tables
+
+class SQLCache:
+    def __init__(
+        self,
+        max_memory_entries: int = CACHE_CONFIG["sql_memory_entries"],
+        db_path: Optional[str] = os.path.join(PATHS["temp_dir"], CACHE_CONFIG["sql_cache_file"]),
+    ):
+        """
+        Two-tier cache of successfully executed SQL, keyed by the normalized
+        question and the tables it was asked against
+
+        Each entry remembers the fingerprint of the schema it was generated
+        for; a lookup against a changed schema drops the entry.
+
+        Args:
+            max_memory_entries (int): Size of the in-memory LRU tier
+            db_path (Optional[str]): SQLite file for the persistent tier, None to keep memory only
+        """
+        self.max_memory_entries = max_memory_entries
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[Tuple[str, str], Tuple[str, str]]" = OrderedDict()
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "stores": 0,
+        }
+
+        self._disk = None
+        if db_path:
+            self._disk = sqlite3.connect(db_path, check_same_thread=False)
+            self._disk.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sql_cache (
+                    question TEXT NOT NULL,
+                    scope TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (question, scope)
+                )
+                """
+            )
+            self._disk.commit()
+
+    @staticmethod
+    def _key(question: str, table_statement: str) -> Tuple[str, str]:
+        """Cache key: normalized question and the tables of the schema"""
+        return normalize_question(question), ",".join(schema_tables(table_statement))
+
+    def _delete(self, key: Tuple[str, str]):
+        """Drop an entry from both tiers. Caller holds the lock."""
+        self._memory.pop(key, None)
+        if self._disk is not None:
+            self._disk.execute("DELETE FROM sql_cache WHERE question = ? AND scope = ?", key)
+            self._disk.commit()
+
+    def _remember(self, key: Tuple[str, str], value: Tuple[str, str]):
+        """Insert into the memory tier, evicting the least recently used entry. Caller holds the lock."""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, question: str, table_statement: str) -> Optional[str]:
+        """
+        Look up the SQL previously generated for a question
+
+        Args:
+            question (str): User's natural language query
+            table_statement (str): Schema the question is asked against
+
+        Returns:
+            Optional[str]: Cached SQL, None on a miss or when the schema changed
+        """
+        key = self._key(question, table_statement)
+        fingerprint = schema_fingerprint(table_statement)
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT fingerprint, sql FROM sql_cache WHERE question = ? AND scope = ?", key
+                ).fetchone()
+                if row is not None:
+                    entry = tuple(row)
+                    if entry[0] == fingerprint:
+                        self._remember(key, entry)
+                        self._counters["disk_hits"] += 1
+                        return entry[1]
+            elif entry is not None and entry[0] == fingerprint:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return entry[1]
+
+            if entry is not None:
+                # Generated for an older version of the schema
+                self._delete(key)
+                self._counters["invalidations"] += 1
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, question: str, table_statement: str, sql: str):
+        """
+        Store the SQL that successfully answered a question
+
+        Args:
+            question (str): User's natural language query
+            table_statement (str): Schema the question was asked against
+            sql (str): Executed SQL query
+        """
+        key = self._key(question, table_statement)
+        value = (schema_fingerprint(table_statement), sql)
+        with self._lock:
+            self._remember(key, value)
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO sql_cache (question, scope, fingerprint, sql, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (*key, *value, time.time()),
+                )
+                self._disk.commit()
+            self._counters["stores"] += 1
+
+    def invalidate(self, question: str, table_statement: str):
+        """Drop the entry for a question, e.g. when its cached SQL stopped working"""
+        with self._lock:
+            self._delete(self._key(question, table_statement))
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Snapshot of cache counters
+
+        Returns:
+            Dict[str, float]: Hits per tier, misses, invalidations, stores, hit rate and size
+        """
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot["memory_entries"] = len(self._memory)
+        hits = snapshot["memory_hits"] + snapshot["disk_hits"]
+        lookups = hits + snapshot["misses"]
+        snapshot["hit_rate"] = hits / lookups if lookups else 0.0
+        return snapshot
+
+
+# Create a singleton instance shared by all sessions
+_sql_cache = None
+_sql_cache_lock = threading.Lock()
+
+def get_sql_cache() -> SQLCache:
+    """Get or create the shared SQLCache"""
+    global _sql_cache
+    with _sql_cache_lock:
+        if _sql_cache is None:
+            _sql_cache = SQLCache()
+        return _sql_cache
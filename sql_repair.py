@@ -0,0 +1,345 @@
+# src/core/sql_repair.py
+
+import difflib
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+from config import REPAIR_CONFIG
+from helpers import RESERVED_WORDS, referenced_tables
+
+_TOKEN = re.compile(
+    r"""(?P<string>'(?:[^']|'')*')
+      |(?P<quoted>"(?:[^"]|"")*")
+      |(?P<dollar>\$(?P<tag>[A-Za-z_]*)\$.*?\$(?P=tag)\$)
+      |(?P<comment>--[^\n]*|/\*.*?\*/)
+      |(?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+      |(?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+      |(?P<space>\s+)
+      |(?P<cast>::)
+      |(?P<punct>.)""",
+    re.VERBOSE | re.DOTALL,
+)
+
+# Clauses that end a GROUP BY list (or mark where a missing one goes)
+_AFTER_GROUP_BY = ("HAVING", "WINDOW", "ORDER", "LIMIT", "OFFSET", "FETCH", "FOR")
+_SET_OPERATIONS = ("UNION", "INTERSECT", "EXCEPT")
+_TEXT_TYPES = ("text", "character varying", "character", "varchar", "char", "name")
+
+# Aggregates and functions whose argument is commonly of the wrong type: name -> (argument, cast, accepted input types)
+_FUNCTION_CASTS = {
+    "round": (0, "numeric", ("double precision", "real")),
+    "sum": (0, "numeric", _TEXT_TYPES),
+    "avg": (0, "numeric", _TEXT_TYPES),
+    "stddev": (0, "numeric", _TEXT_TYPES),
+    "variance": (0, "numeric", _TEXT_TYPES),
+    "date_trunc": (1, "timestamp", _TEXT_TYPES),
+    "date_part": (1, "timestamp", _TEXT_TYPES),
+}
+
+def _lex(query: str) -> List[Tuple[str, int, int]]:
+    """Split SQL into (kind, start, end) tokens, keeping literals and comments whole"""
+    return [(match.lastgroup, match.start(), match.end()) for match in _TOKEN.finditer(query)]
+
+def _depths(query: str, tokens: List[Tuple[str, int, int]]) -> List[int]:
+    """Parenthesis depth at every token"""
+    depth, depths = 0, []
+    for kind, start, _ in tokens:
+        if kind == "punct" and query[start] == ")":
+            depth -= 1
+        depths.append(depth)
+        if kind == "punct" and query[start] == "(":
+            depth += 1
+    return depths
+
+def quote_identifier(name: str) -> str:
+    """Quote an identifier unless PostgreSQL would read it unquoted as the same name"""
+    if re.fullmatch(r"[a-z_][a-z0-9_$]*", name) and name.upper() not in RESERVED_WORDS:
+        return name
+    return '"' + name.replace('"', '""') + '"'
+
+def _identifier_name(query: str, kind: str, start: int, end: int) -> Optional[str]:
+    """The name an identifier token resolves to (unquoted names fold to lower case)"""
+    if kind == "word":
+        return query[start:end].lower()
+    if kind == "quoted":
+        return query[start + 1:end - 1].replace('""', '"')
+    return None
+
+def _replace_identifier(
+    query: str, bad: str, good: str, position: Optional[int], qualifiers: bool = False
+) -> Optional[str]:
+    """
+    Replace the reference to identifier `bad` the error points at with `good`
+
+    Aliases and column labels spelled like `bad` are left alone. PostgreSQL
+    reports a qualified name at its first part, so the last part of the dotted
+    name at the error position is the one replaced.
+
+    Args:
+        query (str): Query that failed to plan
+        bad (str): Identifier named by the error
+        good (str): Its replacement
+        position (Optional[int]): 1-based error position
+        qualifiers (bool): Also replace `bad.` qualifiers (a table referenced by its name)
+
+    Returns:
+        Optional[str]: The fixed query, None if `bad` is not at the error position
+    """
+    if not position:
+        return None
+    tokens = [token for token in _lex(query) if token[0] not in ("space", "comment")]
+    offset = position - 1
+    at = next((index for index, (_, start, end) in enumerate(tokens) if start <= offset < end), None)
+    if at is None:
+        return None
+    while (at + 2 < len(tokens) and query[tokens[at + 1][1]] == "."
+           and tokens[at + 2][0] in ("word", "quoted")):
+        at += 2
+    if _identifier_name(query, *tokens[at]) != bad:
+        return None
+
+    targets = [tokens[at]]
+    if qualifiers:
+        targets += [
+            token for index, token in enumerate(tokens[:-1])
+            if index != at and _identifier_name(query, *token) == bad and query[tokens[index + 1][1]] == "."
+        ]
+    fixed = query
+    for _, start, end in sorted(targets, key=lambda token: token[1], reverse=True):
+        fixed = fixed[:start] + quote_identifier(good) + fixed[end:]
+    return fixed
+
+def _closest(name: str, candidates: List[str], cutoff: float) -> Optional[str]:
+    """Exact case-insensitive match first, then the closest spelling"""
+    lowered = {candidate.lower(): candidate for candidate in candidates}
+    if name.lower() in lowered:
+        return lowered[name.lower()]
+    matches = difflib.get_close_matches(name.lower(), list(lowered), n=2, cutoff=cutoff)
+    if not matches:
+        return None
+    if len(matches) == 2:
+        first = difflib.SequenceMatcher(None, name.lower(), matches[0]).ratio()
+        second = difflib.SequenceMatcher(None, name.lower(), matches[1]).ratio()
+        if first == second:
+            return None  # two equally plausible fixes: leave it to the LLM
+    return lowered[matches[0]]
+
+
+class SQLRepairer:
+    def __init__(self, catalog, fuzzy_cutoff: float = REPAIR_CONFIG["fuzzy_cutoff"]):
+        """
+        Deterministic fixes for common planning errors, tried before asking
+        the LLM for a correction. Works on the structured errors returned by
+        PlanValidator (SQLSTATE, message, hint, position).
+
+        Args:
+            catalog (SchemaCatalog): Known tables and columns for fuzzy matching
+            fuzzy_cutoff (float): Minimum difflib similarity of a spelling fix
+        """
+        self.catalog = catalog
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {"errors_seen": 0, "local_fixes": 0, "llm_fallbacks": 0}
+        self._by_kind: Dict[str, Dict[str, int]] = {}
+
+    def repair(self, query: str, error: dict) -> Optional[Tuple[str, str]]:
+        """
+        Try to fix a query locally
+
+        Args:
+            query (str): Query that failed to plan
+            error (dict): Structured error from PlanValidator
+
+        Returns:
+            Optional[Tuple[str, str]]: (repaired query, description of the fix),
+                None if no local fix applies
+        """
+        handler = {
+            "undefined_column": self._fix_undefined_column,
+            "undefined_table": self._fix_undefined_table,
+            "grouping_error": self._fix_grouping,
+            "undefined_function": self._fix_cast,
+        }.get(error.get("kind"))
+        if handler is None:
+            return None
+        try:
+            return handler(query, error)
+        except Exception as e:
+            print(f"Local SQL repair failed: {e}")
+            return None
+
+    def _columns_in_scope(self, query: str) -> List[str]:
+        """Columns of the tables the query reads, or of every table if none is known"""
+        tables, _ = referenced_tables(query)
+        names = [self.catalog.local_name(table) for table in tables]
+        known = [self.catalog.get_table(name) for name in names if name is not None]
+        known = [table for table in known if table is not None]
+        if not known:
+            known = [self.catalog.get_table(table) for table in self.catalog.list_tables()]
+        return list(dict.fromkeys(column for table in known if table for column, _, _ in table["columns"]))
+
+    def _fix_undefined_column(self, query: str, error: dict) -> Optional[Tuple[str, str]]:
+        match = re.match(r'column (.+) does not exist', error["message"])
+        if not match:
+            return None
+        bad = match.group(1).strip('"').rpartition(".")[2].strip('"')
+
+        good = None
+        hint = re.findall(r'the column "([^"]+)"', error.get("hint") or "")
+        suggested = {name.rpartition(".")[2] for name in hint}
+        if len(suggested) == 1:
+            good = suggested.pop()
+        if good is None:
+            good = _closest(bad, self._columns_in_scope(query), self.fuzzy_cutoff)
+        if good is None or good == bad:
+            return None
+        fixed = _replace_identifier(query, bad, good, error.get("position"))
+        return (fixed, f"column {bad} -> {good}") if fixed else None
+
+    def _fix_undefined_table(self, query: str, error: dict) -> Optional[Tuple[str, str]]:
+        match = re.match(r'relation "([^"]+)" does not exist', error["message"])
+        if not match:
+            return None
+        bad = match.group(1).rpartition(".")[2]
+        good = _closest(bad, self.catalog.list_tables(), self.fuzzy_cutoff)
+        if good is None or good == bad:
+            return None
+        fixed = _replace_identifier(query, bad, good, error.get("position"), qualifiers=True)
+        return (fixed, f"table {bad} -> {good}") if fixed else None
+
+    def _fix_grouping(self, query: str, error: dict) -> Optional[Tuple[str, str]]:
+        match = re.match(r'column "([^"]+)" must appear in the GROUP BY clause', error["message"])
+        if not match:
+            return None
+        expression = ".".join(quote_identifier(part) for part in match.group(1).split("."))
+
+        tokens = [token for token in _lex(query) if token[0] not in ("space", "comment")]
+        depths = _depths(query, tokens)
+        words = [
+            (query[start:end].upper(), index) for index, (kind, start, end) in enumerate(tokens)
+            if kind == "word" and depths[index] == 0
+        ]
+        if any(word in _SET_OPERATIONS for word, _ in words):
+            return None  # which SELECT of the set operation is meant is not obvious
+        if error.get("position"):
+            offset = error["position"] - 1
+            at = next((index for index, (_, start, end) in enumerate(tokens) if start <= offset < end), None)
+            if at is not None and depths[at] != 0:
+                return None  # the offending SELECT is a subquery
+
+        group_by = next(
+            (index for (word, index), (following, _) in zip(words, words[1:]) if word == "GROUP" and following == "BY"),
+            None,
+        )
+        # The GROUP BY list (or the missing clause) ends where the next clause starts
+        later = [index for word, index in words if word in _AFTER_GROUP_BY and (group_by is None or index > group_by)]
+        insert_at = tokens[later[0]][1] if later else len(query.rstrip().rstrip(";").rstrip())
+        head = query[:insert_at].rstrip()
+        tail = query[insert_at:]
+        separator = " " if tail and not tail[0].isspace() and tail[0] != ";" else ""
+        if group_by is not None:
+            return head + f", {expression}" + (" " if later else "") + tail.lstrip(), f"added {expression} to GROUP BY"
+        return head + f"\nGROUP BY {expression}" + ("\n" if later else separator) + tail.lstrip(), f"added GROUP BY {expression}"
+
+    def _fix_cast(self, query: str, error: dict) -> Optional[Tuple[str, str]]:
+        if not error.get("position"):
+            return None
+        offset = error["position"] - 1
+        tokens = [token for token in _lex(query) if token[0] not in ("space", "comment")]
+        at = next((index for index, (_, start, end) in enumerate(tokens) if start <= offset < end), None)
+        if at is None:
+            return None
+
+        operator = re.match(r"operator does not exist: (.+?) (\S+) (.+)$", error["message"])
+        if operator:
+            left_type, _, right_type = operator.groups()
+            # The position points at the operator; the right operand follows it
+            index = at
+            while index < len(tokens) and tokens[index][0] == "punct":
+                index += 1
+            if index >= len(tokens):
+                return None
+            kind, start, end = tokens[index]
+            while (index + 2 < len(tokens) and query[tokens[index + 1][1]] == "."
+                   and tokens[index + 2][0] in ("word", "quoted")):
+                index += 2
+                end = tokens[index][2]
+            operand = query[start:end]
+            if kind == "number" and left_type in _TEXT_TYPES:
+                fixed = f"'{operand}'"
+            elif kind in ("word", "quoted", "number", "string"):
+                fixed = f"{operand}::{left_type}"
+            else:
+                return None
+            return query[:start] + fixed + query[end:], f"cast {operand} ({right_type}) to {left_type}"
+
+        function = re.match(r"function (\w+)\((.*)\) does not exist", error["message"])
+        if not function or function.group(1).lower() not in _FUNCTION_CASTS:
+            return None
+        name = function.group(1).lower()
+        argument, target, accepted = _FUNCTION_CASTS[name]
+        argument_types = [part.strip() for part in function.group(2).split(",")]
+        if argument >= len(argument_types) or argument_types[argument] not in accepted:
+            return None
+
+        # Find the argument span: after "name(" up to the matching top-level comma or parenthesis
+        if at + 1 >= len(tokens) or query[tokens[at + 1][1]] != "(":
+            return None
+        depths = _depths(query, tokens)
+        inner = depths[at + 1] + 1
+        spans, begin = [], tokens[at + 1][2]
+        for index in range(at + 2, len(tokens)):
+            kind, start, end = tokens[index]
+            if depths[index] == inner and kind == "punct" and query[start] == ",":
+                spans.append((begin, start))
+                begin = end
+            elif depths[index] == inner - 1 and query[start] == ")":
+                spans.append((begin, start))
+                break
+        if argument >= len(spans):
+            return None
+        start, end = spans[argument]
+        text = query[start:end].strip()
+        start = query.index(text, start)
+        return (
+            query[:start] + f"({text})::{target}" + query[start + len(text):],
+            f"cast argument of {name}() to {target}",
+        )
+
+    def record(self, kind: str, fixed_locally: bool):
+        """
+        Count the outcome of a planning error
+
+        Args:
+            kind (str): Error kind (see plan_validator.SQLSTATE_KINDS)
+            fixed_locally (bool): Whether local repair produced a query that plans
+        """
+        with self._lock:
+            self._counters["errors_seen"] += 1
+            self._counters["local_fixes" if fixed_locally else "llm_fallbacks"] += 1
+            by_kind = self._by_kind.setdefault(kind, {"seen": 0, "fixed": 0})
+            by_kind["seen"] += 1
+            by_kind["fixed"] += int(fixed_locally)
+
+    def stats(self) -> dict:
+        """Return repair counters and the local fix rate"""
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot["by_kind"] = {kind: dict(counts) for kind, counts in self._by_kind.items()}
+        seen = snapshot["errors_seen"]
+        snapshot["local_fix_rate"] = snapshot["local_fixes"] / seen if seen else 0.0
+        return snapshot
+
+
+# Repairers are shared by every session using the same connection string
+_repairers: Dict[str, SQLRepairer] = {}
+_repairers_lock = threading.Lock()
+
+def get_sql_repairer(connection_string: str, catalog) -> SQLRepairer:
+    """Get or create the shared SQLRepairer for a connection string"""
+    with _repairers_lock:
+        repairer = _repairers.get(connection_string)
+        if repairer is None or repairer.catalog is not catalog:
+            repairer = SQLRepairer(catalog)
+            _repairers[connection_string] = repairer
+        return repairer
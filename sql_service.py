@@ -1,30 +1,69 @@
 # src/services/sql_service.py
 
-from typing import Optional, Tuple
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, List, Optional, Tuple
 import pandas as pd
 # Use relative imports
 from model import get_model_instance
-from database import DatabaseManager
+from database import CancelToken, DatabaseManager
 from prompts import get_sql_prompt
-from helpers import clean_sql_response, validate_sql_syntax  # Import new helpers
+from sql_cache import get_sql_cache
+from plan_validator import format_plan_error
+from sampling import plan_sample
+from config import CACHE_CONFIG, REPAIR_CONFIG, SAMPLING_CONFIG, SPECULATIVE_CONFIG, VALIDATION_CONFIG
+from helpers import clean_sql_response, complete_sql_statement, validate_sql_syntax  # Import new helpers
+from tracing import current_span, span
+
+# Worker threads shared by all sessions for speculative candidates
+_candidate_executor = None
+_candidate_executor_lock = threading.Lock()
+
+def _get_candidate_executor() -> ThreadPoolExecutor:
+    """Get or create the shared executor running candidate generation"""
+    global _candidate_executor
+    with _candidate_executor_lock:
+        if _candidate_executor is None:
+            _candidate_executor = ThreadPoolExecutor(
+                max_workers=SPECULATIVE_CONFIG["max_workers"], thread_name_prefix="sql-candidate"
+            )
+        return _candidate_executor
 
 class SQLService:
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(self, db_manager: DatabaseManager, model=None, preview_rows: Optional[int] = None):
         """
         Initialize SQLService with database manager
         
         Args:
             db_manager (DatabaseManager): Instance of DatabaseManager
+            model (Optional[LLMModel]): Model to use, the shared instance if None
+            preview_rows (Optional[int]): Fetch only this many rows of each result
+                (pushdown mode). A cut-short result carries `df.attrs["preview"]`;
+                AnalysisService fetches an aggregate or the rest when it needs them.
         """
         self.db_manager = db_manager
-        self.model = get_model_instance()
+        self._model = model
+        self.preview_rows = preview_rows
+        self.cache = get_sql_cache() if CACHE_CONFIG["sql_cache_enabled"] else None
+        self._prompt_counters = {"prompts": 0, "prompt_tokens": 0, "max_prompt_tokens": 0}
+
+    @property
+    def model(self):
+        """LLM, resolved on first use so creating the service does not wait for model warm-up"""
+        if self._model is None:
+            self._model = get_model_instance()
+        return self._model
 
     def generate_sql_query(
         self, 
         user_query: str, 
         table_statement: str,
         previous_query: Optional[str] = None,
-        error_message: Optional[str] = None
+        error_message: Optional[str] = None,
+        on_batch: Optional[Callable] = None,
+        on_sql_text: Optional[Callable[[str], None]] = None
     ) -> Tuple[Optional[pd.DataFrame], Optional[str], Optional[str]]:
         """
         Generate and execute SQL query based on user input
@@ -34,38 +73,94 @@ class SQLService:
             table_statement (str): Database table schema
             previous_query (Optional[str]): Previous failed query
             error_message (Optional[str]): Previous error message
+            on_batch (Optional[Callable]): Passed to DatabaseManager.execute_query to preview rows as they stream in
+            on_sql_text (Optional[Callable[[str], None]]): Called with the SQL generated so far while the model streams
             
         Returns:
             Tuple[Optional[pd.DataFrame], Optional[str], Optional[str]]:
-                - DataFrame with results if successful, None if failed
+                - DataFrame with results if successful, None if failed. Its attrs
+                  carry llm_ttfb_seconds (first attempt) and llm_seconds (all attempts).
+                  The call is traced as a "sql.generate" span recording the retries.
                 - Generated SQL query
                 - Error message if failed, None if successful
         """
+        with span("sql.generate", candidates=SPECULATIVE_CONFIG["candidates"]) as current:
+            df, sql_query, error = self._generate_sql_query(
+                user_query, table_statement, previous_query, error_message, on_batch, on_sql_text
+            )
+            if error:
+                current.fail(error)
+            elif df is not None:
+                current.set(sql_cache_hit=bool(df.attrs.get("sql_cache_hit")))
+            return df, sql_query, error
+
+    def _generate_sql_query(
+        self,
+        user_query: str,
+        table_statement: str,
+        previous_query: Optional[str],
+        error_message: Optional[str],
+        on_batch: Optional[Callable],
+        on_sql_text: Optional[Callable[[str], None]]
+    ) -> Tuple[Optional[pd.DataFrame], Optional[str], Optional[str]]:
+        """Body of generate_sql_query, run inside its span"""
         max_attempts = 3
         attempts = 0
         
         db_type = "PostgreSQL"
         current_sql_query = previous_query  # Keep track of the latest generated query
+        llm_ttfb = None
+        llm_seconds = 0.0
+
+        # Reuse the SQL that answered the same question against the same schema
+        if self.cache is not None and previous_query is None and error_message is None:
+            cached_query = self.cache.get(user_query, table_statement)
+            if cached_query is not None:
+                plan_check, plan_error = self._validate_plan(cached_query)
+                # A cached query that no longer plans or is over the cost gate is regenerated
+                if plan_error is None:
+                    df, db_error = self._execute(cached_query, plan_check, on_batch=on_batch)
+                    if df is not None:
+                        df.attrs["sql_cache_hit"] = True
+                        return df, cached_query, None
+                self.cache.invalidate(user_query, table_statement)
+
+        if SPECULATIVE_CONFIG["candidates"] > 1:
+            return self._generate_speculative(
+                user_query, table_statement, previous_query, error_message, on_batch, max_attempts
+            )
         
         while attempts < max_attempts:
+            current_span().set(retries=attempts)
             # Generate prompt using the new function
-            prompt = get_sql_prompt(
-                user_query,
-                table_statement,
-                current_sql_query,  # Pass the most recent query attempt
-                error_message,
-                db_type=db_type
-            )
+            with span("sql.prompt", attempt=attempts + 1) as stage:
+                prompt = get_sql_prompt(
+                    user_query,
+                    table_statement,
+                    current_sql_query,  # Pass the most recent query attempt
+                    error_message,
+                    db_type=db_type
+                )
+                prompt_tokens = self._count_prompt(prompt)
+                stage.set(prompt_tokens=prompt_tokens)
             
-            # Get response from model
-            sql_response = self.model.generate_response(prompt)
+            # Stream the response; generation stops as soon as a complete statement is out
+            sql_response, llm_timings = self.model.generate_streaming(
+                prompt, on_text=on_sql_text, stop_when=complete_sql_statement
+            )
+            if llm_ttfb is None:
+                llm_ttfb = llm_timings["ttfb_seconds"]
+            llm_seconds += llm_timings["total_seconds"]
             
             # Clean up response
             sql_query = clean_sql_response(sql_response)
             current_sql_query = sql_query  # Update the latest generated query
             
             # --- Basic Syntax Validation ---
-            is_valid, validation_error = validate_sql_syntax(sql_query)
+            with span("sql.validate_syntax") as stage:
+                is_valid, validation_error = validate_sql_syntax(sql_query)
+                if not is_valid:
+                    stage.fail(validation_error)
             if not is_valid:
                 error_message = f"Generated query failed syntax validation: {validation_error}. Query: {sql_query}"
                 attempts += 1
@@ -73,11 +168,32 @@ class SQLService:
                 # For now, we just retry with the validation error message.
                 continue  # Skip execution and retry generation
             # --- End Validation ---
+
+            # Plan the query without executing it: catches unknown columns, type
+            # mismatches and over-budget queries without paying for a full run
+            # Errors such as a misspelled column or a missing GROUP BY entry are
+            # repaired locally first; only what remains goes back to the LLM
+            sql_query, plan_check, plan_error, repairs = self._validate_and_repair(sql_query)
+            current_sql_query = sql_query
+            if plan_error:
+                error_message = plan_error
+                attempts += 1
+                continue
             
-            # Execute query
-            df, db_error = self.db_manager.execute_query(sql_query)
+            # Execute query; errors the planner did not catch (plan validation
+            # disabled) get the same local repair before going back to the LLM
+            df, db_error, sql_query, fixes = self._execute_and_repair(sql_query, plan_check, on_batch=on_batch)
+            current_sql_query = sql_query
+            repairs = repairs + fixes
             
             if df is not None:
+                if self.cache is not None:
+                    self.cache.put(user_query, table_statement, sql_query)
+                df.attrs["llm_ttfb_seconds"] = llm_ttfb
+                df.attrs["llm_seconds"] = llm_seconds
+                df.attrs["prompt_tokens"] = prompt_tokens
+                if repairs:
+                    df.attrs["local_repairs"] = repairs
                 return df, sql_query, None  # Success
                 
             # Prepare for next attempt
@@ -85,5 +201,422 @@ class SQLService:
             attempts += 1
             
         # Failed after all attempts
+        current_span().set(retries=attempts)
         final_error = f"Failed to generate and execute a valid SQL query after {max_attempts} attempts. Last generated query: '{current_sql_query}'. Last error: {error_message}"
         return None, current_sql_query, final_error
+
+    def _execute(
+        self,
+        sql_query: str,
+        plan_check: Optional[dict],
+        on_batch: Optional[Callable] = None,
+        cancel_token: Optional[CancelToken] = None
+    ) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+        """
+        Execute a validated query, reading its materialized view when the query
+        advisor holds a fresh one, otherwise sampling it when the planner expects
+        more rows than SAMPLING_CONFIG["row_budget"]
+
+        Returns:
+            Tuple[Optional[pd.DataFrame], Optional[str]]: (result, error message).
+            A sampled result carries `df.attrs["sampled"]` describing the rewrite,
+            a preview `df.attrs["preview"]` with its row count and executed query,
+            a result read from a view `df.attrs["materialized_view"]` with its
+            name and the latency before and after.
+        """
+        view = self._view_rewrite(sql_query)
+        sample = None
+        if view is None and SAMPLING_CONFIG["enabled"] and plan_check and plan_check.get("plan_rows") is not None:
+            sample = plan_sample(sql_query, plan_check["plan_rows"])
+
+        fetch = {"max_rows": self.preview_rows} if self.preview_rows else {}
+        executed_query = view["query"] if view else sample["query"] if sample else sql_query
+        started = time.perf_counter()
+        df, db_error = self.db_manager.execute_query(executed_query, on_batch=on_batch, cancel_token=cancel_token, **fetch)
+        if df is None and (sample is not None or view is not None):
+            # The rewrite itself failed: fall back to the query as generated
+            if view is not None:
+                self.db_manager.query_advisor.drop_missing_views()  # a view implies an advisor
+            executed_query = sql_query
+            started = time.perf_counter()
+            df, db_error = self.db_manager.execute_query(sql_query, on_batch=on_batch, cancel_token=cancel_token, **fetch)
+            sample = view = None
+        if df is None:
+            return None, db_error
+        seconds = time.perf_counter() - started
+
+        if self.preview_rows and df.attrs.get("truncated"):
+            # Cut short on purpose, not by the row/byte budget
+            df.attrs["truncated"] = False
+            df.attrs["preview"] = {"rows": len(df), "query": executed_query}
+
+        if plan_check and plan_check.get("warnings"):
+            df.attrs["plan_warnings"] = plan_check["warnings"]
+        if sample is not None:
+            df.attrs["sampled"] = sample
+        self._record_execution(sql_query, seconds, df, plan_check, view)
+        return df, None
+
+    def _execute_and_repair(
+        self,
+        sql_query: str,
+        plan_check: Optional[dict],
+        on_batch: Optional[Callable] = None,
+        cancel_token: Optional[CancelToken] = None
+    ) -> Tuple[Optional[pd.DataFrame], Optional[str], str, List[str]]:
+        """
+        Execute a validated query; if it fails with an error local repair can
+        fix, execute the repaired query instead
+
+        Returns:
+            Tuple[Optional[pd.DataFrame], Optional[str], str, List[str]]:
+                - Result, None if execution failed
+                - Error message of the last execution, None if successful
+                - The query that was executed last
+                - Descriptions of the local fixes applied
+        """
+        df, db_error = self._execute(sql_query, plan_check, on_batch=on_batch, cancel_token=cancel_token)
+        if df is not None or (cancel_token is not None and cancel_token.cancelled):
+            return df, db_error, sql_query, []
+        repaired = self._repair_execution(sql_query)
+        if repaired is None:
+            return None, db_error, sql_query, []
+        sql_query, plan_check, repairs = repaired
+        df, db_error = self._execute(sql_query, plan_check, on_batch=on_batch, cancel_token=cancel_token)
+        return df, db_error, sql_query, repairs
+
+    def _repair_execution(self, sql_query: str) -> Optional[Tuple[str, Optional[dict], List[str]]]:
+        """
+        Apply local repairs to a query that failed to execute, traced as "sql.repair"
+
+        Execution errors are plain messages, so the query is planned for the
+        structured error, whether or not plan validation is enabled. Errors
+        raised at run time plan fine and are left to the LLM.
+
+        Returns:
+            Optional[Tuple[str, Optional[dict], List[str]]]: (repaired query, its
+                PlanValidator result or None if plan validation is disabled,
+                descriptions of the fixes), None if no local fix makes it plan
+        """
+        if not REPAIR_CONFIG["enabled"]:
+            return None
+        with span("sql.repair") as current:
+            plan_check, plan_error = self._validate_plan(sql_query, force=True)
+            if plan_check["ok"]:
+                return None
+            sql_query, plan_check, plan_error, repairs = self._repair_locally(sql_query, plan_check, plan_error)
+            current.set(local_repairs=len(repairs))
+            if not repairs or plan_error is not None:
+                return None
+            return sql_query, plan_check if VALIDATION_CONFIG["enabled"] else None, repairs
+
+    def _view_rewrite(self, sql_query: str) -> Optional[dict]:
+        """Rewrite of a query to its fresh materialized view (QueryAdvisor.rewrite), None if there is none"""
+        advisor = getattr(self.db_manager, "query_advisor", None)
+        if advisor is None:
+            return None
+        try:
+            return advisor.rewrite(sql_query)
+        except Exception as e:
+            print(f"Materialized view lookup failed: {e}")
+            return None
+
+    def _record_execution(
+        self,
+        sql_query: str,
+        seconds: float,
+        df: pd.DataFrame,
+        plan_check: Optional[dict],
+        view: Optional[dict],
+    ):
+        """Add an executed query to the advisor's history, with its before/after latency if read from a view"""
+        advisor = getattr(self.db_manager, "query_advisor", None)
+        if view is not None:
+            df.attrs["materialized_view"] = {
+                "view": view["view"],
+                "seconds": seconds,
+                "baseline_seconds": view["baseline_seconds"],
+            }
+            active = current_span()
+            if active is not None:
+                active.set(materialized_view=view["view"])
+        if advisor is None:
+            return
+        try:
+            advisor.record(sql_query, seconds, df, plan_check)
+        except Exception as e:
+            print(f"Query history error: {e}")
+
+    def _validate_plan(self, sql_query: str, force: bool = False) -> Tuple[Optional[dict], Optional[str]]:
+        """
+        Validate a query with EXPLAIN before executing it
+
+        Args:
+            sql_query (str): Query to plan
+            force (bool): Plan it even if plan validation is disabled (for local
+                repair); the cost gate still only applies when it is enabled
+
+        Returns:
+            Tuple[Optional[dict], Optional[str]]:
+                - PlanValidator result, None if plan validation is disabled
+                - Error message for the repair prompt if the query failed to plan
+                  or was rejected for its estimated cost, None otherwise
+        """
+        if not VALIDATION_CONFIG["enabled"] and not force:
+            return None, None
+        plan_check = self.db_manager.validate_query(sql_query)
+        if not plan_check["ok"]:
+            return plan_check, f"Query planning error: {format_plan_error(plan_check['error'], sql_query)}"
+        if plan_check["rejected"] and VALIDATION_CONFIG["enabled"]:
+            return plan_check, (
+                f"Query rejected before execution: {'; '.join(plan_check['warnings'])}. "
+                "Generate a cheaper query, for example by aggregating in SQL, filtering rows, or adding a LIMIT."
+            )
+        return plan_check, None
+
+    def _validate_and_repair(self, sql_query: str) -> Tuple[str, Optional[dict], Optional[str], List[str]]:
+        """
+        Validate a query and apply local repairs while it fails to plan, traced as "sql.plan"
+
+        Returns:
+            Tuple[str, Optional[dict], Optional[str], List[str]]: See _plan_and_repair
+        """
+        with span("sql.plan") as current:
+            sql_query, plan_check, plan_error, repairs = self._plan_and_repair(sql_query)
+            if plan_error:
+                current.fail(plan_error)
+            current.set(
+                local_repairs=len(repairs),
+                total_cost=plan_check.get("total_cost") if plan_check else None,
+            )
+            return sql_query, plan_check, plan_error, repairs
+
+    def _plan_and_repair(self, sql_query: str) -> Tuple[str, Optional[dict], Optional[str], List[str]]:
+        """
+        Validate a query and apply local repairs while it fails to plan
+
+        Returns:
+            Tuple[str, Optional[dict], Optional[str], List[str]]:
+                - The query, repaired if local repair succeeded
+                - PlanValidator result for that query
+                - Error message for the LLM repair prompt, None if the query plans
+                - Descriptions of the local fixes applied
+        """
+        plan_check, plan_error = self._validate_plan(sql_query)
+        if plan_check is None or plan_check["ok"]:
+            return sql_query, plan_check, plan_error, []
+        return self._repair_locally(sql_query, plan_check, plan_error)
+
+    def _repair_locally(
+        self,
+        sql_query: str,
+        plan_check: dict,
+        plan_error: Optional[str],
+    ) -> Tuple[str, dict, Optional[str], List[str]]:
+        """Apply local repairs while a query fails to plan; see _plan_and_repair for the returns"""
+        if not REPAIR_CONFIG["enabled"]:
+            return sql_query, plan_check, plan_error, []
+
+        repairer = self.db_manager.sql_repairer
+        kind = plan_check["error"]["kind"]
+        repairs: List[str] = []
+        seen = {sql_query}
+        while not plan_check["ok"] and len(repairs) < REPAIR_CONFIG["max_local_repairs"]:
+            fix = repairer.repair(sql_query, plan_check["error"])
+            if fix is None or fix[0] in seen:
+                break
+            candidate, description = fix
+            seen.add(candidate)
+            candidate_check, candidate_error = self._validate_plan(candidate, force=True)
+            if not candidate_check["ok"] and candidate_check["error"]["kind"] == plan_check["error"]["kind"] \
+                    and candidate_check["error"]["message"] == plan_check["error"]["message"]:
+                break  # the fix did not address the error
+            sql_query, plan_check, plan_error = candidate, candidate_check, candidate_error
+            repairs.append(description)
+        repairer.record(kind, plan_check["ok"])
+        return sql_query, plan_check, plan_error, repairs
+
+    def _generate_candidate(self, prompt: str, temperature: Optional[float]) -> Tuple[str, Optional[str]]:
+        """
+        Generate one candidate query and check its syntax
+
+        Returns:
+            Tuple[str, Optional[str]]: (query, error message if it failed syntax validation)
+        """
+        sql_response, _ = self.model.generate_streaming(
+            prompt, stop_when=complete_sql_statement, temperature=temperature
+        )
+        sql_query = clean_sql_response(sql_response)
+        with span("sql.validate_syntax") as stage:
+            is_valid, validation_error = validate_sql_syntax(sql_query)
+            if not is_valid:
+                stage.fail(validation_error)
+        if not is_valid:
+            return sql_query, f"Generated query failed syntax validation: {validation_error}. Query: {sql_query}"
+        return sql_query, None
+
+    def _run_candidate_first(self, prompt: str, temperature: Optional[float], cancel_token: CancelToken):
+        """Generate and execute a candidate; used by the "first" strategy"""
+        sql_query, error = self._generate_candidate(prompt, temperature)
+        if not error:
+            sql_query, plan_check, error, _ = self._validate_and_repair(sql_query)
+        if error or cancel_token.cancelled:
+            return None, sql_query, error or "cancelled"
+        df, db_error, sql_query, _ = self._execute_and_repair(sql_query, plan_check, cancel_token=cancel_token)
+        if df is None:
+            return None, sql_query, f"Database execution error: {db_error}"
+        return df, sql_query, None
+
+    def _run_candidate_cheapest(self, prompt: str, temperature: Optional[float]):
+        """Generate and plan a candidate; used by the "cheapest" strategy"""
+        sql_query, error = self._generate_candidate(prompt, temperature)
+        if error:
+            return None, sql_query, error
+        sql_query, plan_check, plan_error, _ = self._validate_and_repair(sql_query)
+        if plan_error:
+            return None, sql_query, plan_error
+        if plan_check is not None:
+            return plan_check, sql_query, None
+        cost, plan_error = self.db_manager.estimate_cost(sql_query)
+        if cost is None:
+            return None, sql_query, f"Query planning error: {plan_error}"
+        return {"ok": True, "total_cost": cost, "warnings": []}, sql_query, None
+
+    def _generate_speculative(
+        self,
+        user_query: str,
+        table_statement: str,
+        previous_query: Optional[str],
+        error_message: Optional[str],
+        on_batch: Optional[Callable],
+        max_attempts: int
+    ) -> Tuple[Optional[pd.DataFrame], Optional[str], Optional[str]]:
+        """
+        Request several candidate queries concurrently per round and keep the
+        first one that executes ("first") or the one with the lowest planner
+        cost ("cheapest"). When every candidate of a round fails, the next
+        round asks for a repair of a failed candidate.
+        """
+        executor = _get_candidate_executor()
+        candidates = SPECULATIVE_CONFIG["candidates"]
+        strategy = SPECULATIVE_CONFIG["strategy"]
+        current_sql_query = previous_query
+
+        for round_index in range(max_attempts):
+            current_span().set(retries=round_index)
+            with span("sql.prompt", attempt=round_index + 1) as stage:
+                prompt = get_sql_prompt(
+                    user_query, table_statement, current_sql_query, error_message, db_type="PostgreSQL"
+                )
+                prompt_tokens = self._count_prompt(prompt, copies=candidates)
+                stage.set(prompt_tokens=prompt_tokens * candidates)
+            # Keep the first candidate at the model's default temperature, vary the rest
+            temperatures = [None] + [SPECULATIVE_CONFIG["temperature"]] * (candidates - 1)
+            failures: List[Tuple[str, str]] = []
+
+            if strategy == "cheapest":
+                result = self._speculative_cheapest(executor, prompt, temperatures, failures, on_batch)
+            else:
+                result = self._speculative_first(executor, prompt, temperatures, failures)
+
+            if result is not None:
+                df, sql_query = result
+                if self.cache is not None:
+                    self.cache.put(user_query, table_statement, sql_query)
+                df.attrs["prompt_tokens"] = prompt_tokens
+                return df, sql_query, None
+
+            if failures:
+                # Prefer a candidate that reached the database: its error is the most useful for a repair
+                current_sql_query, error_message = next(
+                    (f for f in failures if f[1].startswith(("Database", "Query"))), failures[0]
+                )
+
+        final_error = f"Failed to generate and execute a valid SQL query after {max_attempts} rounds of {candidates} candidates. Last generated query: '{current_sql_query}'. Last error: {error_message}"
+        return None, current_sql_query, final_error
+
+    def _speculative_first(self, executor, prompt, temperatures, failures):
+        """Run candidates concurrently and return (df, query) of the first that executes"""
+        cancel_token = CancelToken()
+        pending = {
+            # Each candidate runs in a copy of this context so its spans join the trace
+            executor.submit(contextvars.copy_context().run, self._run_candidate_first, prompt, temperature, cancel_token)
+            for temperature in temperatures
+        }
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        df, sql_query, error = future.result()
+                    except Exception as e:
+                        failures.append(("", f"Candidate generation error: {str(e)}"))
+                        continue
+                    if df is not None:
+                        return df, sql_query
+                    failures.append((sql_query, error))
+            return None
+        finally:
+            # Stop the losers: drop queued candidates and cancel running statements
+            for future in pending:
+                future.cancel()
+            cancel_token.cancel()
+
+    def _speculative_cheapest(self, executor, prompt, temperatures, failures, on_batch):
+        """Plan candidates concurrently, then execute them from the cheapest up"""
+        futures = {
+            executor.submit(contextvars.copy_context().run, self._run_candidate_cheapest, prompt, temperature)
+            for temperature in temperatures
+        }
+        planned = []
+        deadline = None
+        pending = futures
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break  # waited long enough for cheaper candidates
+            for future in done:
+                try:
+                    plan_check, sql_query, error = future.result()
+                except Exception as e:
+                    failures.append(("", f"Candidate generation error: {str(e)}"))
+                    continue
+                if plan_check is None:
+                    failures.append((sql_query, error))
+                    continue
+                planned.append((plan_check["total_cost"], sql_query, plan_check))
+                if deadline is None:
+                    deadline = time.monotonic() + SPECULATIVE_CONFIG["cost_wait_seconds"]
+        for future in pending:
+            future.cancel()
+
+        for cost, sql_query, plan_check in sorted(planned, key=lambda candidate: candidate[0]):
+            df, db_error, sql_query, _ = self._execute_and_repair(sql_query, plan_check, on_batch=on_batch)
+            if df is not None:
+                df.attrs["estimated_cost"] = cost
+                return df, sql_query
+            failures.append((sql_query, f"Database execution error: {db_error}"))
+        return None
+
+    def _count_prompt(self, prompt: str, copies: int = 1) -> int:
+        """Count a prompt's tokens and add them to the prompt counters"""
+        tokens = self.model.count_tokens(prompt)
+        self._prompt_counters["prompts"] += copies
+        self._prompt_counters["prompt_tokens"] += tokens * copies
+        self._prompt_counters["max_prompt_tokens"] = max(self._prompt_counters["max_prompt_tokens"], tokens)
+        return tokens
+
+    def prompt_stats(self) -> dict:
+        """Return prompt size counters of this session"""
+        stats = dict(self._prompt_counters)
+        stats["mean_prompt_tokens"] = stats["prompt_tokens"] / stats["prompts"] if stats["prompts"] else 0.0
+        return stats
+
+    def repair_stats(self) -> dict:
+        """Return local repair counters, including the local fix rate"""
+        return self.db_manager.sql_repairer.stats()
+
+    def cache_stats(self) -> dict:
+        """Return hit/miss counters of the NL-to-SQL cache, empty if disabled"""
+        return self.cache.stats() if self.cache is not None else {}
@@ -0,0 +1,12 @@
+# tests/test_batch.py
+
+import pytest
+from batch import BatchRunner
+from config import PUSHDOWN_CONFIG
+
+@pytest.mark.parametrize("pushdown", [False, True])
+def test_preview_rows_is_not_the_fetch_limit(monkeypatch, pushdown):
+    monkeypatch.setitem(PUSHDOWN_CONFIG, "enabled", pushdown)
+    runner = BatchRunner(object(), model=object(), preview_rows=7)
+    assert runner.preview_rows == 7
+    assert runner.sql_service.preview_rows == (PUSHDOWN_CONFIG["preview_rows"] if pushdown else None)
@@ -0,0 +1,135 @@
+# tests/test_database.py
+
+from contextlib import contextmanager
+import pytest
+from config import STREAM_CONFIG
+from database import CancelToken, DatabaseManager, QueryStream
+
+class FakeCursor:
+    """psycopg2 cursor stand-in; a named cursor has no description until its first fetch"""
+    def __init__(self, rows, named):
+        self.rows = list(rows)
+        self.description = None if named else [("id",), ("name",)]
+
+    def execute(self, query):
+        pass
+
+    def fetchmany(self, size):
+        self.description = [("id",), ("name",)]
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.cancels = 0
+
+    def cursor(self, name=None):
+        return FakeCursor(self.rows, named=name is not None)
+
+    def cancel(self):
+        self.cancels += 1
+
+class FakeManager:
+    def __init__(self, rows, cancel_token=None):
+        self.conn = FakeConnection(rows)
+        self.cancel_token = cancel_token
+        self.callbacks_at_checkin = None
+
+    @contextmanager
+    def _get_postgres_connection(self, statement_timeout_ms=None):
+        try:
+            yield self.conn
+        finally:
+            if self.cancel_token is not None:
+                self.callbacks_at_checkin = list(self.cancel_token._callbacks)
+
+ROWS = [(i, f"name {i}") for i in range(25)]
+
+def test_named_cursor_streams_rows():
+    stream = QueryStream(FakeManager(ROWS), "SELECT id, name FROM people", batch_rows=10)
+    batches = list(stream)
+    assert stream.error is None
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert list(batches[0].columns) == ["id", "name"]
+    assert stream.rows_fetched == 25 and not stream.truncated
+
+def test_cancel_callback_unregistered_before_checkin():
+    token = CancelToken()
+    manager = FakeManager(ROWS, cancel_token=token)
+    list(QueryStream(manager, "SELECT id, name FROM people", batch_rows=10, cancel_token=token))
+    assert manager.callbacks_at_checkin == []
+    # A late cancel must not reach the connection, which may now serve another session
+    token.cancel()
+    assert manager.conn.cancels == 0
+
+def test_row_budget_reports_truncation():
+    stream = QueryStream(FakeManager(ROWS), "SELECT id, name FROM people", batch_rows=10, max_rows=20)
+    assert sum(len(batch) for batch in stream) == 20
+    assert stream.truncated
+
+
+class CopyCursor:
+    """Cursor answering the LIMIT 0 probe and COPY of execute_query_copy"""
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+
+    def execute(self, query, params=None):
+        self.conn.statements.append(query)
+        if self.conn.error is not None and "LIMIT 0" in query:
+            raise RuntimeError(self.conn.error)
+        self.description = [("id", 23)]
+
+    def copy_expert(self, statement, buffer):
+        self.conn.statements.append(statement)
+        limit = int(statement.rsplit("LIMIT ", 1)[1].split(")")[0]) if "LIMIT " in statement else None
+        rows = self.conn.rows if limit is None else self.conn.rows[:limit]
+        buffer.write("".join(f"{row}\n" for row in rows).encode())
+
+class CopyConnection:
+    def __init__(self, rows, error=None):
+        self.rows = rows
+        self.error = error
+        self.statements = []
+
+    def cursor(self, name=None):
+        return CopyCursor(self)
+
+def copy_manager(rows, error=None) -> DatabaseManager:
+    """DatabaseManager over a fake connection, without connecting"""
+    manager = DatabaseManager.__new__(DatabaseManager)
+    manager.conn = CopyConnection(rows, error)
+    manager.result_cache = None
+
+    @contextmanager
+    def connection(statement_timeout_ms=None):
+        yield manager.conn
+
+    manager._get_postgres_connection = connection
+    return manager
+
+def test_copy_enforces_row_budget():
+    pytest.importorskip("pyarrow")
+    manager = copy_manager(list(range(10)))
+    df, error, fallback = manager.execute_query_copy("SELECT id FROM t", max_rows=4)
+    assert error is None and not fallback
+    assert df["id"].tolist() == [0, 1, 2, 3]
+    assert df.attrs["truncated"]
+
+    df, _, _ = manager.execute_query_copy("SELECT id FROM t", max_rows=10)
+    assert len(df) == 10 and not df.attrs["truncated"]
+
+def test_copy_returns_query_errors_without_fallback():
+    pytest.importorskip("pyarrow")
+    manager = copy_manager([], error='column "idd" does not exist')
+    df, error = manager._execute_query("SELECT idd FROM t", None, "copy", False, None, STREAM_CONFIG["max_rows"])
+    assert df is None and "idd" in error
+    # Only the probe ran: neither COPY nor the cursor path retried the broken query
+    assert len(manager.conn.statements) == 1
@@ -0,0 +1,52 @@
+# tests/test_frames.py
+
+import numpy as np
+import pandas as pd
+import pytest
+from frames import FrameStore, compact_frame
+
+def fetched_result(rows=5000):
+    """A result built the way QueryStream builds batches"""
+    rng = np.random.default_rng(0)
+    records = [
+        (int(rng.integers(0, 100)) + 0.25, 2_000_000, str(rng.choice(["north", "south", "east"])), f"order {i}")
+        for i in range(rows)
+    ]
+    return pd.DataFrame.from_records(records, columns=["amount", "quantity", "region", "note"], coerce_float=True)
+
+def answers(df):
+    return {
+        "amount": (df["amount"] * 1.1).sum(),
+        "quantity": (df["quantity"] * 1000).sum(),
+        "mean_by_region": df.groupby("region")["amount"].mean().to_dict(),
+        "value_counts": df["region"].value_counts().to_dict(),
+        "concat": (df["region"] + "/" + df["note"]).tolist(),
+    }
+
+def test_compaction_shrinks_fetched_results():
+    df = fetched_result()
+    compacted, dtypes = compact_frame(df, min_rows=1)
+    assert set(dtypes) == {0, 1, 2}
+    assert [str(dtype) for dtype in compacted.dtypes[:3]] == ["float32", "int32", "category"]
+    before, after = df.memory_usage(deep=True), compacted.memory_usage(deep=True)
+    assert after["region"] < before["region"] / 10 and after.sum() < before.sum()
+
+@pytest.mark.parametrize("spill", [False, True])
+def test_store_returns_frames_as_fetched(tmp_path, spill):
+    df = fetched_result()
+    df.attrs["truncated"] = False
+    store = FrameStore(
+        session_budget_bytes=1 if spill else 2**30, spill_dir=str(tmp_path / "frames"), compact=True
+    )
+    store.put("session", "result", df)
+    store.put("session", "other", fetched_result(10))  # pushes "result" over the budget
+
+    stats = store.stats()
+    assert stats["bytes_saved"] > 0
+    assert stats["spills"] == (2 if spill else 0)
+
+    held = store.get("session", "result")
+    pd.testing.assert_frame_equal(held, df)
+    assert held.attrs == {"truncated": False}
+    assert answers(held) == answers(df)
+    store.close()
@@ -0,0 +1,32 @@
+# tests/test_helpers.py
+
+from helpers import referenced_tables
+
+def test_referenced_tables_keeps_keyword_names():
+    # sqlparse tokenizes "events" and "data" as keywords
+    tables, deterministic = referenced_tables("SELECT * FROM events e JOIN data d ON e.id = d.event_id")
+    assert tables == ["data", "events"] and deterministic
+
+def test_referenced_tables_keeps_schema_qualifiers():
+    tables, _ = referenced_tables('SELECT * FROM public.orders o, "Sales"."Orders" s, lineitems')
+    assert tables == ["Sales.Orders", "lineitems", "public.orders"]
+
+def test_referenced_tables_skips_ctes_and_flags_volatile_functions():
+    tables, deterministic = referenced_tables("WITH recent AS (SELECT * FROM orders) SELECT now(), * FROM recent")
+    assert tables == ["orders"] and not deterministic
+
+def test_referenced_tables_ignores_from_inside_function_calls():
+    cases = {
+        "SELECT EXTRACT(YEAR FROM created_at) y, count(*) FROM orders GROUP BY 1": ["orders"],
+        "SELECT substring(code FROM 1 FOR 3), count(*) FROM orders GROUP BY 1": ["orders"],
+        "SELECT trim(both ' ' from city) FROM customers": ["customers"],
+    }
+    for query, expected in cases.items():
+        assert referenced_tables(query) == (expected, True), query
+
+def test_referenced_tables_reads_subqueries_and_join_groups():
+    tables, _ = referenced_tables(
+        "SELECT * FROM (orders o JOIN customers c ON o.customer_id = c.id) "
+        "WHERE o.id IN (SELECT order_id FROM items WHERE EXTRACT(month FROM shipped_at) = 1)"
+    )
+    assert tables == ["customers", "items", "orders"]
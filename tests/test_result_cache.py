@@ -0,0 +1,91 @@
+# tests/test_result_cache.py
+
+import os
+import subprocess
+import sys
+from contextlib import contextmanager
+import pandas as pd
+from result_cache import ResultCache
+
+class FakeCatalog:
+    schema_name = "public"
+
+    def local_name(self, table_name):
+        schema, dot, name = table_name.rpartition(".")
+        return name if not dot or schema == self.schema_name else None
+
+    def is_base_table(self, table_name):
+        return table_name in ("orders", "events")
+
+class FakePool:
+    connection_string = "postgresql://test"
+
+    def __init__(self):
+        self.counters = {"orders": (1, 0, 0, 10), "events": (1, 0, 0, 10)}
+        self.version_reads = []
+
+    @contextmanager
+    def connection(self, statement_timeout_ms=None):
+        pool = self
+
+        class Cursor:
+            def execute(self, query, params):
+                pool.version_reads.append(params[1])
+                self.rows = [(table, *pool.counters[table]) for table in params[1] if table in pool.counters]
+
+            def fetchall(self):
+                return self.rows
+
+        class Connection:
+            def cursor(self):
+                return Cursor()
+
+        yield Connection()
+
+def make_cache(tmp_path):
+    pool = FakePool()
+    return pool, ResultCache(pool, FakeCatalog(), spill_dir=str(tmp_path / "spill"))
+
+def test_keyword_named_table_invalidates(tmp_path):
+    pool, cache = make_cache(tmp_path)
+    query = "SELECT count(*) FROM events"
+    _, token = cache.lookup(query)
+    assert token["tables"] == ["events"]
+    cache.store(token, pd.DataFrame({"count": [10]}))
+    assert cache.lookup(query)[0] is not None
+
+    pool.counters["events"] = (2, 0, 0, 11)
+    df, token = cache.lookup(query)
+    assert df is None and token is not None
+    assert cache.stats()["invalidations"] == 1
+
+def test_schema_qualifiers(tmp_path):
+    pool, cache = make_cache(tmp_path)
+    _, token = cache.lookup("SELECT * FROM public.orders")
+    assert token["tables"] == ["orders"]
+
+    df, token = cache.lookup("SELECT * FROM archive.orders")
+    assert df is None and token is None
+    assert cache.stats()["uncacheable"] == 1
+
+def test_another_process_keeps_spilled_entries(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # PATHS["temp_dir"] is relative
+    pool = FakePool()
+    cache = ResultCache(pool, FakeCatalog(), spill_bytes=1)
+    query = "SELECT * FROM orders"
+    _, token = cache.lookup(query)
+    cache.store(token, pd.DataFrame({"id": range(100)}))
+    assert cache.stats()["spills"] == 1
+
+    # A second process (API, batch run) starting a cache for the same database
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = (
+        "from test_result_cache import FakeCatalog, FakePool\n"
+        "from result_cache import ResultCache\n"
+        "ResultCache(FakePool(), FakeCatalog())\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root, os.path.join(root, "tests")]))
+    subprocess.run([sys.executable, "-c", script], cwd=tmp_path, env=env, check=True)
+
+    df, _ = cache.lookup(query)
+    assert df is not None and df["id"].tolist() == list(range(100))
@@ -0,0 +1,13 @@
+# tests/test_sampling.py
+
+from sampling import plan_sample
+
+def test_tablesample_reports_percent():
+    sample = plan_sample("SELECT * FROM events WHERE kind = 'click'", 1e8, row_budget=1_000_000)
+    assert sample["method"].startswith("TABLESAMPLE")
+    assert abs(sample["percent"] - 1.0) < 1e-9
+
+def test_limit_rewrite_has_no_percent():
+    sample = plan_sample("SELECT a, count(*) FROM t GROUP BY a", 1e8, row_budget=1_000_000)
+    assert sample["method"] == "LIMIT"
+    assert sample["percent"] is None and sample["rows"] == 1_000_000
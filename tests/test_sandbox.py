@@ -0,0 +1,88 @@
+# tests/test_sandbox.py
+
+import pickle
+import threading
+import time
+import pandas as pd
+import pytest
+from sandbox import SandboxError, SandboxPool, SharedFrame, _loads
+
+EVIL = """
+class Evil:
+    def __reduce__(self):
+        return (print, ("EXECUTED IN PARENT",))
+
+result = Evil()
+st.write(Evil(), {"nested": [Evil()]})
+"""
+
+class Evil:
+    def __reduce__(self):
+        return (print, ("EXECUTED IN PARENT",))
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = SandboxPool(workers=1, cpu_seconds=None, memory_mb=None, wall_timeout=20, checkout_timeout=60)
+    yield pool
+    pool.close()
+
+@pytest.fixture
+def frame():
+    with SharedFrame(pd.DataFrame({"x": [1, 2, 3]})) as frame:
+        yield frame
+
+def test_values_come_back(pool, frame):
+    code = "result = df.assign(y=df['x'] * 2)\nst.write('total', int(df['x'].sum()), {'n': (1, 2.5)})"
+    result = pool.run(code, frame)
+    assert result.value["y"].tolist() == [2, 4, 6]
+    assert result.outputs == [{"call": "write", "args": ("total", 6, {"n": (1, 2.5)}), "kwargs": {}}]
+
+def test_malicious_reduce_comes_back_as_text(pool, frame, capsys):
+    result = pool.run(EVIL, frame)
+    assert isinstance(result.value, str) and "Evil object" in result.value
+    args = result.outputs[0]["args"]
+    assert isinstance(args[0], str) and isinstance(args[1]["nested"][0], str)
+    assert "EXECUTED IN PARENT" not in capsys.readouterr().out
+
+def test_forged_reply_is_refused(capsys):
+    with pytest.raises(pickle.UnpicklingError):
+        _loads(pickle.dumps({"ok": True, "value": Evil()}))
+    with pytest.raises(pickle.UnpicklingError):
+        _loads(pickle.dumps(bytearray(10)))
+    assert "EXECUTED IN PARENT" not in capsys.readouterr().out
+
+def test_timeout_kills_and_replaces_the_worker(frame):
+    pool = SandboxPool(workers=1, cpu_seconds=None, memory_mb=None, wall_timeout=20, checkout_timeout=60)
+    try:
+        assert pool.run("result = 1", frame).value == 1
+        pool.wall_timeout = 1
+        with pytest.raises(SandboxError, match="time limit"):
+            pool.run("import time\ntime.sleep(30)", frame)
+        pool.wall_timeout = 20
+        assert pool.run("result = 2", frame).value == 2
+        assert pool.stats()["restarts"] == 1
+    finally:
+        pool.close()
+
+def test_transfer_error_recycles_the_worker(pool, frame):
+    restarts = pool.stats()["restarts"]
+    with pytest.raises(SandboxError, match="transfer failed"):
+        pool.run("result = f()", frame, variables={"f": lambda: 1})
+    assert pool.stats()["restarts"] == restarts + 1
+    assert pool.run("result = 3", frame).value == 3
+
+def test_checkout_times_out_when_all_workers_are_busy(frame):
+    pool = SandboxPool(workers=1, cpu_seconds=None, memory_mb=None, wall_timeout=20, checkout_timeout=0.5)
+    try:
+        pool.run("result = 0", frame)  # wait until the worker is up
+        busy = threading.Thread(target=pool.run, args=("import time\ntime.sleep(3)", frame))
+        busy.start()
+        while pool.stats()["idle_workers"]:
+            time.sleep(0.01)
+        try:
+            with pytest.raises(SandboxError, match="no sandbox worker"):
+                pool.run("result = 1", frame)
+        finally:
+            busy.join()
+    finally:
+        pool.close()
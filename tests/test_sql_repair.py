@@ -0,0 +1,50 @@
+# tests/test_sql_repair.py
+
+from sql_repair import SQLRepairer
+
+class FakeCatalog:
+    tables = {
+        "users": {"columns": [("id", "integer", None), ("name", "text", None)]},
+        "orders": {"columns": [("id", "integer", None), ("user_id", "integer", None)]},
+    }
+
+    def local_name(self, table_name):
+        return table_name.rpartition(".")[2]
+
+    def get_table(self, table_name):
+        return self.tables.get(table_name)
+
+    def list_tables(self):
+        return list(self.tables)
+
+def column_error(name, query, at):
+    return {
+        "sqlstate": "42703", "kind": "undefined_column", "message": f"column {name} does not exist",
+        "detail": None, "hint": None, "position": query.index(at) + 1,
+    }
+
+def test_column_fix_keeps_matching_label():
+    query = "SELECT nme AS nme FROM users ORDER BY nme"
+    fixed, description = SQLRepairer(FakeCatalog()).repair(query, column_error("nme", query, "nme"))
+    assert fixed == "SELECT name AS nme FROM users ORDER BY nme"
+    assert description == "column nme -> name"
+
+def test_column_fix_keeps_matching_alias():
+    query = "SELECT nme.id, u.nme FROM users u JOIN orders nme ON nme.user_id = u.id"
+    error = column_error("u.nme", query, "u.nme")
+    fixed, _ = SQLRepairer(FakeCatalog()).repair(query, error)
+    assert fixed == "SELECT nme.id, u.name FROM users u JOIN orders nme ON nme.user_id = u.id"
+
+def test_table_fix_renames_qualifiers():
+    query = "SELECT usrs.name FROM public.usrs"
+    error = {
+        "sqlstate": "42P01", "kind": "undefined_table", "message": 'relation "public.usrs" does not exist',
+        "detail": None, "hint": None, "position": query.index("public") + 1,
+    }
+    fixed, _ = SQLRepairer(FakeCatalog()).repair(query, error)
+    assert fixed == "SELECT users.name FROM public.users"
+
+def test_no_fix_without_position():
+    query = "SELECT nme FROM users"
+    error = dict(column_error("nme", query, "nme"), position=None)
+    assert SQLRepairer(FakeCatalog()).repair(query, error) is None
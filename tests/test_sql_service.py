@@ -0,0 +1,107 @@
+# tests/test_sql_service.py
+
+import pandas as pd
+from config import VALIDATION_CONFIG
+from sql_repair import SQLRepairer
+from sql_service import SQLService
+
+EXPENSIVE = "SELECT * FROM orders CROSS JOIN orders o2"
+CHEAP = "SELECT count(*) FROM orders"
+
+class FakeDatabase:
+    # No query_advisor: stand-ins such as the benchmark's FixtureDatabase do not have one
+    def __init__(self):
+        self.executed = []
+
+    def validate_query(self, query):
+        rejected = query == EXPENSIVE
+        return {
+            "ok": True, "error": None, "plan": None, "total_cost": 1e12 if rejected else 10.0,
+            "plan_rows": 1.0, "plan_width": 8,
+            "warnings": ["estimated cost is over the limit"] if rejected else [], "rejected": rejected,
+        }
+
+    def execute_query(self, query, **kwargs):
+        self.executed.append(query)
+        return pd.DataFrame({"count": [1]}), None
+
+class FakeModel:
+    def count_tokens(self, prompt):
+        return 1
+
+    def generate_streaming(self, prompt, on_text=None, stop_when=None):
+        return CHEAP, {"ttfb_seconds": 0.0, "total_seconds": 0.0}
+
+MISSPELLED = "SELECT nme FROM users"
+
+class MisspelledModel(FakeModel):
+    def generate_streaming(self, prompt, on_text=None, stop_when=None):
+        return MISSPELLED, {"ttfb_seconds": 0.0, "total_seconds": 0.0}
+
+class UsersCatalog:
+    def local_name(self, table_name):
+        return table_name
+
+    def get_table(self, table_name):
+        return {"columns": [("id", "integer", None), ("name", "text", None)]} if table_name == "users" else None
+
+    def list_tables(self):
+        return ["users"]
+
+class UsersDatabase(FakeDatabase):
+    def __init__(self):
+        super().__init__()
+        self.sql_repairer = SQLRepairer(UsersCatalog())
+
+    def validate_query(self, query):
+        if "nme" not in query:
+            return super().validate_query(query)
+        error = {
+            "sqlstate": "42703", "kind": "undefined_column", "message": "column nme does not exist",
+            "detail": None, "hint": None, "position": query.index("nme") + 1,
+        }
+        return {"ok": False, "error": error, "plan": None, "warnings": [], "rejected": False}
+
+    def execute_query(self, query, **kwargs):
+        self.executed.append(query)
+        if "nme" in query:
+            return None, 'Error executing query: column "nme" does not exist'
+        return pd.DataFrame({"name": ["ada"]}), None
+
+class FakeCache:
+    def __init__(self, sql):
+        self.sql = sql
+        self.invalidated = 0
+
+    def get(self, question, table_statement):
+        return self.sql
+
+    def put(self, question, table_statement, sql):
+        self.sql = sql
+
+    def invalidate(self, question, table_statement):
+        self.invalidated += 1
+        self.sql = None
+
+def test_cached_query_over_cost_gate_is_regenerated():
+    db = FakeDatabase()
+    service = SQLService(db, model=FakeModel())
+    service.cache = FakeCache(EXPENSIVE)
+
+    df, sql_query, error = service.generate_sql_query("how many orders", "CREATE TABLE orders (id int);")
+    assert error is None and sql_query == CHEAP
+    assert not df.attrs.get("sql_cache_hit")
+    assert db.executed == [CHEAP]
+    assert service.cache.invalidated == 1 and service.cache.sql == CHEAP
+
+def test_execution_error_is_repaired_without_plan_validation(monkeypatch):
+    monkeypatch.setitem(VALIDATION_CONFIG, "enabled", False)
+    db = UsersDatabase()
+    service = SQLService(db, model=MisspelledModel())
+    service.cache = None
+
+    df, sql_query, error = service.generate_sql_query("user names", "CREATE TABLE users (id int, name text);")
+    assert error is None and sql_query == "SELECT name FROM users"
+    assert db.executed == [MISSPELLED, "SELECT name FROM users"]
+    assert df.attrs["local_repairs"] == ["column nme -> name"]
+    assert db.sql_repairer.stats()["local_fixes"] == 1
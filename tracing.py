@@ -0,0 +1,244 @@
+# src/core/tracing.py
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+from config import PATHS, TRACING_CONFIG
+
+# Span attributes aggregated into Prometheus counters: attribute -> metric name
+COUNTED_ATTRIBUTES = {
+    "prompt_tokens": "copilot_prompt_tokens_total",
+    "response_tokens": "copilot_response_tokens_total",
+    "rows": "copilot_rows_fetched_total",
+    "bytes_fetched": "copilot_bytes_fetched_total",
+    "retries": "copilot_retries_total",
+    "local_repairs": "copilot_local_repairs_total",
+}
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, parent: Optional["Span"], attributes: dict):
+        """One timed stage of a request; nested spans share the trace id of their root"""
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes)
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.duration_seconds: Optional[float] = None
+
+    def set(self, **attributes):
+        """Attach attributes (token counts, rows, ...); None values are ignored"""
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+    def fail(self, error: str):
+        """Mark the span as failed without raising"""
+        self.status = "error"
+        self.error = str(error)[:500]
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": datetime.fromtimestamp(self.start_time, timezone.utc).isoformat(),
+            "duration_ms": round(self.duration_seconds * 1000, 3) if self.duration_seconds is not None else None,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class Tracer:
+    def __init__(
+        self,
+        logs_dir: str = PATHS["logs_dir"],
+        enabled: bool = TRACING_CONFIG["enabled"],
+        buckets: tuple = TRACING_CONFIG["latency_buckets"],
+    ):
+        """
+        Records finished spans as JSON lines (one file per UTC day under
+        `logs_dir`) and aggregates them into Prometheus metrics
+
+        Args:
+            logs_dir (str): Directory of the span files
+            enabled (bool): Whether spans are recorded at all
+            buckets (tuple): Upper bounds (seconds) of the latency histogram buckets
+        """
+        self.logs_dir = logs_dir
+        self.enabled = enabled
+        self.buckets = tuple(sorted(buckets))
+
+        self._lock = threading.Lock()
+        self._histograms: Dict[tuple, dict] = {}
+        self._counters: Dict[tuple, float] = {}
+
+    def _write(self, span: Span):
+        """Append a span to today's file. Caller holds the lock."""
+        path = os.path.join(self.logs_dir, f"spans-{datetime.now(timezone.utc):%Y%m%d}.jsonl")
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+        except OSError as e:
+            print(f"Error writing span: {e}")
+
+    def _aggregate(self, span: Span):
+        """Update metrics with a finished span. Caller holds the lock."""
+        key = (span.name, span.status)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+        for index, bound in enumerate(self.buckets):
+            if span.duration_seconds <= bound:
+                histogram["buckets"][index] += 1
+        histogram["count"] += 1
+        histogram["sum"] += span.duration_seconds
+
+        for attribute, metric in COUNTED_ATTRIBUTES.items():
+            value = span.attributes.get(attribute)
+            if isinstance(value, list):
+                value = len(value)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                counter_key = (metric, span.name)
+                self._counters[counter_key] = self._counters.get(counter_key, 0) + value
+
+    def finish(self, span: Span):
+        """Record a finished span"""
+        span.duration_seconds = time.perf_counter() - span._started
+        if not self.enabled:
+            return
+        with self._lock:
+            self._aggregate(span)
+            self._write(span)
+
+    def render_prometheus(self) -> str:
+        """
+        Metrics in the Prometheus text exposition format
+
+        Returns:
+            str: `copilot_span_duration_seconds` histograms by span and status,
+                and counters of the attributes in COUNTED_ATTRIBUTES by span
+        """
+        lines = [
+            "# HELP copilot_span_duration_seconds Duration of traced stages",
+            "# TYPE copilot_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            for (name, status), histogram in sorted(self._histograms.items()):
+                labels = f'span="{name}",status="{status}"'
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    lines.append(f'copilot_span_duration_seconds_bucket{{{labels},le="{bound:g}"}} {count}')
+                lines.append(f'copilot_span_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+                lines.append(f"copilot_span_duration_seconds_sum{{{labels}}} {histogram['sum']:.6f}")
+                lines.append(f"copilot_span_duration_seconds_count{{{labels}}} {histogram['count']}")
+            counters = sorted(self._counters.items())
+        declared = set()
+        for (metric, name), value in counters:
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            lines.append(f'{metric}{{span="{name}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+
+_tracer = Tracer()
+
+def get_tracer() -> Tracer:
+    """Return the process-wide tracer"""
+    return _tracer
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """
+    Time a stage as a child of the current span (or as a new trace)
+
+    Exceptions are recorded on the span and re-raised.
+
+    Args:
+        name (str): Stage name, e.g. "llm.generate"
+        **attributes: Initial attributes
+
+    Yields:
+        Span: The span, to attach attributes found along the way
+    """
+    current = Span(name, _current_span.get(), attributes)
+    reset_token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(reset_token)
+        _tracer.finish(current)
+
+def current_span() -> Optional[Span]:
+    """The innermost active span of this context, if any"""
+    return _current_span.get()
+
+def recent_spans(limit: int = 200) -> List[dict]:
+    """Read the most recent spans back from today's file, newest last"""
+    path = os.path.join(_tracer.logs_dir, f"spans-{datetime.now(timezone.utc):%Y%m%d}.jsonl")
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()[-limit:]
+    except OSError:
+        return []
+    return [json.loads(line) for line in lines if line.strip()]
+
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+def start_metrics_server(
+    host: str = TRACING_CONFIG["metrics_host"],
+    port: int = TRACING_CONFIG["metrics_port"],
+):
+    """
+    Serve /metrics in a background thread. Idempotent; port 0 disables it.
+
+    Returns:
+        Optional[ThreadingHTTPServer]: The server, None if disabled or the port is taken
+    """
+    global _metrics_server
+    with _metrics_server_lock:
+        if _metrics_server is not None or not port:
+            return _metrics_server
+        # http.server is imported here so `import app` does not pay for it
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = _tracer.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # scrapes are not worth a line on stderr each
+
+        try:
+            _metrics_server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            print(f"Metrics endpoint not started on {host}:{port}: {e}")
+            return None
+        threading.Thread(target=_metrics_server.serve_forever, name="metrics", daemon=True).start()
+        print(f"Metrics endpoint serving on http://{host}:{port}/metrics")
+        return _metrics_server